@@ -0,0 +1,102 @@
+"""
+Runtime context handed to agent nodes: built once per compiled graph instead of inside every node call.
+An agent written as def agent_xxx(state, context) gets its AgentContext from the graph (graph_compiler.build_graph):
+  context.tools        - tool name -> callable (tools.get_tools_for_agent; follows edits to the design file)
+  context.async_tools  - same names, awaitable; each call runs on a worker thread (tools.get_async_tools_for_agent)
+  context.config       - the agent's entry in system_design.json (read-only; follows edits too)
+  context.thread_id    - LangGraph thread_id of the run calling the agent (pass to tools that report back later)
+  context.session(url) - shared keep-alive HTTP session for a vendor host (tools.http_pool)
+  context.call_concurrently([(tool, kwargs), ...]) - run several tool calls in parallel
+Agents written as def agent_xxx(state) keep working; they just get no context.
+"""
+import inspect
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Tuple
+
+logger = logging.getLogger(__name__)
+
+_EMPTY: Mapping[str, Any] = MappingProxyType({})
+# Set by the graph's node wrapper for the duration of one agent call; contexts are shared across threads
+_THREAD_ID: ContextVar[str | None] = ContextVar("agent_thread_id", default=None)
+
+
+def current_thread_id() -> str | None:
+    """thread_id of the LangGraph run whose agent node is executing (None outside a node or without one)."""
+    return _THREAD_ID.get()
+
+
+@contextmanager
+def running_thread(thread_id: str | None) -> Iterator[None]:
+    """Make thread_id the current_thread_id() for the enclosed agent call."""
+    token = _THREAD_ID.set(thread_id)
+    try:
+        yield
+    finally:
+        _THREAD_ID.reset(token)
+
+
+class AgentContext:
+    """Per-agent tools, config and clients; build with AgentContext(agent_id) or build_contexts()."""
+
+    __slots__ = ("agent_id", "_config", "_design_path")
+
+    def __init__(self, agent_id: str, config: Mapping[str, Any] | None = None, design_path: Path | None = None) -> None:
+        self.agent_id = agent_id
+        # An explicit config is fixed; otherwise it follows the design file like the tools do
+        self._config = MappingProxyType(dict(config)) if config is not None else None
+        self._design_path = design_path
+
+    @property
+    def tools(self) -> Mapping[str, Callable[..., Any]]:
+        try:
+            from tools import get_tools_for_agent
+            return get_tools_for_agent(self.agent_id, self._design_path)
+        except Exception:
+            logger.exception("Could not resolve tools for %s", self.agent_id)
+            return _EMPTY
+
+    @property
+    def async_tools(self) -> Mapping[str, Any]:
+        from tools import get_async_tools_for_agent
+        return get_async_tools_for_agent(self.agent_id, self._design_path)
+
+    @property
+    def thread_id(self) -> str | None:
+        return current_thread_id()
+
+    @property
+    def config(self) -> Mapping[str, Any]:
+        if self._config is not None:
+            return self._config
+        from tools import get_agent_config
+        return get_agent_config(self.agent_id, self._design_path)
+
+    def session(self, url: str):
+        from tools.http_pool import session_for
+        return session_for(url)
+
+    def call_concurrently(self, calls: List[Tuple[Callable[..., Any], Dict[str, Any]]]) -> List[Any]:
+        from tools import call_concurrently
+        return call_concurrently(calls)
+
+    def __repr__(self) -> str:
+        return f"AgentContext({self.agent_id!r}, tools={sorted(self.tools)})"
+
+
+def build_contexts(agent_ids: List[str], design_path: Path | None = None) -> Dict[str, AgentContext]:
+    """One context per agent id; tools and config are read from the design at path when accessed."""
+    return {aid: AgentContext(aid, design_path=design_path) for aid in agent_ids}
+
+
+def accepts_context(fn: Callable[..., Any]) -> bool:
+    """True if fn takes a second positional argument (the AgentContext): def agent_xxx(state, context)."""
+    try:
+        params = list(inspect.signature(fn).parameters.values())
+    except (TypeError, ValueError):
+        return False
+    positional = [p for p in params if p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD)]
+    return len(positional) >= 2
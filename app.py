@@ -4,10 +4,13 @@ Run: chainlit run app.py -w
 Use side-by-side: Cursor (code) + browser (steps). Reloads keep state via SQLite checkpointer.
 """
 import asyncio
+import logging
 import sys
 import uuid
 from pathlib import Path
 
+logger = logging.getLogger(__name__)
+
 # Ensure master_graph (in output/) is importable — local and Railway/Docker
 ROOT = Path(__file__).resolve().parent
 OUTPUT_DIR = ROOT / "output"
@@ -34,7 +37,20 @@ sys.path.insert(0, str(ROOT))
 import chainlit as cl
 
 
-def _initial_state(user_input: str = "Starting recruitment process"):
+def _warm_up_graph():
+    """AGENT_WARMUP=1: import the agents in the background once the Chainlit app is up."""
+    from graph_compiler import start_background_warm_up
+    start_background_warm_up()
+
+
+# on_app_startup exists in newer Chainlit releases; older ones just warm up when app.py is loaded
+if hasattr(cl, "on_app_startup"):
+    cl.on_app_startup(_warm_up_graph)
+else:
+    _warm_up_graph()
+
+
+def _initial_state(user_input: str = "Starting recruitment process", thread_id: str = ""):
     from master_graph import RecruitmentState
     return RecruitmentState(
         candidate_profile={},
@@ -52,7 +68,8 @@ def _initial_state(user_input: str = "Starting recruitment process"):
         documents=[],
         communications=[],
         financial_data={},
-        data={"initial_input": user_input},
+        # thread_id lets tools that finish later (e.g. HeyGen renders) write back into this thread
+        data={"initial_input": user_input, "thread_id": thread_id},
     )
 
 
@@ -77,6 +94,37 @@ def _get_human_prompt(state: dict) -> str:
     return HUMAN_PROMPTS.get(step, f"Handle human step: {step}. Enter your input:")
 
 
+_CHECKPOINTER = None
+
+
+def _get_checkpointer():
+    """Process-wide checkpointer (sessions are kept apart by thread_id)."""
+    global _CHECKPOINTER
+    if _CHECKPOINTER is None:
+        from persistent_state import checkpoint_serde
+        try:
+            import sqlite3
+            from langgraph.checkpoint.sqlite import SqliteSaver
+            db_path = ROOT / "data" / "recruitment_checkpoints.sqlite"
+            db_path.parent.mkdir(parents=True, exist_ok=True)
+            # SqliteSaver.from_conn_string returns a context manager; use direct conn + SqliteSaver(conn) so we pass a real saver
+            conn = sqlite3.connect(str(db_path), check_same_thread=False)
+            _CHECKPOINTER = SqliteSaver(conn, serde=checkpoint_serde())
+        except Exception:
+            from langgraph.checkpoint.memory import MemorySaver
+            _CHECKPOINTER = MemorySaver(serde=checkpoint_serde())
+    return _CHECKPOINTER
+
+
+def _log_render_done(job):
+    """Render tracker callback: the result is queued for the thread's next run (see tools.heygen_jobs)."""
+    logger.info(
+        "HeyGen render %s %s for thread %s%s",
+        job.get("video_id"), job.get("status"), job.get("thread_id") or "-",
+        "; applied on the thread's next message" if job.get("thread_id") else "",
+    )
+
+
 @cl.on_chat_start
 async def start():
     _add_output_to_path()  # ensure path is set in case Chainlit worker has different cwd
@@ -87,22 +135,17 @@ async def start():
         return
     
     try:
-        import sqlite3
-        from langgraph.checkpoint.sqlite import SqliteSaver
-        db_path = ROOT / "data" / "recruitment_checkpoints.sqlite"
-        db_path.parent.mkdir(parents=True, exist_ok=True)
-        # SqliteSaver.from_conn_string returns a context manager; use direct conn + SqliteSaver(conn) so we pass a real saver
-        conn = sqlite3.connect(str(db_path), check_same_thread=False)
-        checkpointer = SqliteSaver(conn)
-    except Exception:
-        from langgraph.checkpoint.memory import MemorySaver
-        checkpointer = MemorySaver()
-    
-    try:
-        graph = get_graph_for_chainlit(checkpointer)
+        # One checkpointer for all sessions, so every session reuses the same cached compiled graph
+        graph = get_graph_for_chainlit(_get_checkpointer())
     except Exception as e:
         await cl.Message(content=f"⚠️ Error creating graph: {e}. Check Railway logs.").send()
         return
+    try:
+        from tools.heygen_jobs import on_render_done, start_render_tracker
+        on_render_done(_log_render_done)
+        start_render_tracker()
+    except Exception:
+        logger.exception("Could not start the HeyGen render tracker")
     thread_id = str(uuid.uuid4())
     cl.user_session.set("graph", graph)
     cl.user_session.set("thread_id", thread_id)
@@ -155,7 +198,14 @@ async def main(message: cl.Message):
         update = {"data": {"pending_human_input": message.content.strip()}}
         initial_input = update
     else:
-        initial_input = _initial_state(message.content.strip() or "Start")
+        initial_input = _initial_state(message.content.strip() or "Start", thread_id)
+    applied_renders = []
+    try:
+        # HeyGen renders that finished since this thread last ran
+        from tools.heygen_jobs import apply_render_updates
+        initial_input, applied_renders = apply_render_updates(graph, config, initial_input)
+    except Exception:
+        logger.exception("Could not apply finished HeyGen renders to thread %s", thread_id)
 
     # Stream steps to the UI (Lovable-style collapsible steps)
     steps_done = []
@@ -165,6 +215,12 @@ async def main(message: cl.Message):
     except Exception as e:
         await cl.Message(content=f"Workflow error: {e}").send()
         return
+    try:
+        # Only now: if the run failed, the same renders are offered again on the next message
+        from tools.heygen_jobs import mark_applied
+        mark_applied(applied_renders)
+    except Exception:
+        logger.exception("Could not mark HeyGen renders applied for thread %s", thread_id)
 
     # Show each node as a step (agentic debugging: click into step to see output)
     for node_name, output in steps_done:
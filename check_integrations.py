@@ -2,6 +2,8 @@
 Ask the user to add real integrations for each AI agent to do its job properly.
 Run: python check_integrations.py
 Shows which agents need which API keys or custom integrations (stubs).
+Run: python check_integrations.py --check-mapping
+Resolves every tool string in tools/design_tool_corpus.json and fails if any maps to the wrong registry key.
 """
 import sys
 from pathlib import Path
@@ -10,6 +12,15 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).resolve().parent))
 
 from tools import agents_needing_integration, required_integrations_all
+from tools.registry import TOOL_CORPUS_PATH, check_tool_corpus
+
+
+def check_mapping() -> int:
+    mismatches = check_tool_corpus()
+    for raw, expected, actual in mismatches:
+        print(f"  {raw!r}: expected {expected}, got {actual}")
+    print(f"{len(mismatches)} mismatch(es) in {TOOL_CORPUS_PATH.name}")
+    return 1 if mismatches else 0
 
 
 def main() -> None:
@@ -48,4 +59,6 @@ def main() -> None:
 
 
 if __name__ == "__main__":
+    if "--check-mapping" in sys.argv[1:]:
+        sys.exit(check_mapping())
     main()
@@ -12,4 +12,9 @@ _DEFAULT_VIDEOS_PATH = r"C:\Users\Hafid\Downloads\rest abu musa pt 2"
 COURSE_VIDEOS_PATH = os.getenv("COURSE_VIDEOS_PATH", "").strip() or _DEFAULT_VIDEOS_PATH
 OUTPUT_DIR = Path(__file__).resolve().parent / "output"
 SYSTEM_DESIGN_JSON = OUTPUT_DIR / "system_design.json"
+SYSTEM_DESIGN_SCHEMA_JSON = Path(__file__).resolve().parent / "system_design_schema.json"
 AGENTS_DIR = OUTPUT_DIR / "agents"
+# Reviewed batch-merge decisions: {"approved": [[alias, canonical], ...], "keep_separate": [[id, id], ...]}
+DESIGN_MERGE_REVIEW_JSON = OUTPUT_DIR / "design_merge_review.json"
+# Local caches (upload manifest, per-batch designs); safe to delete to force a full re-run
+CACHE_DIR = OUTPUT_DIR / ".cache"
@@ -0,0 +1,221 @@
+"""
+Merge system designs from several video batches into one.
+Agents and human nodes are indexed by normalized id, name and role tokens; near-duplicates
+(e.g. agent_interview_scheduler / agent_interview_scheduling) are clustered above a similarity
+threshold and folded into one canonical node. Edges and depends_on are rewritten to the canonical
+ids and de-duplicated with a hash set. A single design passes through unchanged.
+Folding changes agent ids, so merges are checked against a review file (see load_merge_review):
+pairs listed under "keep_separate" are never folded, and folds not listed under "approved" are reported.
+"""
+import json
+import re
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Set, Tuple
+
+# Similarity at or above which two nodes are treated as the same (0..1)
+DEFAULT_SIMILARITY_THRESHOLD = 0.6
+
+# Weights of the similarity components (identity = id + name tokens, role = role/description tokens)
+IDENTITY_WEIGHT = 0.65
+ROLE_WEIGHT = 0.35
+
+_STOPWORDS = {
+    "a", "an", "and", "agent", "human", "the", "of", "for", "to", "in", "on", "with", "by", "from", "or",
+    "e", "g", "eg", "etc", "all", "any", "their", "its", "as", "at", "is", "are", "be", "this", "that",
+}
+# Crude suffix stripping so scheduler/scheduling/schedules share a token
+_SUFFIXES = ("ations", "ation", "ings", "ing", "ers", "er", "ors", "or", "ies", "es", "s", "ment")
+
+# Fields unioned when folding a duplicate into its canonical node
+_LIST_FIELDS = {
+    "agents": ("tools", "inputs", "outputs", "depends_on"),
+    "human_nodes": ("inputs_from_agents", "outputs_for_agents"),
+}
+
+
+def _stem(token: str) -> str:
+    for suffix in _SUFFIXES:
+        if len(token) > len(suffix) + 3 and token.endswith(suffix):
+            return token[: -len(suffix)]
+    return token
+
+
+def tokens(text: str) -> frozenset[str]:
+    """Normalized, stemmed word tokens of an id, name or description."""
+    words = re.split(r"[^a-z0-9]+", (text or "").lower())
+    return frozenset(_stem(w) for w in words if w and w not in _STOPWORDS)
+
+
+def normalize_id(node_id: str) -> str:
+    """Id key for exact matching: lowercase, stemmed tokens in order, without agent_/human_ prefix."""
+    words = re.split(r"[^a-z0-9]+", (node_id or "").lower())
+    return "_".join(_stem(w) for w in words if w and w not in _STOPWORDS)
+
+
+def _jaccard(a: frozenset, b: frozenset) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class _NodeIndex:
+    """Inverted index of node tokens so candidate pairs are found without comparing every pair."""
+
+    def __init__(self, text_field: str, keep_separate: Set[frozenset] = frozenset()) -> None:
+        self.text_field = text_field
+        self.keep_separate = keep_separate
+        self.nodes: List[Dict[str, Any]] = []
+        self.identity: List[frozenset] = []
+        self.role: List[frozenset] = []
+        self.by_norm_id: Dict[str, int] = {}
+        self.postings: Dict[str, List[int]] = defaultdict(list)
+
+    def add(self, node: Dict[str, Any]) -> int:
+        idx = len(self.nodes)
+        self.nodes.append(node)
+        ident = tokens(node.get("id", "")) | tokens(node.get("name", ""))
+        self.identity.append(ident)
+        self.role.append(tokens(node.get(self.text_field, "")))
+        for t in ident:
+            self.postings[t].append(idx)
+        return idx
+
+    def similarity(self, i: int, j: int) -> float:
+        return IDENTITY_WEIGHT * _jaccard(self.identity[i], self.identity[j]) + ROLE_WEIGHT * _jaccard(self.role[i], self.role[j])
+
+    def _separate(self, i: int, j: int) -> bool:
+        return frozenset((self.nodes[i].get("id"), self.nodes[j].get("id"))) in self.keep_separate
+
+    def best_match(self, idx: int, threshold: float) -> int | None:
+        """Earlier node most similar to idx at or above threshold (exact normalized-id matches win)."""
+        norm = normalize_id(self.nodes[idx].get("id", ""))
+        if norm in self.by_norm_id and not self._separate(idx, self.by_norm_id[norm]):
+            return self.by_norm_id[norm]
+        candidates = {j for t in self.identity[idx] for j in self.postings[t] if j < idx}
+        best, best_score = None, 0.0
+        for j in sorted(candidates):
+            if self._separate(idx, j):
+                continue
+            score = self.similarity(idx, j)
+            if score >= threshold and score > best_score:
+                best, best_score = j, score
+        self.by_norm_id.setdefault(norm, idx if best is None else best)
+        return best
+
+
+def _fold(canonical: Dict[str, Any], dup: Dict[str, Any], fields: Iterable[str]) -> None:
+    for field in fields:
+        merged = list(canonical.get(field) or [])
+        for v in dup.get(field) or []:
+            if v not in merged:
+                merged.append(v)
+        canonical[field] = merged
+    for key, value in dup.items():
+        if not canonical.get(key) and value:
+            canonical[key] = value
+
+
+def _dedupe_nodes(
+    section: str,
+    nodes: Iterable[Dict[str, Any]],
+    threshold: float,
+    text_field: str,
+    keep_separate: Set[frozenset] = frozenset(),
+) -> tuple[List[Dict[str, Any]], Dict[str, str]]:
+    """Cluster nodes; return (canonical nodes in first-seen order, alias id -> canonical id)."""
+    index = _NodeIndex(text_field, keep_separate)
+    canonical_of: List[int] = []
+    aliases: Dict[str, str] = {}
+    out: List[Dict[str, Any]] = []
+    slot: Dict[int, int] = {}  # index position -> position in out
+    for node in nodes:
+        if not isinstance(node, dict) or not node.get("id"):
+            continue
+        node = dict(node)
+        idx = index.add(node)
+        match = index.best_match(idx, threshold)
+        root = idx if match is None else canonical_of[match]
+        canonical_of.append(root)
+        if root == idx:
+            slot[idx] = len(out)
+            out.append(node)
+            continue
+        canonical = out[slot[root]]
+        if node["id"] != canonical["id"]:
+            aliases[node["id"]] = canonical["id"]
+        _fold(canonical, node, _LIST_FIELDS.get(section, ()))
+    return out, aliases
+
+
+def load_merge_review(path: Path) -> Dict[str, Set]:
+    """
+    Reviewed merge decisions from JSON {"approved": [[alias, canonical], ...], "keep_separate": [[id, id], ...]}.
+    Returns {"approved": {(alias, canonical)}, "keep_separate": {frozenset({id, id})}}; empty sets if the file is missing.
+    """
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        data = {}
+    return {
+        "approved": {tuple(p) for p in data.get("approved", []) if len(p) == 2},
+        "keep_separate": {frozenset(p) for p in data.get("keep_separate", []) if len(p) == 2},
+    }
+
+
+def unreviewed_merges(aliases: Dict[str, str], approved: Set[Tuple[str, str]]) -> Dict[str, str]:
+    """Folds (alias -> canonical) that are not in the approved list."""
+    return {a: c for a, c in aliases.items() if (a, c) not in approved}
+
+
+def merge_designs(
+    designs: List[Dict[str, Any]],
+    threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+    keep_separate: Set[frozenset] = frozenset(),
+) -> tuple[Dict[str, Any], Dict[str, str]]:
+    """
+    Merge batch designs into one; returns (design, alias id -> canonical id).
+    Near-duplicate agents/human nodes are folded into the first one seen (unless the pair is in
+    keep_separate); edges and depends_on are rewritten to canonical ids, self-loops introduced by
+    merging are dropped, and duplicate edges (same from, to, condition) are removed.
+    A single design is returned as-is: there is nothing from another batch to fold into it.
+    """
+    if not designs:
+        return {"course_summary": "", "agents": [], "human_nodes": [], "edges": []}, {}
+    if len(designs) == 1:
+        return designs[0], {}
+    summary = designs[0].get("course_summary", "") + " [Merged from multiple video batches.]"
+
+    agents, agent_aliases = _dedupe_nodes(
+        "agents", (a for d in designs for a in d.get("agents", [])), threshold, "role", keep_separate,
+    )
+    humans, human_aliases = _dedupe_nodes(
+        "human_nodes", (h for d in designs for h in d.get("human_nodes", [])), threshold, "description", keep_separate,
+    )
+    aliases = {**agent_aliases, **human_aliases}
+
+    for a in agents:
+        deps = []
+        for dep in a.get("depends_on") or []:
+            dep = aliases.get(dep, dep)
+            if dep and dep != a["id"] and dep not in deps:
+                deps.append(dep)
+        a["depends_on"] = deps
+
+    edges: List[Dict[str, Any]] = []
+    seen: set = set()
+    for d in designs:
+        for e in d.get("edges", []):
+            if not isinstance(e, dict):
+                continue
+            src = aliases.get(e.get("from"), e.get("from"))
+            dst = aliases.get(e.get("to"), e.get("to"))
+            if not src or not dst or (src == dst and (e.get("from") != e.get("to"))):
+                continue
+            key = (src, dst, e.get("condition") or "")
+            if key in seen:
+                continue
+            seen.add(key)
+            edges.append({**e, "from": src, "to": dst})
+
+    return {"course_summary": summary, "agents": agents, "human_nodes": humans, "edges": edges}, aliases
@@ -1,11 +1,22 @@
 """
 Step 2: Read output/system_design.json, call Claude to generate:
   - output/agents/<agent_id>.py for each agent
-  - output/master_graph.py (LangGraph graph + human-in-the-loop)
+The master graph is not generated: output/master_graph.py compiles it from the JSON (graph_compiler.py).
+
+Default: one request for the agents that need (re)generating. --per-agent: one request per agent on a bounded
+worker pool (rate-limit-aware retries); --agent <id> regenerates only the given agent(s).
+Both modes are incremental: output/agents/codegen_manifest.json records each agent's design-entry hash and
+prompt version, so only changed/new agents are regenerated and removed agents' files are deleted (--force: all).
 """
+import argparse
+import hashlib
 import json
+import os
+import random
 import re
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
 import anthropic
@@ -15,36 +26,67 @@ from config import AGENTS_DIR, ANTHROPIC_API_KEY, OUTPUT_DIR, SYSTEM_DESIGN_JSON
 # Use a capable model for code generation (Claude 4 / Sonnet 4 or latest)
 MODEL = "claude-sonnet-4-20250514"
 
+# --per-agent: concurrent requests and retry policy (429 / 5xx / overloaded / connection errors)
+CODEGEN_WORKERS = int(os.getenv("CODEGEN_WORKERS", "8"))
+CODEGEN_MAX_RETRIES = int(os.getenv("CODEGEN_MAX_RETRIES", "5"))
+CODEGEN_BACKOFF_SECONDS = 2.0
+CODEGEN_BACKOFF_MAX_SECONDS = 60.0
+AGENT_MAX_TOKENS = 4000
+
+# Incremental codegen: per-agent design-entry hash + prompt version of each generated file
+CODEGEN_MANIFEST_JSON = AGENTS_DIR / "codegen_manifest.json"
+
 PROMPT = """You are a code generator. You will receive a System Design JSON that describes agents, human nodes, and edges for automating a business course.
 
 Generate the following as separate Python code blocks. Output ONLY the requested code blocks, each wrapped in a fenced block with the exact filename as the label.
 
-1) For EACH agent in the "agents" array, output one code block with label: `output/agents/<agent_id>.py`
+For EACH agent in the "agents" array, output one code block with label: `output/agents/<agent_id>.py`
    - Each file must define a runnable agent that:
      - Accepts inputs (dict or typed state) and returns outputs (dict or state updates).
      - Uses LangChain/LangGraph-friendly tools where listed (you can stub tools with placeholder implementations).
-     - Is a function or callable that can be used as a node in a LangGraph graph (e.g. def agent_xxx(state: dict) -> dict).
+     - Is a function that can be used as a node in a LangGraph graph: def agent_xxx(state: dict, context) -> dict.
    - File name must be exactly the agent "id" + ".py" (e.g. agent_outreach.py).
 
-2) One code block with label: `output/master_graph.py`
-   - Build a LangGraph StateGraph that:
-     - Has a shared state type (e.g. TypedDict) with fields for all agent inputs/outputs and human_node inputs/outputs.
-     - Adds a node for each agent (import from agents/<agent_id>.py and add as node).
-     - Adds a node for "human_in_the_loop" that:
-       - Receives state when the graph needs human action (e.g. for any human_node in the design).
-       - Returns updated state after human provides input (e.g. meeting_notes, next_steps).
-       - Can be implemented as a function that prompts for input (input() or a callback) and returns state updates.
-     - Adds edges according to "edges" in the JSON (from/to node names: use agent id for agents, "human_in_the_loop" for human nodes, "start" -> first agent).
-     - Conditional edges: implement where "condition" is present (e.g. route to human when meeting_requested).
-   - Compile the graph and expose a runnable (e.g. graph.compile() and a main that invokes it).
-   - Use LangGraph: from langgraph.graph import StateGraph, END; state type as a TypedDict or dict.
+Do NOT generate output/master_graph.py: the graph (nodes, edges, human_in_the_loop) is compiled locally from the JSON.
+
+Rules:
+- Code must be runnable Python 3.10+.
+- Use only standard library + langgraph, langchain_core (and langchain_anthropic if you need an LLM in an agent). No other packages unless necessary.
+- The function name must match the agent id from JSON (e.g. agent_outreach).
+- Return ONLY the state keys the agent changed (a partial update dict). Never return {**state, ...} or the input state:
+  list keys (documents, communications, job_matches) are appended by the graph, so return only the new items;
+  dict keys (data, candidate_profile, ...) are merged, so return only the entries you set.
+- State values are read-only: never mutate them in place (no .append/.update/item assignment on state["..."]);
+  build new lists/dicts (e.g. dict(state.get("data") or {}) or list(...)) for the values you return.
+- `context` is an AgentContext built once per graph and passed in by it: call tools via context.tools.get("<tool name>")
+  (an empty mapping when no tools resolve), read the agent's design entry from context.config, and use
+  context.session(url) for HTTP clients. Never modify sys.path, and never import tools or build clients inside the function.
+- Tools that finish later (heygen_create_video) take thread_id: pass thread_id=context.thread_id so the result is added
+  to this workflow's state (data["heygen_videos"][video_id]) on its next run; read it from there, never wait for it."""
+
+
+AGENT_PROMPT = """You are a code generator. You will receive ONE agent from a System Design JSON (agents, human nodes, edges for automating a business course), plus the ids of the nodes it connects to.
+
+Generate exactly ONE Python file for this agent. Output a single fenced code block whose label is the exact file path: `output/agents/<agent_id>.py`
+
+The file must define a runnable agent that:
+- Accepts inputs (dict or typed state) and returns outputs (dict or state updates).
+- Uses LangChain/LangGraph-friendly tools where listed (you can stub tools with placeholder implementations).
+- Is a function that can be used as a node in a LangGraph graph, named exactly after the agent id: def agent_xxx(state: dict, context) -> dict.
 
 Rules:
 - Code must be runnable Python 3.10+.
 - Use only standard library + langgraph, langchain_core (and langchain_anthropic if you need an LLM in an agent). No other packages unless necessary.
-- In master_graph.py, node names must match: agent ids from JSON (e.g. agent_outreach), and "human_in_the_loop" for human steps.
-- If the design has no human_nodes, still add a human_in_the_loop node that can be used for oversight (e.g. optional review step).
-- Output each file in order: all output/agents/<agent_id>.py blocks first, then output/master_graph.py."""
+- Return ONLY the state keys the agent changed (a partial update dict). Never return {**state, ...} or the input state:
+  list keys (documents, communications, job_matches) are appended by the graph, so return only the new items;
+  dict keys (data, candidate_profile, ...) are merged, so return only the entries you set.
+- State values are read-only: never mutate them in place (no .append/.update/item assignment on state["..."]);
+  build new lists/dicts (e.g. dict(state.get("data") or {}) or list(...)) for the values you return.
+- `context` is an AgentContext built once per graph and passed in by it: call tools via context.tools.get("<tool name>")
+  (an empty mapping when no tools resolve), read the agent's design entry from context.config, and use
+  context.session(url) for HTTP clients. Never modify sys.path, and never import tools or build clients inside the function.
+- Tools that finish later (heygen_create_video) take thread_id: pass thread_id=context.thread_id so the result is added
+  to this workflow's state (data["heygen_videos"][video_id]) on its next run; read it from there, never wait for it."""
 
 
 def extract_code_blocks(text: str) -> dict[str, str]:
@@ -72,18 +114,207 @@ def extract_code_blocks(text: str) -> dict[str, str]:
     return out
 
 
-def main() -> None:
-    if not SYSTEM_DESIGN_JSON.exists():
-        print(f"Missing {SYSTEM_DESIGN_JSON}. Run video_to_system_design.py first.", file=sys.stderr)
-        sys.exit(1)
-    if not ANTHROPIC_API_KEY:
-        print("Set ANTHROPIC_API_KEY in .env", file=sys.stderr)
-        sys.exit(2)
+def write_generated_file(path_key: str, code: str) -> Path:
+    """Write a generated block to its path under output/ (paths escaping output/ are flattened into it)."""
+    # path_key e.g. "output/agents/agent_outreach.py" or "output/master_graph.py"
+    if path_key.startswith("output/"):
+        rel = path_key[7:]  # strip "output/"
+    else:
+        rel = path_key
+    p = OUTPUT_DIR / rel
+    if ".." in rel or not str(p.resolve()).startswith(str(OUTPUT_DIR.resolve())):
+        p = OUTPUT_DIR / Path(path_key).name
+    p.parent.mkdir(parents=True, exist_ok=True)
+    p.write_text(code, encoding="utf-8")
+    print(f"Wrote: {p}", flush=True)
+    return p
 
-    design = json.loads(SYSTEM_DESIGN_JSON.read_text(encoding="utf-8"))
-    design_str = json.dumps(design, indent=2)
 
-    client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
+def _retry_delay(error: Exception, attempt: int) -> float | None:
+    """Seconds to wait before retrying a failed Claude call, or None if the error is not retryable."""
+    status = getattr(error, "status_code", None)
+    retryable = isinstance(error, (anthropic.RateLimitError, anthropic.APIConnectionError, anthropic.InternalServerError))
+    if not retryable and status not in (408, 409, 429, 529) and not (isinstance(status, int) and status >= 500):
+        return None
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), CODEGEN_BACKOFF_MAX_SECONDS)
+        except ValueError:
+            pass
+    delay = min(CODEGEN_BACKOFF_SECONDS * (2 ** attempt), CODEGEN_BACKOFF_MAX_SECONDS)
+    return random.uniform(delay / 2, delay)
+
+
+def call_with_retries(fn, *args, label: str = "", **kwargs):
+    """Call fn, retrying rate-limit / overload / transient errors with Retry-After or jittered exponential backoff."""
+    for attempt in range(CODEGEN_MAX_RETRIES + 1):
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            delay = _retry_delay(e, attempt)
+            if delay is None or attempt == CODEGEN_MAX_RETRIES:
+                raise
+            print(f"  {label}: {type(e).__name__}, retrying in {delay:.1f}s ({attempt + 1}/{CODEGEN_MAX_RETRIES})", flush=True)
+            time.sleep(delay)
+
+
+def _agent_context(design: dict, agent: dict) -> dict:
+    """The agent's design entry plus the edges and node ids it connects to (enough context for one file)."""
+    aid = agent.get("id")
+    edges = [e for e in design.get("edges", []) if aid in (e.get("from"), e.get("to"))]
+    return {
+        "agent": agent,
+        "edges": edges,
+        "all_agent_ids": [a.get("id") for a in design.get("agents", [])],
+        "course_summary": design.get("course_summary", ""),
+    }
+
+
+def generate_agent_code(client: anthropic.Anthropic, design: dict, agent: dict) -> tuple[str, str | None]:
+    """Ask Claude for one agent file; return (raw response text, code or None)."""
+    aid = agent["id"]
+    context = json.dumps(_agent_context(design, agent), indent=2)
+    message = client.messages.create(
+        model=MODEL,
+        max_tokens=AGENT_MAX_TOKENS,
+        messages=[{"role": "user", "content": f"{AGENT_PROMPT}\n\nAgent id: {aid}\n\nAgent design:\n{context}"}],
+    )
+    text = message.content[0].text if message.content else ""
+    blocks = extract_code_blocks(text)
+    code = blocks.get(f"output/agents/{aid}.py")
+    if code is None:
+        # Fall back to the first python block if the model didn't label it
+        m = re.search(r"```[^\n]*\n(.*?)```", text, re.DOTALL)
+        code = m.group(1).strip() if m else None
+    return text, code
+
+
+def _hash_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def prompt_version(prompt: str = AGENT_PROMPT, model: str = MODEL) -> str:
+    """Version of the codegen contract: changes when the prompt or model changes."""
+    return _hash_text(f"{model}\n{prompt}")
+
+
+def agent_entry_hash(agent: dict) -> str:
+    return _hash_text(json.dumps(agent, sort_keys=True))
+
+
+def load_codegen_manifest(path: Path = CODEGEN_MANIFEST_JSON) -> dict:
+    manifest = {}
+    if path.exists():
+        try:
+            manifest = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError):
+            manifest = {}
+    manifest.setdefault("agents", {})
+    return manifest
+
+
+def save_codegen_manifest(manifest: dict, path: Path = CODEGEN_MANIFEST_JSON) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(manifest, indent=2, sort_keys=True), encoding="utf-8")
+
+
+def plan_codegen(design: dict, manifest: dict, version: str) -> tuple[list[dict], list[str]]:
+    """
+    Compare the design with the manifest: return (agents to generate, agent ids to delete).
+    An agent is regenerated if it is new, its design entry changed, the prompt version changed or its file is missing.
+    """
+    agents = [a for a in design.get("agents", []) if a.get("id")]
+    todo = []
+    for a in agents:
+        entry = manifest["agents"].get(a["id"])
+        if (
+            not entry
+            or entry.get("hash") != agent_entry_hash(a)
+            or entry.get("prompt_version") != version
+            or not (AGENTS_DIR / f"{a['id']}.py").exists()
+        ):
+            todo.append(a)
+    current = {a["id"] for a in agents}
+    removed = sorted(aid for aid in manifest["agents"] if aid not in current)
+    return todo, removed
+
+
+def record_agent(manifest: dict, agent: dict, version: str) -> None:
+    manifest["agents"][agent["id"]] = {
+        "hash": agent_entry_hash(agent),
+        "prompt_version": version,
+        "file": f"{agent['id']}.py",
+    }
+
+
+def generate_agents_parallel(
+    client: anthropic.Anthropic,
+    design: dict,
+    agents: list[dict],
+    workers: int = CODEGEN_WORKERS,
+    on_written=None,
+) -> list[str]:
+    """
+    Fan out one request per agent on a bounded pool; write each file as it arrives. Returns ids that failed.
+    on_written(agent) is called (on the calling thread) after each file is written.
+    """
+    failed: list[str] = []
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="codegen") as pool:
+        futures = {
+            pool.submit(call_with_retries, generate_agent_code, client, design, a, label=a["id"]): a["id"]
+            for a in agents
+        }
+        for fut in as_completed(futures):
+            aid = futures[fut]
+            try:
+                text, code = fut.result()
+            except Exception as e:
+                print(f"  {aid}: failed ({e})", file=sys.stderr, flush=True)
+                failed.append(aid)
+                continue
+            if not code:
+                (OUTPUT_DIR / f"claude_raw_{aid}.txt").write_text(text, encoding="utf-8")
+                print(f"  {aid}: no code block (raw response saved to output/claude_raw_{aid}.txt)", file=sys.stderr, flush=True)
+                failed.append(aid)
+                continue
+            write_generated_file(f"output/agents/{aid}.py", code)
+            if on_written:
+                on_written(next(a for a in agents if a["id"] == aid))
+    return sorted(failed)
+
+
+def prune_removed_agents(manifest: dict, removed: list[str]) -> None:
+    """Delete the files of agents no longer in the design and drop them from the manifest."""
+    for aid in removed:
+        path = AGENTS_DIR / f"{aid}.py"
+        if path.exists():
+            path.unlink()
+            print(f"Deleted: {path} (agent removed from design)", flush=True)
+        manifest["agents"].pop(aid, None)
+    if removed:
+        save_codegen_manifest(manifest)
+
+
+def main_single_request(client: anthropic.Anthropic, design: dict, force: bool = False) -> None:
+    """
+    Default mode (incremental): one request covering only the agents that are new, changed or missing a file
+    (edges and human nodes are kept for context); delete files of removed agents.
+    """
+    manifest = load_codegen_manifest()
+    version = prompt_version(PROMPT)
+    agents = [a for a in design.get("agents", []) if a.get("id")]
+    todo, removed = plan_codegen(design, manifest, version)
+    if force:
+        todo = agents
+    prune_removed_agents(manifest, removed)
+    if not todo:
+        print(f"All {len(agents)} agent(s) are up to date.", flush=True)
+        return
+
+    print(f"Generating {len(todo)} of {len(agents)} agent(s) in one request...", flush=True)
+    design_str = json.dumps({**design, "agents": todo}, indent=2)
     message = client.messages.create(
         model=MODEL,
         max_tokens=16000,
@@ -97,24 +328,89 @@ def main() -> None:
         print("No code blocks found. Raw response saved to output/claude_raw_response.txt", file=sys.stderr)
         sys.exit(3)
 
-    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-    AGENTS_DIR.mkdir(parents=True, exist_ok=True)
-
+    # Record what was generated (with this prompt's version, so a later --per-agent run regenerates under its own prompt)
     for path_key, code in blocks.items():
-        # path_key e.g. "output/agents/agent_outreach.py" or "output/master_graph.py"
-        if path_key.startswith("output/"):
-            rel = path_key[7:]  # strip "output/"
+        if path_key == "output/master_graph.py":
+            continue  # compiled locally from the design; never overwrite it
+        write_generated_file(path_key, code)
+    missing = []
+    for a in todo:
+        if f"output/agents/{a['id']}.py" in blocks:
+            record_agent(manifest, a, version)
         else:
-            rel = path_key
-        p = OUTPUT_DIR / rel
-        if ".." in rel or not str(p.resolve()).startswith(str(OUTPUT_DIR.resolve())):
-            p = OUTPUT_DIR / Path(path_key).name
-        p.parent.mkdir(parents=True, exist_ok=True)
-        p.write_text(code, encoding="utf-8")
-        print(f"Wrote: {p}", flush=True)
-
+            missing.append(a["id"])
+    save_codegen_manifest(manifest)
+    if missing:
+        print(f"No code returned for: {', '.join(missing)}. Re-run to retry them (or use --per-agent).", file=sys.stderr)
+        sys.exit(3)
     print("Done. Run the master graph: python output/master_graph.py (or from your app).", flush=True)
 
 
+def main_per_agent(client: anthropic.Anthropic, design: dict, only: list[str], workers: int, force: bool = False) -> None:
+    """
+    --per-agent mode (incremental): regenerate only agents whose design entry changed, new agents and agents
+    with missing files; delete files of removed agents.
+    """
+    manifest = load_codegen_manifest()
+    version = prompt_version()
+    agents = [a for a in design.get("agents", []) if a.get("id")]
+    removed: list[str] = []
+    if only:
+        unknown = sorted(set(only) - {a["id"] for a in agents})
+        if unknown:
+            print(f"Unknown agent id(s): {', '.join(unknown)}", file=sys.stderr)
+            sys.exit(4)
+        todo = [a for a in agents if a["id"] in only]
+    elif force:
+        todo = agents
+        removed = sorted(aid for aid in manifest["agents"] if aid not in {a["id"] for a in agents})
+    else:
+        todo, removed = plan_codegen(design, manifest, version)
+
+    prune_removed_agents(manifest, removed)
+
+    def on_written(agent: dict) -> None:
+        record_agent(manifest, agent, version)
+        save_codegen_manifest(manifest)
+
+    print(f"Generating {len(todo)} of {len(agents)} agent(s) with up to {workers} concurrent request(s)...", flush=True)
+    failed = generate_agents_parallel(client, design, todo, workers, on_written=on_written) if todo else []
+    if failed:
+        print(f"Failed agent(s): {', '.join(failed)}. Re-run with --per-agent --agent <id> to retry them.", file=sys.stderr)
+        sys.exit(3)
+    print("Done. Run the master graph (compiled from the design): python output/master_graph.py", flush=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="system_design.json -> output/agents/*.py (Claude)")
+    parser.add_argument("--per-agent", action="store_true", help="One request per agent in parallel")
+    parser.add_argument("--agent", action="append", default=[], metavar="AGENT_ID", help="With --per-agent: only (re)generate this agent (repeatable)")
+    parser.add_argument("--workers", type=int, default=CODEGEN_WORKERS, help="With --per-agent: max concurrent requests (default: %(default)s)")
+    parser.add_argument("--force", action="store_true", help="Regenerate every agent even if its design entry is unchanged")
+    args = parser.parse_args()
+
+    if not SYSTEM_DESIGN_JSON.exists():
+        print(f"Missing {SYSTEM_DESIGN_JSON}. Run video_to_system_design.py first.", file=sys.stderr)
+        sys.exit(1)
+    if not ANTHROPIC_API_KEY:
+        print("Set ANTHROPIC_API_KEY in .env", file=sys.stderr)
+        sys.exit(2)
+
+    design = json.loads(SYSTEM_DESIGN_JSON.read_text(encoding="utf-8"))
+
+    if args.per_agent or args.agent:
+        OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+        AGENTS_DIR.mkdir(parents=True, exist_ok=True)
+        # Retries are handled by call_with_retries (honours Retry-After), not the SDK
+        client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY, max_retries=0)
+        main_per_agent(client, design, args.agent, args.workers, force=args.force)
+        return
+
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    AGENTS_DIR.mkdir(parents=True, exist_ok=True)
+    client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
+    main_single_request(client, design, force=args.force)
+
+
 if __name__ == "__main__":
     main()
@@ -1,7 +1,11 @@
 """
-Generate only output/master_graph.py from system_design.json and existing output/agents/*.py.
-Run after generate_agents_from_design.py has created the agent files.
+Check the master graph compiled from system_design.json and existing output/agents/*.py.
+output/master_graph.py builds its StateGraph at import time with graph_compiler.py (nodes from agents,
+edges from edges, human ids -> human_in_the_loop, hand-tuned wiring in output/graph_overrides.json),
+so design changes need no regeneration. This script prints the compiled wiring and flags edges that were dropped.
+--llm: legacy mode, ask Claude to write output/master_graph.py instead.
 """
+import argparse
 import json
 import re
 import sys
@@ -10,6 +14,7 @@ from pathlib import Path
 import anthropic
 
 from config import AGENTS_DIR, ANTHROPIC_API_KEY, OUTPUT_DIR, SYSTEM_DESIGN_JSON
+from graph_compiler import OVERRIDES_PATH, compile_spec, describe
 
 MODEL = "claude-sonnet-4-20250514"
 
@@ -62,20 +67,8 @@ def extract_master_graph_code(text: str) -> str | None:
     return None
 
 
-def main() -> None:
-    if not SYSTEM_DESIGN_JSON.exists():
-        print("Missing output/system_design.json. Run video_to_system_design.py first.", file=sys.stderr)
-        sys.exit(1)
-    if not ANTHROPIC_API_KEY:
-        print("Set ANTHROPIC_API_KEY in .env", file=sys.stderr)
-        sys.exit(2)
-
-    design = json.loads(SYSTEM_DESIGN_JSON.read_text(encoding="utf-8"))
-    agent_files = sorted(p.name for p in AGENTS_DIR.glob("*.py") if p.suffix == ".py")
-    if not agent_files:
-        print("No agent files in output/agents/. Run generate_agents_from_design.py first.", file=sys.stderr)
-        sys.exit(3)
-
+def generate_master_graph_code(client: anthropic.Anthropic, design: dict, agent_files: list[str]) -> tuple[str, str | None]:
+    """Ask Claude for master_graph.py; return (raw response text, extracted code or None)."""
     # Build a compact summary for the prompt (full edges + human_nodes + agent ids)
     summary = {
         "agents": [{"id": a["id"]} for a in design.get("agents", [])],
@@ -85,7 +78,6 @@ def main() -> None:
     design_str = json.dumps(summary, indent=2)
     agent_list_str = "\n".join(agent_files)
 
-    client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
     message = client.messages.create(
         model=MODEL,
         max_tokens=16000,
@@ -95,16 +87,65 @@ def main() -> None:
         }],
     )
     text = message.content[0].text if message.content else ""
-    code = extract_master_graph_code(text)
+    return text, extract_master_graph_code(text)
+
+
+def write_master_graph(text: str, code: str | None) -> bool:
+    """Write output/master_graph.py, or save the raw response if no code block was found."""
     if not code:
         (OUTPUT_DIR / "claude_master_graph_raw.txt").write_text(text, encoding="utf-8")
         print("No code block found. Raw response saved to output/claude_master_graph_raw.txt", file=sys.stderr)
-        sys.exit(4)
-
+        return False
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
     master_path = OUTPUT_DIR / "master_graph.py"
     master_path.write_text(code, encoding="utf-8")
     print(f"Wrote: {master_path}", flush=True)
+    return True
+
+
+def main_local() -> None:
+    """Compile the graph spec locally (milliseconds, deterministic) and print it."""
+    design = json.loads(SYSTEM_DESIGN_JSON.read_text(encoding="utf-8"))
+    overrides = json.loads(OVERRIDES_PATH.read_text(encoding="utf-8")) if OVERRIDES_PATH.exists() else {}
+    spec = compile_spec(design, overrides, AGENTS_DIR)
+    missing = [a["id"] for a in design.get("agents", []) if a.get("id") and a["id"] not in spec["nodes"]]
+    for line in describe(spec):
+        print(line)
+    if overrides:
+        print(f"(hand-tuned wiring from {OVERRIDES_PATH})")
+    if missing:
+        print(f"Skipped {len(missing)} design agent(s) without a module in output/agents/: {', '.join(missing)}")
+    if not spec["nodes"]:
+        print("No agent files in output/agents/. Run generate_agents_from_design.py first.", file=sys.stderr)
+        sys.exit(3)
+    print("output/master_graph.py builds this graph at import time. Run from project root: python output/master_graph.py", flush=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Show the master graph compiled from output/system_design.json")
+    parser.add_argument("--llm", action="store_true", help="Legacy: ask Claude to write output/master_graph.py")
+    args = parser.parse_args()
+
+    if not SYSTEM_DESIGN_JSON.exists():
+        print("Missing output/system_design.json. Run video_to_system_design.py first.", file=sys.stderr)
+        sys.exit(1)
+    if not args.llm:
+        main_local()
+        return
+    if not ANTHROPIC_API_KEY:
+        print("Set ANTHROPIC_API_KEY in .env", file=sys.stderr)
+        sys.exit(2)
+
+    design = json.loads(SYSTEM_DESIGN_JSON.read_text(encoding="utf-8"))
+    agent_files = sorted(p.name for p in AGENTS_DIR.glob("*.py") if p.suffix == ".py")
+    if not agent_files:
+        print("No agent files in output/agents/. Run generate_agents_from_design.py first.", file=sys.stderr)
+        sys.exit(3)
+
+    client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
+    text, code = generate_master_graph_code(client, design, agent_files)
+    if not write_master_graph(text, code):
+        sys.exit(4)
     print("Run from project root: python output/master_graph.py", flush=True)
 
 
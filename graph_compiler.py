@@ -0,0 +1,470 @@
+"""
+Deterministic master-graph compiler: builds the LangGraph StateGraph straight from output/system_design.json.
+Replaces asking Claude to write master_graph.py; wiring is mechanical:
+  - one node per design agent whose module exists in output/agents/ (function named after the agent id)
+  - one "human_in_the_loop" node; every human node id in an edge maps to it
+  - "start" -> START; edges with a "condition" become conditional edges (taken when that key is truthy in state/data)
+  - edges out of human nodes become one conditional router on human_in_the_loop keyed by data["last_human_step_id"]
+Hand-tuned wiring lives in output/graph_overrides.json as edge additions/removals on top of the design
+(so new design agents and edges are still wired), plus human-step routing, instead of in code.
+Agent nodes are wrapped by delta_node so they only ever emit the keys they changed (see state_delta).
+Agents declared as def agent_xxx(state, context) receive an AgentContext (tools, config, clients) built once per graph.
+"""
+import hashlib
+import importlib
+import json
+import logging
+import os
+import sys
+import threading
+from collections.abc import Sequence
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+from agent_context import AgentContext, accepts_context, build_contexts, running_thread
+
+logger = logging.getLogger(__name__)
+
+ROOT = Path(__file__).resolve().parent
+OUTPUT_DIR = ROOT / "output"
+DESIGN_PATH = OUTPUT_DIR / "system_design.json"
+OVERRIDES_PATH = OUTPUT_DIR / "graph_overrides.json"
+AGENTS_DIR = OUTPUT_DIR / "agents"
+
+# AGENT_DELTA_DEBUG=1: log every agent output that echoes unchanged state back
+DELTA_DEBUG = os.environ.get("AGENT_DELTA_DEBUG", "").strip().lower() in ("1", "true", "yes")
+
+HUMAN_NODE = "human_in_the_loop"
+START_ID = "start"
+END_ID = "end"
+
+
+def _load_json(path: Path) -> Dict[str, Any]:
+    if not path.exists():
+        return {}
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except Exception:
+        return {}
+
+
+def _route(edge: Dict[str, Any], human_ids: set) -> Dict[str, Any]:
+    dst = edge.get("to") or ""
+    if dst in human_ids or dst.startswith("human_"):
+        dst = HUMAN_NODE
+    return {"to": dst, "condition": edge.get("condition") or ""}
+
+
+def _edge_matches(edge: Dict[str, Any], pattern: Dict[str, Any]) -> bool:
+    if edge.get("from") != pattern.get("from") or edge.get("to") != pattern.get("to"):
+        return False
+    return "condition" not in pattern or (edge.get("condition") or "") == (pattern.get("condition") or "")
+
+
+def _patched_edges(edges: List[Dict[str, Any]], patch: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Design edges minus patch["remove"], plus patch["add"]; removals that match nothing are logged as stale."""
+    removals = [r for r in patch.get("remove", []) if isinstance(r, dict)]
+    used = [False] * len(removals)
+    out = []
+    for edge in edges:
+        hits = [i for i, r in enumerate(removals) if _edge_matches(edge, r)]
+        for i in hits:
+            used[i] = True
+        if not hits:
+            out.append(edge)
+    for r, hit in zip(removals, used):
+        if not hit:
+            logger.warning("graph_overrides: edge removal %s -> %s matches no design edge", r.get("from"), r.get("to"))
+    return out + [e for e in patch.get("add", []) if isinstance(e, dict)]
+
+
+def compile_spec(
+    design: Dict[str, Any],
+    overrides: Dict[str, Any] | None = None,
+    agents_dir: Path = AGENTS_DIR,
+) -> Dict[str, Any]:
+    """
+    Turn a design (+ optional overrides) into a plain graph spec:
+      nodes: agent ids with a module on disk (design order)
+      routes: source ("start" or agent id) -> [{"to", "condition"}]
+      human_routes: human node id -> [{"to", "condition"}]
+      human_default: targets when the last human step has no route ("end" = finish)
+      finish: agent ids wired to END
+    Overrides patch the design edges with "edges": {"add": [...], "remove": [...]} (a removal matches from/to,
+    and the condition too when given) and replace "human_routes", "human_default" and "finish".
+    """
+    overrides = overrides or {}
+    human_ids = {h.get("id") for h in design.get("human_nodes", []) if h.get("id")}
+    nodes = [
+        a["id"] for a in design.get("agents", [])
+        if a.get("id") and (agents_dir / f"{a['id']}.py").exists()
+    ]
+    known = set(nodes) | {HUMAN_NODE, END_ID}
+
+    routes: Dict[str, List[Dict[str, Any]]] = {}
+    human_routes: Dict[str, List[Dict[str, Any]]] = {}
+    seen: set = set()
+    for edge in _patched_edges(design.get("edges", []), overrides.get("edges") or {}):
+        src = edge.get("from") or ""
+        route = _route(edge, human_ids)
+        if route["to"] not in known:
+            continue
+        if src in human_ids or src.startswith("human_"):
+            if "human_routes" not in overrides:
+                human_routes.setdefault(src, []).append(route)
+            continue
+        if src != START_ID and src not in nodes:
+            continue
+        key = (src, route["to"], route["condition"])
+        if key in seen:
+            continue
+        seen.add(key)
+        routes.setdefault(src, []).append(route)
+
+    for src, targets in overrides.get("human_routes", {}).items():
+        human_routes[src] = [
+            _route(t if isinstance(t, dict) else {"to": t}, human_ids) for t in targets
+        ]
+        human_routes[src] = [r for r in human_routes[src] if r["to"] in known]
+
+    return {
+        "nodes": nodes,
+        "routes": routes,
+        "human_routes": human_routes,
+        "human_default": list(overrides.get("human_default", [END_ID])),
+        "finish": [a for a in overrides.get("finish", []) if a in nodes],
+    }
+
+
+def load_spec(design_path: Path = DESIGN_PATH, overrides_path: Path = OVERRIDES_PATH) -> Dict[str, Any]:
+    return compile_spec(_load_json(design_path), _load_json(overrides_path))
+
+
+def _condition_met(state: Dict[str, Any], condition: str) -> bool:
+    if not condition:
+        return True
+    data = state.get("data") or {}
+    return bool(data.get(condition) or state.get(condition))
+
+
+def _edge_router(targets: List[Dict[str, Any]], end: Any) -> Callable[[Dict[str, Any]], Any]:
+    def route(state: Dict[str, Any]):
+        chosen = [t["to"] for t in targets if _condition_met(state, t["condition"])]
+        chosen = [end if t == END_ID else t for t in chosen]
+        if not chosen:
+            return end
+        return chosen[0] if len(chosen) == 1 else chosen
+    return route
+
+
+def _human_router(spec: Dict[str, Any], end: Any) -> Callable[[Dict[str, Any]], Any]:
+    """Route out of human_in_the_loop: end on done/exit, else by the human step just completed, else the default."""
+    default = [{"to": t, "condition": ""} for t in spec["human_default"]]
+
+    def route(state: Dict[str, Any]):
+        data = state.get("data") or {}
+        if data.get("_workflow_exit"):
+            return end
+        targets = spec["human_routes"].get(data.get("last_human_step_id", ""), default)
+        return _edge_router(targets, end)(state)
+    return route
+
+
+def _destinations(targets: List[Dict[str, Any]], end: Any) -> List[Any]:
+    out = []
+    for t in targets:
+        dst = end if t["to"] == END_ID else t["to"]
+        if dst not in out:
+            out.append(dst)
+    if end not in out:
+        out.append(end)
+    return out
+
+
+def load_agent(agent_id: str) -> Callable[..., Any]:
+    """Import agents.<agent_id> (output/ must be on sys.path) and return its node function."""
+    return getattr(importlib.import_module(f"agents.{agent_id}"), agent_id)
+
+
+class LazyAgent:
+    """Graph node that imports its agent module on first execution (or during warm_up_agents)."""
+
+    def __init__(self, agent_id: str) -> None:
+        self.agent_id = agent_id
+        self.__name__ = agent_id
+        self._fn: Callable[..., Any] | None = None
+        self._takes_context = False
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._fn is not None
+
+    def load(self) -> Callable[..., Any]:
+        if self._fn is None:
+            with self._lock:
+                if self._fn is None:
+                    fn = load_agent(self.agent_id)
+                    self._takes_context = accepts_context(fn)
+                    self._fn = fn
+        return self._fn
+
+    def __call__(self, state: Dict[str, Any], context: AgentContext | None = None):
+        fn = self.load()
+        return fn(state, context) if self._takes_context else fn(state)
+
+
+_LAZY_AGENTS: Dict[str, LazyAgent] = {}
+_WARMUP_THREAD: threading.Thread | None = None
+_STARTUP_THREAD: threading.Thread | None = None
+
+
+def lazy_agent(agent_id: str) -> LazyAgent:
+    """Shared lazy proxy for an agent (one per id, so a warm-up benefits every compiled graph)."""
+    proxy = _LAZY_AGENTS.get(agent_id)
+    if proxy is None:
+        proxy = _LAZY_AGENTS.setdefault(agent_id, LazyAgent(agent_id))
+    return proxy
+
+
+def warm_up_agents(agent_ids: List[str] | None = None, background: bool = True) -> threading.Thread | None:
+    """Import agent modules ahead of first use (default: every lazy agent created so far), once per process."""
+    global _WARMUP_THREAD
+
+    def run() -> None:
+        for agent_id in agent_ids or list(_LAZY_AGENTS):
+            try:
+                lazy_agent(agent_id).load()
+            except Exception:
+                logger.exception("Warm-up import of %s failed", agent_id)
+
+    if not background:
+        run()
+        return None
+    if _WARMUP_THREAD is None:
+        _WARMUP_THREAD = threading.Thread(target=run, name="agent-warmup", daemon=True)
+        _WARMUP_THREAD.start()
+    return _WARMUP_THREAD
+
+
+def reset_agents() -> None:
+    """Drop the lazy proxies and imported agent modules so the next graph built picks up edited agent files."""
+    global _WARMUP_THREAD
+    for agent_id in list(_LAZY_AGENTS):
+        sys.modules.pop(f"agents.{agent_id}", None)
+    _LAZY_AGENTS.clear()
+    _WARMUP_THREAD = None
+    importlib.invalidate_caches()
+
+
+def warm_up_enabled() -> bool:
+    """AGENT_WARMUP=1 opts in to importing every agent in the background after startup (default: on first use)."""
+    return os.environ.get("AGENT_WARMUP", "").strip().lower() in ("1", "true", "yes")
+
+
+def start_background_warm_up() -> threading.Thread | None:
+    """
+    Server/UI startup hook: if warm-up is enabled, build the master graph and import its agents in a daemon
+    thread (started once per process). output/ must be on sys.path.
+    """
+    global _STARTUP_THREAD
+    if not warm_up_enabled() or _STARTUP_THREAD is not None:
+        return None
+
+    def run() -> None:
+        try:
+            import master_graph  # noqa: F401  (registers the lazy agent proxies)
+        except Exception:
+            logger.exception("Warm-up could not build the master graph")
+            return
+        warm_up_agents(background=False)
+
+    _STARTUP_THREAD = threading.Thread(target=run, name="graph-warmup", daemon=True)
+    _STARTUP_THREAD.start()
+    return _STARTUP_THREAD
+
+
+_MISSING = object()
+
+
+def _is_list(value: Any) -> bool:
+    return isinstance(value, Sequence) and not isinstance(value, (str, bytes))
+
+
+def _list_suffix(value: Any, prev: Any) -> Any:
+    """Items appended after prev, if value starts with prev's exact items (state["x"] + [new]); else value."""
+    n = len(prev)
+    if not n or len(value) < n:
+        return value
+    it = iter(value)
+    if all(next(it) is item for item in prev):
+        return list(it)
+    return value
+
+
+def state_delta(state: Dict[str, Any], update: Dict[str, Any]) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    Reduce a node's output to what it actually changed (reducers append lists and merge dicts, so echoes duplicate):
+      - keys whose value is the input object itself are dropped
+      - lists that start with the input list's items keep only the appended suffix
+      - dicts keep only entries that differ from the input dict
+    Returns (delta, echoed keys).
+    """
+    delta: Dict[str, Any] = {}
+    echoed: List[str] = []
+    for key, value in update.items():
+        prev = state.get(key)
+        if value is prev and key in state:
+            echoed.append(key)
+            continue
+        if isinstance(value, dict) and hasattr(prev, "get") and prev:
+            changed = {k: v for k, v in value.items() if prev.get(k, _MISSING) is not v}
+            if not changed:
+                echoed.append(key)
+                continue
+            value = changed
+        elif _is_list(value) and _is_list(prev):
+            suffix = _list_suffix(value, prev)
+            if suffix is not value:
+                if not suffix:
+                    echoed.append(key)
+                    continue
+                value = suffix
+        delta[key] = value
+    return delta, echoed
+
+
+def _bind_context(fn: Callable[..., Any], context: AgentContext | None) -> Callable[[Dict[str, Any]], Any]:
+    """fn as a one-argument node: lazy agents decide on first load, plain functions by their signature now."""
+    if context is None:
+        return fn
+    if isinstance(fn, LazyAgent) or accepts_context(fn):
+        return lambda state: fn(state, context)
+    return fn
+
+
+def _run_thread_id(state: Dict[str, Any], config: Dict[str, Any] | None) -> str | None:
+    """thread_id from the run config (LangGraph passes it to nodes taking `config`), else from state["data"]."""
+    thread_id = ((config or {}).get("configurable") or {}).get("thread_id")
+    if not thread_id and isinstance(state, dict):
+        thread_id = (state.get("data") or {}).get("thread_id")
+    return str(thread_id) if thread_id else None
+
+
+def delta_node(
+    fn: Callable[..., Any], name: str, debug: bool | None = None, context: AgentContext | None = None,
+) -> Callable[..., Any]:
+    """
+    Wrap an agent so only changed keys reach the reducers; debug logs full-state echoes and echoed keys.
+    With a context, agents taking (state, context) are called with it. The run's thread_id is current
+    (agent_context.current_thread_id) during the call, so tools can tie late results to the thread.
+    """
+    debug = DELTA_DEBUG if debug is None else debug
+    call = _bind_context(fn, context)
+
+    def node(state: Dict[str, Any], config: Dict[str, Any] | None = None):
+        with running_thread(_run_thread_id(state, config)):
+            update = call(state)
+        if not isinstance(update, dict):
+            return update
+        delta, echoed = state_delta(state, update)
+        if debug and echoed:
+            full = bool(state) and all(k in update for k in state)
+            logger.warning(
+                "%s returned %s: echoed %d unchanged key(s) %s; delta keys %s",
+                name, "the full state" if full else "unchanged keys", len(echoed), sorted(echoed), sorted(delta),
+            )
+        return delta
+
+    node.__name__ = getattr(fn, "__name__", name)
+    node.__doc__ = getattr(fn, "__doc__", None)
+    return node
+
+
+def build_graph(
+    state_type: Any,
+    human_node: Callable[..., Any],
+    spec: Dict[str, Any] | None = None,
+    node_factory: Callable[[str], Callable[..., Any]] = lazy_agent,
+    design_path: Path = DESIGN_PATH,
+):
+    """
+    Return an uncompiled StateGraph wired from the spec (default: load_spec()).
+    Agents are lazy proxies by default, so building the graph imports no agent module; pass load_agent to import eagerly.
+    Each agent's AgentContext (resolved tools, design config) is built here, once per graph.
+    """
+    from langgraph.graph import END, START, StateGraph
+
+    spec = spec or load_spec(design_path)
+    contexts = build_contexts(spec["nodes"], design_path)
+    builder = StateGraph(state_type)
+    for agent_id in spec["nodes"]:
+        builder.add_node(agent_id, delta_node(node_factory(agent_id), agent_id, context=contexts[agent_id]))
+    builder.add_node(HUMAN_NODE, human_node)
+
+    for src, targets in spec["routes"].items():
+        source = START if src == START_ID else src
+        if all(not t["condition"] for t in targets):
+            for t in targets:
+                builder.add_edge(source, END if t["to"] == END_ID else t["to"])
+        else:
+            builder.add_conditional_edges(source, _edge_router(targets, END), _destinations(targets, END))
+
+    all_human = [t for ts in spec["human_routes"].values() for t in ts]
+    all_human += [{"to": t, "condition": ""} for t in spec["human_default"]]
+    builder.add_conditional_edges(HUMAN_NODE, _human_router(spec, END), _destinations(all_human, END))
+
+    for agent_id in spec["finish"]:
+        builder.add_edge(agent_id, END)
+    return builder
+
+
+def design_version(design_path: Path = DESIGN_PATH, overrides_path: Path = OVERRIDES_PATH) -> str:
+    """Hash of the compiled spec and agent entries; changes when the design, overrides or set of agent modules change."""
+    design = _load_json(design_path)
+    # Agent entries (tools, config) are part of the version so a tools-only edit also rebuilds cached graphs
+    spec = [compile_spec(design, _load_json(overrides_path)), design.get("agents", [])]
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def _agent_stamps(agents_dir: Path) -> Tuple[Tuple[str, int, int], ...]:
+    try:
+        entries = [e for e in os.scandir(agents_dir) if e.name.endswith(".py")]
+    except OSError:
+        return ()
+    # DirEntry caches its stat, so each file is stat'ed once
+    return tuple(sorted((e.name, e.stat().st_mtime_ns, e.stat().st_size) for e in entries))
+
+
+def _file_stamp(path: Path) -> Tuple[int, int] | None:
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def sources_stamp(
+    design_path: Path = DESIGN_PATH, overrides_path: Path = OVERRIDES_PATH, agents_dir: Path = AGENTS_DIR,
+) -> tuple:
+    """(mtime_ns, size) of the design, overrides and every agent file: cheap change check before re-hashing."""
+    return _file_stamp(design_path), _file_stamp(overrides_path), _agent_stamps(agents_dir)
+
+
+def agents_version(agents_dir: Path = AGENTS_DIR) -> str:
+    """Hash of every agent module's name, mtime and size; changes when an agent file is added, removed or edited."""
+    return hashlib.sha256(json.dumps(_agent_stamps(agents_dir)).encode("utf-8")).hexdigest()[:16]
+
+
+def describe(spec: Dict[str, Any]) -> List[str]:
+    """Human-readable edge list (for generate_master_graph.py and audits)."""
+    lines = [f"nodes: {len(spec['nodes'])} agents + {HUMAN_NODE}"]
+    for src, targets in spec["routes"].items():
+        for t in targets:
+            cond = f"  [if {t['condition']}]" if t["condition"] else ""
+            lines.append(f"{src} -> {t['to']}{cond}")
+    for step, targets in spec["human_routes"].items():
+        lines.append(f"{HUMAN_NODE} ({step}) -> {', '.join(t['to'] for t in targets)}")
+    lines.append(f"{HUMAN_NODE} (default) -> {', '.join(spec['human_default'])}")
+    lines.extend(f"{a} -> end" for a in spec["finish"])
+    return lines
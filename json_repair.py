@@ -0,0 +1,136 @@
+"""
+Tolerant JSON parsing for LLM responses: markdown fences, stray prose, trailing commas and truncated output.
+StreamingJSONScanner is fed chunks as they arrive and remembers the last point where the document can be
+cut and closed cleanly, so a response that stops mid-array still yields every element completed before it.
+"""
+import json
+from typing import Any, NamedTuple
+
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+class RepairResult(NamedTuple):
+    value: Any
+    truncated: bool  # True if trailing content was dropped to make the document parse
+
+
+def strip_trailing_commas(text: str) -> str:
+    """Blank out commas that directly precede a closing } or ] (outside strings); offsets are preserved."""
+    out: list[str] = []
+    in_string = escape = False
+    pending_comma = -1  # index in out of a comma that may turn out to be trailing
+    for ch in text:
+        if in_string:
+            out.append(ch)
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch in "}]" and pending_comma >= 0:
+            out[pending_comma] = " "
+            pending_comma = -1
+        elif not ch.isspace():
+            pending_comma = -1
+        if ch == ",":
+            pending_comma = len(out)
+        elif ch == '"':
+            in_string = True
+        out.append(ch)
+    return "".join(out)
+
+
+class StreamingJSONScanner:
+    """
+    Incrementally scans a JSON object as text chunks arrive (leading prose and code fences are skipped).
+    Tracks string/escape state and bracket nesting; records safe cut points after each complete nested value.
+    """
+
+    def __init__(self) -> None:
+        self.text = ""
+        self.start = -1
+        self.end = -1
+        self._stack: list[str] = []
+        self._in_string = False
+        self._escape = False
+        self._safe: list[tuple[int, tuple[str, ...]]] = []  # (cut index, open brackets at that point)
+
+    @property
+    def complete(self) -> bool:
+        """True once the top-level object has been closed."""
+        return self.end >= 0
+
+    def feed(self, chunk: str) -> None:
+        if not chunk:
+            return
+        pos = len(self.text)
+        self.text += chunk
+        if self.complete:
+            return
+        for i in range(pos, len(self.text)):
+            ch = self.text[i]
+            if self.start < 0:
+                if ch == "{":
+                    self.start = i
+                    self._stack.append(ch)
+                continue
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+            if ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._stack.append(ch)
+            elif ch in "}]":
+                if self._stack:
+                    self._stack.pop()
+                if not self._stack:
+                    self.end = i + 1
+                    return
+                self._safe.append((i + 1, tuple(self._stack)))
+            elif ch == ",":
+                self._safe.append((i, tuple(self._stack)))
+
+    def _closed_at(self, cut: int, stack: tuple[str, ...]) -> str:
+        return self.text[self.start:cut] + "".join(_CLOSERS[b] for b in reversed(stack))
+
+    def candidates(self):
+        """Yield (json_text, kept_length, truncated) from the most to the least complete document."""
+        if self.start < 0:
+            return
+        if self.complete:
+            yield self.text[self.start:self.end], self.end - self.start, False
+        for cut, stack in reversed(self._safe):
+            yield self._closed_at(cut, stack), cut - self.start, True
+        yield "{}", 0, True
+
+    def result(self) -> RepairResult:
+        """Parse the most complete recoverable document; raises json.JSONDecodeError if there is no object at all."""
+        if self.start < 0:
+            raise json.JSONDecodeError("No JSON object found", self.text, 0)
+        last_error: json.JSONDecodeError | None = None
+        limit = None
+        for candidate, kept, truncated in self.candidates():
+            # Skip cut points past a known parse error: they still contain the bad token
+            if limit is not None and kept > limit:
+                continue
+            try:
+                return RepairResult(json.loads(strip_trailing_commas(candidate), strict=False), truncated)
+            except json.JSONDecodeError as e:
+                last_error = e
+                limit = e.pos if limit is None else min(limit, e.pos)
+        raise last_error or json.JSONDecodeError("Unrecoverable JSON", self.text, 0)
+
+
+def loads_tolerant(text: str) -> RepairResult:
+    """Parse possibly malformed or truncated JSON text in one go (same repair rules as the streaming scanner)."""
+    scanner = StreamingJSONScanner()
+    scanner.feed(strip_trailing_commas(text))
+    return scanner.result()
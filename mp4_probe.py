@@ -0,0 +1,72 @@
+"""
+Read an MP4/MOV duration from the container header (moov/mvhd box) without decoding any media.
+Used by video_to_system_design.py to estimate Gemini tokens per video before uploading.
+"""
+import struct
+from pathlib import Path
+from typing import BinaryIO
+
+# Boxes we descend into on the way to mvhd; everything else (mdat, free, ...) is skipped by seeking
+_CONTAINER_BOXES = {b"moov"}
+
+
+def _iter_boxes(fh: BinaryIO, start: int, end: int):
+    """Yield (box_type, payload_offset, box_end) for boxes in [start, end)."""
+    pos = start
+    while pos + 8 <= end:
+        fh.seek(pos)
+        header = fh.read(8)
+        if len(header) < 8:
+            return
+        size, box_type = struct.unpack(">I4s", header)
+        payload = pos + 8
+        if size == 1:
+            large = fh.read(8)
+            if len(large) < 8:
+                return
+            size = struct.unpack(">Q", large)[0]
+            payload = pos + 16
+        elif size == 0:
+            size = end - pos
+        if size < payload - pos:
+            return
+        yield box_type, payload, pos + size
+        pos += size
+
+
+def _read_mvhd(fh: BinaryIO, payload: int) -> float | None:
+    fh.seek(payload)
+    version = fh.read(4)[:1]
+    if version == b"\x01":
+        data = fh.read(28)
+        if len(data) < 28:
+            return None
+        timescale, duration = struct.unpack(">16xIQ", data)
+    else:
+        data = fh.read(16)
+        if len(data) < 16:
+            return None
+        timescale, duration = struct.unpack(">8xII", data)
+    if not timescale:
+        return None
+    return duration / timescale
+
+
+def mp4_duration_seconds(path: Path) -> float | None:
+    """Duration in seconds from the movie header, or None if the file is not a readable MP4."""
+    try:
+        with Path(path).open("rb") as fh:
+            fh.seek(0, 2)
+            file_end = fh.tell()
+            stack = [(0, file_end)]
+            while stack:
+                start, end = stack.pop()
+                for box_type, payload, box_end in _iter_boxes(fh, start, min(end, file_end)):
+                    if box_type == b"mvhd":
+                        return _read_mvhd(fh, payload)
+                    if box_type in _CONTAINER_BOXES:
+                        stack.append((payload, box_end))
+                        break
+    except (OSError, struct.error):
+        return None
+    return None
@@ -1,19 +1,12 @@
 from typing import Dict, Any
 
-def agent_outreach_communicator(state: Dict[str, Any]) -> Dict[str, Any]:
+def agent_outreach_communicator(state: Dict[str, Any], context: Any = None) -> Dict[str, Any]:
     """
     Sends initial outreach messages, manages replies, schedules initial calls/interviews, and maintains ongoing candidate communication.
     Tool binding: when INSTANTLY_API_KEY is set, uses Instantly.ai for outreach campaigns.
+    context: AgentContext supplied by the graph (tools resolved once per graph build).
     """
-    import sys
-    from pathlib import Path
-    sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))  # project root
-    tools = {}
-    try:
-        from tools import get_tools_for_agent
-        tools = get_tools_for_agent("agent_outreach_communicator")
-    except Exception:
-        pass
+    tools = context.tools if context is not None else {}
 
     qualified_candidates = state.get("qualified_candidate_list", [])
     outreach_templates = state.get("predefined_outreach_templates", {})
@@ -29,7 +22,8 @@ def agent_outreach_communicator(state: Dict[str, Any]) -> Dict[str, Any]:
     if tools and qualified_candidates:
         add_leads = tools.get("instantly_add_leads")
         if add_leads:
-            leads = [{"email": c.get("contact_info", {}).get("email") or f"{c.get('name', 'user')}@example.com", "first_name": (c.get("name") or "Candidate").split()[0]} for c in qualified_candidates[:20]]
+            # All qualified candidates: instantly_add_leads dedupes by email and sends in concurrent chunks
+            leads = [{"email": c.get("contact_info", {}).get("email") or f"{c.get('name', 'user')}@example.com", "first_name": (c.get("name") or "Candidate").split()[0]} for c in qualified_candidates]
             campaign_result = add_leads(campaign_id=state.get("data", {}).get("instantly_campaign_id") or "default", leads=leads)
 
     for candidate in qualified_candidates:
@@ -1,73 +1,36 @@
+import os
 import sys
+import threading
+from collections import OrderedDict
 from pathlib import Path
 from typing import TypedDict, Dict, Any, Annotated
-from langgraph.graph import StateGraph, START, END
+
+# Add output directory (agents package) and project root (graph_compiler, persistent_state) to path
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from graph_compiler import agents_version, build_graph, design_version, reset_agents, sources_stamp
+from persistent_state import as_persistent_dict, as_persistent_list, checkpoint_serde, to_plain
 
 
 def _merge_dict(left: dict | None, right: dict | None) -> dict:
-    """Reducer: merge dicts so multiple nodes can update the same state key."""
-    if left is None: return right or {}
-    if right is None: return left or {}
-    return {**left, **right}
+    """Reducer: merge dicts so multiple nodes can update the same state key (persistent map: O(update), snapshots shared)."""
+    if left is None: return as_persistent_dict(right)
+    if right is None or right is left: return as_persistent_dict(left)
+    return as_persistent_dict(left).updated(right)
 
 
 def _merge_list(left: list | None, right: list | None) -> list:
-    """Reducer: concatenate lists so multiple nodes can update the same state key."""
-    if left is None: return list(right or [])
-    if right is None: return list(left or [])
-    return list(left) + list(right)
+    """Reducer: concatenate lists so multiple nodes can update the same state key (append-only chunks: O(update))."""
+    if left is None: return as_persistent_list(right)
+    if right is None: return as_persistent_list(left)
+    return as_persistent_list(left).extended(right)
 
 
 def _last_wins(left: Any, right: Any) -> Any:
     """Reducer: take the update (right) so multiple nodes can write to same key."""
     return right if right is not None else left
 
-# Add output directory to path for agent imports
-sys.path.insert(0, str(Path(__file__).resolve().parent))
-
-# Import all available agents
-from agents.agent_application_preparer import agent_application_preparer
-from agents.agent_candidate_assessment import agent_candidate_assessment
-from agents.agent_candidate_data_capture import agent_candidate_data_capture
-from agents.agent_candidate_database_update import agent_candidate_database_update
-from agents.agent_candidate_info_capture import agent_candidate_info_capture
-from agents.agent_candidate_motivation_analysis import agent_candidate_motivation_analysis
-from agents.agent_candidate_presentation import agent_candidate_presentation
-from agents.agent_candidate_qualifier import agent_candidate_qualifier
-from agents.agent_candidate_relationship_management import agent_candidate_relationship_management
-from agents.agent_candidate_sourcer import agent_candidate_sourcer
-from agents.agent_candidate_sourcing import agent_candidate_sourcing
-from agents.agent_client_relationship_management import agent_client_relationship_management
-from agents.agent_contract_generation import agent_contract_generation
-from agents.agent_contact_info_lookup import agent_contact_info_lookup
-from agents.agent_crm_manager import agent_crm_manager
-from agents.agent_crm_update import agent_crm_update
-from agents.agent_lead_generation import agent_lead_generation
-from agents.agent_cv_screening import agent_cv_screening
-from agents.agent_cv_submission import agent_cv_submission
-from agents.agent_document_generation import agent_document_generation
-from agents.agent_document_requester import agent_document_requester
-from agents.agent_document_storage_and_tracking import agent_document_storage_and_tracking
-from agents.agent_email_automation import agent_email_automation
-from agents.agent_feedback_collector import agent_feedback_collector
-from agents.agent_financing_company_interface import agent_financing_company_interface
-from agents.agent_info_gatherer_linkedin import agent_info_gatherer_linkedin
-from agents.agent_interview_questionnaire_prep import agent_interview_questionnaire_prep
-from agents.agent_interview_scheduler import agent_interview_scheduler
-from agents.agent_interview_scheduling import agent_interview_scheduling
-from agents.agent_invoice_generation import agent_invoice_generation
-from agents.agent_job_ad_creation import agent_job_ad_creation
-from agents.agent_job_info_gathering import agent_job_info_gathering
-from agents.agent_job_matching_engine import agent_job_matching_engine
-from agents.agent_offer_analysis import agent_offer_analysis
-from agents.agent_outreach_communicator import agent_outreach_communicator
-from agents.agent_payroll_setup import agent_payroll_setup
-from agents.agent_post_offer_followup import agent_post_offer_followup
-from agents.agent_profit_tracking import agent_profit_tracking
-from agents.agent_referral_requestor import agent_referral_requestor
-from agents.agent_reporting import agent_reporting
-from agents.agent_screening_scheduler import agent_screening_scheduler
-
 # Define shared state (Annotated reducers allow multiple nodes to update same key per step)
 class RecruitmentState(TypedDict, total=False):
     candidate_profile: Annotated[Dict[str, Any], _merge_dict]
@@ -176,149 +139,114 @@ def human_in_the_loop(state: RecruitmentState) -> RecruitmentState:
     }
 
 
-def _human_routes_to(state: dict) -> str:
-    """Route from human_in_the_loop: end, or next step (client job intake, then job gathering, else default)."""
-    if state.get("data", {}).get("_workflow_exit"):
-        return "end"
-    last = state.get("data", {}).get("last_human_step_id", "")
-    if last == "human_outbound_caller":
-        return "human_again"  # re-enter human for human_client_job_intake (has contact details now)
-    if last == "human_client_job_intake":
-        return "client_job"  # then agent_job_info_gathering
-    return "continue"
+# Create the graph: nodes and edges are compiled from system_design.json + graph_overrides.json
+# (client path: lead -> contact lookup -> human outbound caller -> human job intake -> job gathering;
+#  after any other human step the run continues at agent_candidate_database_update)
+# Agent nodes are lazy proxies: each agent module is imported on its first run
+# (or after startup by graph_compiler.start_background_warm_up when AGENT_WARMUP=1)
+builder = build_graph(RecruitmentState, human_in_the_loop)
+
+# Compile the graph (CLI: no checkpointer). Frozen at import: long-running servers use get_graph() instead.
+graph = builder.compile()
+
+# Compiled graphs per (checkpointer, interrupt settings, design + agents version); a design or agent edit
+# rebuilds the builder and drops every cached graph (GRAPH_CACHE_SIZE caps distinct checkpointers kept)
+GRAPH_CACHE_SIZE = int(os.environ.get("GRAPH_CACHE_SIZE", "8"))
+_GRAPH_CACHE: "OrderedDict[tuple, tuple]" = OrderedDict()
+_GRAPH_LOCK = threading.Lock()
+_sources_stamp = sources_stamp()
+_builder_version = (design_version(), agents_version())
+_default_checkpointer = None
+_NO_CHECKPOINTER = object()
 
-# Create the graph
-builder = StateGraph(RecruitmentState)
 
-# Add all agent nodes (client-acquisition path first so job intake has contact details)
-builder.add_node("agent_lead_generation", agent_lead_generation)
-builder.add_node("agent_contact_info_lookup", agent_contact_info_lookup)
-builder.add_node("agent_candidate_data_capture", agent_candidate_data_capture)
-builder.add_node("agent_screening_scheduler", agent_screening_scheduler)
-builder.add_node("agent_document_requester", agent_document_requester)
-builder.add_node("agent_document_storage_and_tracking", agent_document_storage_and_tracking)
-builder.add_node("agent_candidate_database_update", agent_candidate_database_update)
-builder.add_node("agent_job_matching_engine", agent_job_matching_engine)
-builder.add_node("agent_application_preparer", agent_application_preparer)
-builder.add_node("agent_feedback_collector", agent_feedback_collector)
-builder.add_node("agent_reporting", agent_reporting)
-builder.add_node("agent_candidate_sourcer", agent_candidate_sourcer)
-builder.add_node("agent_candidate_qualifier", agent_candidate_qualifier)
-builder.add_node("agent_outreach_communicator", agent_outreach_communicator)
-builder.add_node("agent_cv_submission", agent_cv_submission)
-builder.add_node("agent_interview_scheduler", agent_interview_scheduler)
-builder.add_node("agent_crm_manager", agent_crm_manager)
-builder.add_node("agent_referral_requestor", agent_referral_requestor)
-builder.add_node("agent_info_gatherer_linkedin", agent_info_gatherer_linkedin)
-builder.add_node("agent_job_info_gathering", agent_job_info_gathering)
-builder.add_node("agent_candidate_sourcing", agent_candidate_sourcing)
-builder.add_node("agent_interview_questionnaire_prep", agent_interview_questionnaire_prep)
-builder.add_node("agent_candidate_assessment", agent_candidate_assessment)
-builder.add_node("agent_candidate_motivation_analysis", agent_candidate_motivation_analysis)
-builder.add_node("agent_candidate_presentation", agent_candidate_presentation)
-builder.add_node("agent_interview_scheduling", agent_interview_scheduling)
-builder.add_node("agent_offer_analysis", agent_offer_analysis)
-builder.add_node("agent_post_offer_followup", agent_post_offer_followup)
-builder.add_node("agent_contract_generation", agent_contract_generation)
-builder.add_node("agent_payroll_setup", agent_payroll_setup)
-builder.add_node("agent_invoice_generation", agent_invoice_generation)
-builder.add_node("agent_financing_company_interface", agent_financing_company_interface)
-builder.add_node("agent_profit_tracking", agent_profit_tracking)
-builder.add_node("agent_candidate_relationship_management", agent_candidate_relationship_management)
-builder.add_node("agent_client_relationship_management", agent_client_relationship_management)
-builder.add_node("agent_job_ad_creation", agent_job_ad_creation)
-builder.add_node("agent_cv_screening", agent_cv_screening)
-builder.add_node("agent_candidate_info_capture", agent_candidate_info_capture)
-builder.add_node("agent_document_generation", agent_document_generation)
-builder.add_node("agent_email_automation", agent_email_automation)
-builder.add_node("agent_crm_update", agent_crm_update)
+def _current_builder():
+    """
+    Module builder, rebuilt (with fresh agent imports) when the design or an agent module changed on disk.
+    Only a stat of the source files runs per call; the design is re-parsed and hashed when a stamp changed.
+    """
+    global builder, _builder_version, _sources_stamp
+    stamp = sources_stamp()
+    if stamp != _sources_stamp:
+        version = (design_version(), agents_version())
+        _sources_stamp = stamp
+        if version != _builder_version:
+            reset_agents()
+            builder = build_graph(RecruitmentState, human_in_the_loop)
+            _builder_version = version
+            _GRAPH_CACHE.clear()
+    return builder, _builder_version
+
+
+def _get_default_checkpointer():
+    """One SQLite checkpointer per process (MemorySaver if langgraph's sqlite saver is not installed)."""
+    global _default_checkpointer
+    if _default_checkpointer is None:
+        try:
+            import sqlite3
+            import tempfile
+            from langgraph.checkpoint.sqlite import SqliteSaver
+            db = str(Path(tempfile.gettempdir()) / "recruitment_checkpoints.sqlite")
+            conn = sqlite3.connect(db, check_same_thread=False)
+            _default_checkpointer = SqliteSaver(conn, serde=checkpoint_serde())
+        except Exception:
+            from langgraph.checkpoint.memory import MemorySaver
+            _default_checkpointer = MemorySaver(serde=checkpoint_serde())
+    return _default_checkpointer
 
-# Add human interaction node
-builder.add_node("human_in_the_loop", human_in_the_loop)
 
-# Add edges from graph entry: client path first (lead -> contact lookup -> human outbound -> human job intake -> job gathering)
-builder.add_edge(START, "agent_lead_generation")
-builder.add_edge("agent_lead_generation", "agent_contact_info_lookup")
-builder.add_edge("agent_contact_info_lookup", "human_in_the_loop")  # human_outbound_caller (state has next_human_node set)
+def _node_names(nodes) -> tuple:
+    """interrupt_before/after as a tuple; a single node name is one entry, not its characters."""
+    if not nodes:
+        return ()
+    if isinstance(nodes, str):
+        return (nodes,)
+    return tuple(nodes)
 
-# Candidate path (runs in parallel from START if we ever branch; for now client path is first)
-builder.add_edge(START, "agent_candidate_data_capture")
 
-# Add agent-to-agent edges
-builder.add_edge("agent_candidate_data_capture", "agent_screening_scheduler")
-builder.add_edge("agent_screening_scheduler", "human_in_the_loop")  # to human_initial_screening_call
-builder.add_edge("agent_candidate_database_update", "agent_document_requester")
-builder.add_edge("agent_document_requester", "agent_document_storage_and_tracking")
-builder.add_edge("agent_document_storage_and_tracking", "human_in_the_loop")  # to human_legal_compliance_verification
-builder.add_edge("agent_candidate_database_update", "agent_job_matching_engine")
-builder.add_edge("agent_job_matching_engine", "human_in_the_loop")  # to human_client_submission_approval
-builder.add_edge("agent_application_preparer", "human_in_the_loop")  # to human_interview_prep_debriefer
-builder.add_edge("agent_feedback_collector", "human_in_the_loop")  # to human_offer_negotiation
-builder.add_edge("agent_candidate_sourcer", "agent_candidate_qualifier")
-builder.add_edge("agent_candidate_sourcer", "agent_info_gatherer_linkedin")
-builder.add_edge("agent_info_gatherer_linkedin", "agent_candidate_qualifier")
-builder.add_edge("agent_candidate_qualifier", "agent_outreach_communicator")
-builder.add_edge("agent_outreach_communicator", "human_in_the_loop")  # to human_candidate_interview_preparation
-builder.add_edge("agent_cv_submission", "human_in_the_loop")  # to human_client_meeting_or_call
-builder.add_edge("agent_interview_scheduler", "human_in_the_loop")  # to human_client_meeting_or_call
-builder.add_edge("agent_crm_manager", "human_in_the_loop")  # to human_client_management
-builder.add_edge("agent_job_info_gathering", "agent_candidate_sourcing")
-builder.add_edge("agent_candidate_sourcing", "agent_interview_questionnaire_prep")
-builder.add_edge("agent_interview_questionnaire_prep", "human_in_the_loop")  # to human_candidate_interview
-builder.add_edge("agent_candidate_assessment", "agent_candidate_motivation_analysis")
-builder.add_edge("agent_candidate_motivation_analysis", "agent_candidate_presentation")
-builder.add_edge("agent_candidate_presentation", "agent_interview_scheduling")
-builder.add_edge("agent_interview_scheduling", "human_in_the_loop")  # to human_offer_negotiation
-builder.add_edge("agent_offer_analysis", "agent_post_offer_followup")
-builder.add_edge("agent_post_offer_followup", "agent_candidate_relationship_management")
-builder.add_edge("agent_contract_generation", "human_in_the_loop")  # to human_temp_onboarding_review
-builder.add_edge("agent_payroll_setup", "agent_invoice_generation")
-builder.add_edge("agent_invoice_generation", "agent_financing_company_interface")
-builder.add_edge("agent_financing_company_interface", "agent_profit_tracking")
-builder.add_edge("agent_profit_tracking", "human_in_the_loop")  # to human_strategy_oversight
-builder.add_edge("agent_job_ad_creation", "agent_candidate_sourcing")
-builder.add_edge("agent_cv_screening", "human_in_the_loop")  # to human_candidate_interview
-builder.add_edge("agent_candidate_info_capture", "agent_crm_update")
-builder.add_edge("agent_document_generation", "agent_email_automation")
-builder.add_edge("agent_email_automation", "human_in_the_loop")  # to human_candidate_follow_up
+def _cached_graph(checkpointer, interrupt_before=(), interrupt_after=()):
+    interrupt_before, interrupt_after = _node_names(interrupt_before), _node_names(interrupt_after)
+    with _GRAPH_LOCK:
+        current, version = _current_builder()
+        key = (id(checkpointer), interrupt_before, interrupt_after, version)
+        cached = _GRAPH_CACHE.get(key)
+        # The entry holds the checkpointer itself, so its id cannot be reused while cached
+        if cached is not None and cached[0] is checkpointer:
+            _GRAPH_CACHE.move_to_end(key)
+            return cached[1]
+        compiled = current.compile(
+            checkpointer=None if checkpointer is _NO_CHECKPOINTER else checkpointer,
+            interrupt_before=list(interrupt_before),
+            interrupt_after=list(interrupt_after),
+        )
+        _GRAPH_CACHE[key] = (checkpointer, compiled)
+        while len(_GRAPH_CACHE) > GRAPH_CACHE_SIZE:
+            _GRAPH_CACHE.popitem(last=False)
+        return compiled
 
-# Conditional edge from human: end, or human_again (client job intake), or client_job (job gathering), or continue (default)
-builder.add_conditional_edges(
-    "human_in_the_loop",
-    _human_routes_to,
-    {
-        "end": END,
-        "human_again": "human_in_the_loop",
-        "client_job": "agent_job_info_gathering",
-        "continue": "agent_candidate_database_update",
-    },
-)
-builder.add_edge("agent_reporting", END)
 
-# Compile the graph (CLI: no checkpointer)
-graph = builder.compile()
+def get_graph():
+    """Current graph without checkpointer (like `graph`, but rebuilt when the design or an agent file changes)."""
+    return _cached_graph(_NO_CHECKPOINTER)
 
 
-def get_graph_for_chainlit(checkpointer=None):
+def get_graph_for_chainlit(checkpointer=None, interrupt_before=("human_in_the_loop",), interrupt_after=()):
     """
     Compile the same graph with a checkpointer and interrupt before human steps.
     Use in Chainlit so (1) state persists across reloads, (2) graph pauses for human input in the UI.
+    Compiled graphs are cached, so sessions sharing a checkpointer share one graph (threads are kept apart by
+    thread_id in the run config); pass the same checkpointer object to benefit.
     """
     if checkpointer is None:
-        try:
-            import sqlite3
-            import tempfile
-            from langgraph.checkpoint.sqlite import SqliteSaver
-            db = str(Path(tempfile.gettempdir()) / "recruitment_checkpoints.sqlite")
-            conn = sqlite3.connect(db, check_same_thread=False)
-            checkpointer = SqliteSaver(conn)
-        except Exception:
-            from langgraph.checkpoint.memory import MemorySaver
-            checkpointer = MemorySaver()
-    return builder.compile(
-        checkpointer=checkpointer,
-        interrupt_before=["human_in_the_loop"],
-    )
+        with _GRAPH_LOCK:
+            checkpointer = _get_default_checkpointer()
+    return _cached_graph(checkpointer, interrupt_before, interrupt_after)
+
+
+def clear_graph_cache() -> None:
+    with _GRAPH_LOCK:
+        _GRAPH_CACHE.clear()
+
 
 if __name__ == "__main__":
     # Initialize the state
@@ -351,6 +279,7 @@ if __name__ == "__main__":
         print("WORKFLOW COMPLETED")
         print("Final state:")
         for key, value in result.items():
+            value = to_plain(value)
             if key != 'data' or len(str(value)) < 200:
                 print(f"{key}: {value}")
     except Exception as e:
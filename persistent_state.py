@@ -0,0 +1,368 @@
+"""
+Persistent (immutable, structure-sharing) values for LangGraph state channels.
+Updating returns a new value that shares everything unchanged with the old one, so reducers cost O(update)
+instead of O(state) and in-memory state values from earlier steps stay valid without copying. (A checkpointer
+still serializes each channel in full every step; the sharing is in memory only.)
+  PersistentList - append-only list stored as a chain of small immutable chunks; appended/extended touch only the tail
+  PersistentDict - hash array mapped trie (32-way); set/updated copy only the path to each changed key
+Both behave like read-only list/dict for agents (iteration, len, indexing, .get, {**d}, list(l), .copy(), ==).
+In-place mutators (append, extend, update, item assignment) raise TypeError instead of silently doing nothing:
+agents return the changed keys and the reducers apply them.
+For checkpointers, checkpoint_serde() stores them as plain list/dict; the reducers re-wrap them on the next update.
+"""
+from collections.abc import Mapping, Sequence
+from typing import Any, Iterable, Iterator, Tuple
+
+# Items per list chunk: appends copy at most this many references
+CHUNK_SIZE = 64
+
+_BITS = 5
+_MASK = (1 << _BITS) - 1
+_HASH_BITS = 64
+_MISSING = object()
+
+
+# ---------------------------------------------------------------------------
+# PersistentList
+# ---------------------------------------------------------------------------
+
+class _Chunk:
+    __slots__ = ("prev", "items", "length")
+
+    def __init__(self, prev: "_Chunk | None", items: Tuple[Any, ...]) -> None:
+        self.prev = prev
+        self.items = items
+        self.length = (prev.length if prev else 0) + len(items)
+
+
+class PersistentList(Sequence):
+    """Immutable append-only sequence; extended() returns a new list sharing all existing chunks."""
+
+    __slots__ = ("_tail",)
+
+    def __init__(self, items: Iterable[Any] = ()) -> None:
+        self._tail: _Chunk | None = None
+        if items:
+            self._tail = _extend(None, tuple(items))
+
+    @classmethod
+    def _from_tail(cls, tail: _Chunk | None) -> "PersistentList":
+        out = cls.__new__(cls)
+        out._tail = tail
+        return out
+
+    def extended(self, items: Iterable[Any]) -> "PersistentList":
+        """New list with items appended; self is unchanged."""
+        if isinstance(items, PersistentList):
+            if items._tail is None:
+                return self
+            if self._tail is None:
+                return items
+        items = tuple(items)
+        if not items:
+            return self
+        return self._from_tail(_extend(self._tail, items))
+
+    def appended(self, item: Any) -> "PersistentList":
+        return self.extended((item,))
+
+    def append(self, item: Any) -> None:
+        raise TypeError("PersistentList is immutable: return the new items from the agent (or use .appended())")
+
+    def extend(self, items: Iterable[Any]) -> None:
+        raise TypeError("PersistentList is immutable: return the new items from the agent (or use .extended())")
+
+    def copy(self) -> list:
+        """Plain mutable list with the same items."""
+        return list(self)
+
+    def _chunks(self) -> list:
+        chunks = []
+        node = self._tail
+        while node is not None:
+            chunks.append(node.items)
+            node = node.prev
+        chunks.reverse()
+        return chunks
+
+    def __iter__(self) -> Iterator[Any]:
+        for chunk in self._chunks():
+            yield from chunk
+
+    def __reversed__(self) -> Iterator[Any]:
+        node = self._tail
+        while node is not None:
+            yield from reversed(node.items)
+            node = node.prev
+
+    def __len__(self) -> int:
+        return self._tail.length if self._tail else 0
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return PersistentList(list(self)[index])
+        n = len(self)
+        if index < 0:
+            index += n
+        if not 0 <= index < n:
+            raise IndexError("PersistentList index out of range")
+        node = self._tail
+        # Walk back from the tail: recent items (the common case) are found first
+        while index < node.length - len(node.items):
+            node = node.prev
+        return node.items[index - (node.length - len(node.items))]
+
+    def __add__(self, other: Iterable[Any]) -> "PersistentList":
+        return self.extended(other)
+
+    def __radd__(self, other: Iterable[Any]) -> "PersistentList":
+        return PersistentList(other).extended(self)
+
+    def __eq__(self, other: object) -> bool:
+        if self is other:
+            return True
+        if not isinstance(other, (list, tuple, PersistentList)):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __repr__(self) -> str:
+        return f"PersistentList({list(self)!r})"
+
+    def _asdict(self) -> dict:
+        return {"items": list(self)}
+
+    def __reduce__(self):
+        return (PersistentList, (list(self),))
+
+
+def _extend(tail: _Chunk | None, items: Tuple[Any, ...]) -> _Chunk:
+    start = 0
+    if tail is not None and len(tail.items) < CHUNK_SIZE:
+        # Top up the last chunk by replacing it (the old chunk object is untouched for older snapshots)
+        start = CHUNK_SIZE - len(tail.items)
+        tail = _Chunk(tail.prev, tail.items + items[:start])
+    for i in range(start, len(items), CHUNK_SIZE):
+        tail = _Chunk(tail, items[i:i + CHUNK_SIZE])
+    return tail
+
+
+# ---------------------------------------------------------------------------
+# PersistentDict (HAMT)
+# ---------------------------------------------------------------------------
+
+class _Bitmap:
+    __slots__ = ("bitmap", "slots")  # slots: leaves (hash, key, value) or sub-nodes, ordered by bit
+
+    def __init__(self, bitmap: int, slots: tuple) -> None:
+        self.bitmap = bitmap
+        self.slots = slots
+
+
+class _Collision:
+    __slots__ = ("hash", "leaves")  # keys whose full hashes are equal
+
+    def __init__(self, h: int, leaves: tuple) -> None:
+        self.hash = h
+        self.leaves = leaves
+
+
+def _hash(key: Any) -> int:
+    return hash(key) & ((1 << _HASH_BITS) - 1)
+
+
+def _pair(shift: int, a: tuple, b: tuple):
+    """Smallest subtree holding two leaves with different keys."""
+    if a[0] == b[0] or shift >= _HASH_BITS:
+        return _Collision(a[0], (a, b))
+    ia, ib = (a[0] >> shift) & _MASK, (b[0] >> shift) & _MASK
+    if ia == ib:
+        return _Bitmap(1 << ia, (_pair(shift + _BITS, a, b),))
+    return _Bitmap((1 << ia) | (1 << ib), (a, b) if ia < ib else (b, a))
+
+
+def _assoc(node, shift: int, leaf: tuple):
+    """Return (new node, added) with leaf set; node is returned unchanged if the value is identical."""
+    h, key, value = leaf
+    if isinstance(node, _Collision):
+        if h != node.hash:
+            return _assoc(_Bitmap(1 << ((node.hash >> shift) & _MASK), (node,)), shift, leaf)
+        for i, (_, k, v) in enumerate(node.leaves):
+            if k is key or k == key:
+                if v is value:
+                    return node, False
+                return _Collision(h, node.leaves[:i] + (leaf,) + node.leaves[i + 1:]), False
+        return _Collision(h, node.leaves + (leaf,)), True
+    bit = 1 << ((h >> shift) & _MASK)
+    idx = (node.bitmap & (bit - 1)).bit_count()
+    if not node.bitmap & bit:
+        return _Bitmap(node.bitmap | bit, node.slots[:idx] + (leaf,) + node.slots[idx:]), True
+    entry = node.slots[idx]
+    if isinstance(entry, tuple):
+        if entry[0] == h and (entry[1] is key or entry[1] == key):
+            if entry[2] is value:
+                return node, False
+            new_entry, added = leaf, False
+        else:
+            new_entry, added = _pair(shift + _BITS, entry, leaf), True
+    else:
+        new_entry, added = _assoc(entry, shift + _BITS, leaf)
+        if new_entry is entry:
+            return node, False
+    return _Bitmap(node.bitmap, node.slots[:idx] + (new_entry,) + node.slots[idx + 1:]), added
+
+
+def _find(node, h: int, key: Any) -> Any:
+    shift = 0
+    while True:
+        if isinstance(node, _Collision):
+            for _, k, v in node.leaves:
+                if k is key or k == key:
+                    return v
+            return _MISSING
+        bit = 1 << ((h >> shift) & _MASK)
+        if not node.bitmap & bit:
+            return _MISSING
+        entry = node.slots[(node.bitmap & (bit - 1)).bit_count()]
+        if isinstance(entry, tuple):
+            return entry[2] if entry[0] == h and (entry[1] is key or entry[1] == key) else _MISSING
+        node = entry
+        shift += _BITS
+
+
+def _leaves(node) -> Iterator[tuple]:
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        entries = node.leaves if isinstance(node, _Collision) else node.slots
+        for entry in reversed(entries):
+            if isinstance(entry, tuple):
+                yield entry
+            else:
+                stack.append(entry)
+
+
+_EMPTY_ROOT = _Bitmap(0, ())
+
+
+class PersistentDict(Mapping):
+    """Immutable mapping; set()/updated() return a new dict sharing every untouched subtree."""
+
+    __slots__ = ("_root", "_len")
+
+    def __init__(self, items: Mapping[Any, Any] | Iterable[Tuple[Any, Any]] = ()) -> None:
+        self._root = _EMPTY_ROOT
+        self._len = 0
+        if items:
+            other = self.updated(items)
+            self._root, self._len = other._root, other._len
+
+    @classmethod
+    def _make(cls, root, length: int) -> "PersistentDict":
+        out = cls.__new__(cls)
+        out._root = root
+        out._len = length
+        return out
+
+    def __getitem__(self, key: Any) -> Any:
+        value = _find(self._root, _hash(key), key)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key: Any) -> bool:
+        return _find(self._root, _hash(key), key) is not _MISSING
+
+    def __iter__(self) -> Iterator[Any]:
+        for _, key, _ in _leaves(self._root):
+            yield key
+
+    def __len__(self) -> int:
+        return self._len
+
+    def items(self):
+        return [(k, v) for _, k, v in _leaves(self._root)]
+
+    def set(self, key: Any, value: Any) -> "PersistentDict":
+        root, added = _assoc(self._root, 0, (_hash(key), key, value))
+        if root is self._root:
+            return self
+        return self._make(root, self._len + added)
+
+    def update(self, *args: Any, **kwargs: Any) -> None:
+        raise TypeError("PersistentDict is immutable: return the changed keys from the agent (or use .updated())")
+
+    def copy(self) -> dict:
+        """Plain mutable dict with the same entries."""
+        return dict(self.items())
+
+    def updated(self, other: Mapping[Any, Any] | Iterable[Tuple[Any, Any]]) -> "PersistentDict":
+        """New dict with other's entries applied (like {**self, **other}); O(len(other) * log n); self is unchanged."""
+        if other is self:
+            return self
+        if isinstance(other, PersistentDict) and not self._len:
+            return other
+        pairs = other.items() if isinstance(other, Mapping) else other
+        root, length = self._root, self._len
+        for key, value in pairs:
+            root, added = _assoc(root, 0, (_hash(key), key, value))
+            length += added
+        if root is self._root:
+            return self
+        return self._make(root, length)
+
+    def __eq__(self, other: object) -> bool:
+        if self is other:
+            return True
+        if not isinstance(other, Mapping):
+            return NotImplemented
+        return len(self) == len(other) and all(k in other and other[k] == v for k, v in self.items())
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __repr__(self) -> str:
+        return f"PersistentDict({dict(self.items())!r})"
+
+    def _asdict(self) -> dict:
+        return {"items": dict(self.items())}
+
+    def __reduce__(self):
+        return (PersistentDict, (dict(self.items()),))
+
+
+def as_persistent_list(value: Iterable[Any] | None) -> PersistentList:
+    return value if isinstance(value, PersistentList) else PersistentList(value or ())
+
+
+def as_persistent_dict(value: Mapping[Any, Any] | None) -> PersistentDict:
+    return value if isinstance(value, PersistentDict) else PersistentDict(value or {})
+
+
+def to_plain(value: Any) -> Any:
+    """Recursively convert persistent values to list/dict (for JSON responses, printing and checkpoints)."""
+    if isinstance(value, (PersistentDict, dict)):
+        return {k: to_plain(v) for k, v in value.items()}
+    if isinstance(value, (PersistentList, list)):
+        return [to_plain(v) for v in value]
+    if type(value) is tuple:
+        return tuple(to_plain(v) for v in value)
+    return value
+
+
+def checkpoint_serde(**kwargs: Any):
+    """
+    LangGraph JsonPlusSerializer that writes persistent values as plain list/dict, so checkpoints never depend on
+    msgpack rebuilding these classes (newer langgraph-checkpoint versions restrict which modules it may import).
+    Pass as serde= to SqliteSaver / MemorySaver.
+    """
+    from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+    class PlainStateSerializer(JsonPlusSerializer):
+        def dumps_typed(self, obj: Any):
+            return super().dumps_typed(to_plain(obj))
+
+        def dumps(self, obj: Any) -> bytes:
+            return super().dumps(to_plain(obj))
+
+    return PlainStateSerializer(**kwargs)
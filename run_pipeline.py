@@ -1,5 +1,6 @@
 """
-Run the full pipeline: (1) videos -> Gemini -> system_design.json, (2) JSON -> Claude -> agent code + master graph.
+Run the full pipeline: (1) videos -> Gemini -> system_design.json, (2) JSON -> Claude -> agent code
+(the master graph is compiled from the JSON at runtime).
 Usage:
   python run_pipeline.py [path_to_video_folder]
 If folder is omitted, uses DEFAULT_VIDEO_FOLDER below.
@@ -27,8 +28,8 @@ def main() -> None:
     else:
         print("system_design.json already exists. Skipping Step 1. Delete it to re-run from videos.")
 
-    # Step 2: system_design.json -> agent files + master_graph.py (Claude)
-    print("--- Step 2: System Design JSON -> Agents + Master Graph (Claude) ---")
+    # Step 2: system_design.json -> agent files (Claude); master_graph.py compiles the graph from the JSON
+    print("--- Step 2: System Design JSON -> Agents (Claude) ---")
     r = subprocess.run([sys.executable, str(root / "generate_agents_from_design.py")], cwd=root)
     sys.exit(r.returncode if r.returncode != 0 else 0)
 
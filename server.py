@@ -22,6 +22,13 @@ load_dotenv(ROOT / ".env")
 app = FastAPI(title="Recruitment workflow API", version="1.0")
 
 
+@app.on_event("startup")
+def warm_up_graph():
+    """AGENT_WARMUP=1: import the agents in the background so the first /run after a deploy is not cold."""
+    from graph_compiler import start_background_warm_up
+    start_background_warm_up()
+
+
 @app.get("/", response_class=PlainTextResponse)
 def root():
     return "Recruitment workflow server. GET /health to check. POST /run to trigger workflow (optional)."
@@ -43,6 +50,37 @@ def list_tool_bindings():
         return {"error": str(e), "bindings": {}}
 
 
+@app.get("/tools/resolved")
+def resolved_tool_bindings():
+    """Audit: the resolved per-agent table (tool name -> implementation) agents actually receive."""
+    try:
+        from tools import dump_bindings
+        return dump_bindings()
+    except Exception as e:
+        return {"error": str(e), "bindings": {}}
+
+
+@app.get("/tools/http")
+def tool_http_pools():
+    """Per-host connection pool stats for tool API calls (requests, errors, open/idle connections)."""
+    from tools.http_pool import pool_stats
+    return pool_stats()
+
+
+@app.get("/tools/rate-limits")
+def tool_rate_limits():
+    """Per integration: calls, throttled (429) / server / connection errors, retries, time spent waiting."""
+    from tools.rate_limit import rate_limit_stats
+    return rate_limit_stats()
+
+
+@app.get("/tools/heygen-jobs")
+def heygen_render_jobs():
+    """Tracked HeyGen renders per status and whether the background poller is running."""
+    from tools.heygen_jobs import tracker_stats
+    return tracker_stats()
+
+
 @app.get("/integrations/required")
 def integrations_required():
     """
@@ -90,7 +128,8 @@ def run_workflow(body: RunInput):
     queued tasks or webhook callbacks so the system runs autonomously.
     """
     try:
-        from master_graph import graph, RecruitmentState
+        from master_graph import get_graph, RecruitmentState
+        graph = get_graph()
         state = RecruitmentState(
             candidate_profile={},
             candidate_documents={},
@@ -7,7 +7,9 @@ from typing import Any, Callable, Dict, List
 
 from tools.registry import (
     get_tools_for_agent,
+    get_agent_config,
     list_bindings,
+    dump_bindings,
     get_agent_tool_names,
     required_integrations_for_agent,
     required_integrations_all,
@@ -16,11 +18,15 @@ from tools.registry import (
     normalize_design_tool,
     design_tool_to_registry_key,
     get_implementation,
+    reload_design,
 )
+from tools.async_tools import get_async_tools_for_agent, call_concurrently
 
 __all__ = [
     "get_tools_for_agent",
+    "get_agent_config",
     "list_bindings",
+    "dump_bindings",
     "get_agent_tool_names",
     "required_integrations_for_agent",
     "required_integrations_all",
@@ -30,6 +36,9 @@ __all__ = [
     "normalize_design_tool",
     "design_tool_to_registry_key",
     "get_implementation",
+    "reload_design",
+    "get_async_tools_for_agent",
+    "call_concurrently",
 ]
 
 
@@ -0,0 +1,76 @@
+"""
+Thread-offload shim for tool calls: awaitable wrappers around the sync tools, plus call_concurrently() for sync agents.
+This is not non-blocking I/O. Every in-flight call still occupies one thread of the shared tool I/O executor
+(TOOLS_ASYNC_WORKERS) while its sync implementation blocks on the vendor SDK / HTTP request. What it buys is that
+an event loop (Chainlit, async LangGraph nodes) is never blocked and that independent calls overlap, reusing
+tools.http_pool's keep-alive sessions. Truly thread-free calls would need async vendor clients.
+"""
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Tuple
+
+from tools.registry import get_tools_for_agent
+
+# Threads available for in-flight tool calls (shared by all agents; keep >= TOOLS_HTTP_POOL_MAXSIZE)
+ASYNC_WORKERS = int(os.environ.get("TOOLS_ASYNC_WORKERS", "32"))
+
+_EXECUTOR = ThreadPoolExecutor(max_workers=ASYNC_WORKERS, thread_name_prefix="tool-io")
+_WRAPPED: Dict[Callable[..., Any], Callable[..., Awaitable[Any]]] = {}
+# agent_id -> (sync table it was built from, async table); rebuilt when the design version changes
+_TABLES: Dict[Tuple[str, Path | None], Tuple[Mapping[str, Any], Mapping[str, Any]]] = {}
+_LOCK = threading.Lock()
+
+
+def to_async(fn: Callable[..., Any]) -> Callable[..., Awaitable[Any]]:
+    """Awaitable wrapper that runs a sync tool on the tool I/O executor (one wrapper per callable, so aliases stay identical)."""
+    wrapped = _WRAPPED.get(fn)
+    if wrapped is not None:
+        return wrapped
+
+    @functools.wraps(fn)
+    async def call(*args: Any, **kwargs: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        # Carry the caller's context (e.g. the agent's thread_id) onto the worker thread
+        ctx = contextvars.copy_context()
+        return await loop.run_in_executor(_EXECUTOR, functools.partial(ctx.run, fn, *args, **kwargs))
+
+    with _LOCK:
+        return _WRAPPED.setdefault(fn, call)
+
+
+def get_async_tools_for_agent(agent_id: str, design_path: Path | None = None) -> Mapping[str, Callable[..., Awaitable[Any]]]:
+    """
+    Same names as get_tools_for_agent, but each value is awaitable (offloaded to a worker thread), e.g.
+        results = await asyncio.gather(tools["instantly_add_leads"](...), tools["heygen_create_video"](...))
+    Returned as a read-only view built once per design version.
+    """
+    sync_tools = get_tools_for_agent(agent_id, design_path)
+    key = (agent_id, design_path)
+    cached = _TABLES.get(key)
+    if cached is not None and cached[0] is sync_tools:
+        return cached[1]
+    table = MappingProxyType({name: to_async(fn) for name, fn in sync_tools.items()})
+    with _LOCK:
+        _TABLES[key] = (sync_tools, table)
+    return table
+
+
+def call_concurrently(calls: List[Tuple[Callable[..., Any], Dict[str, Any]]]) -> List[Any]:
+    """
+    Sync shim for existing (non-async) agents: run [(tool, kwargs), ...] in parallel on the tool I/O executor
+    and return results in order. A tool that raises yields {"ok": False, "error": ...} like the tools themselves.
+    """
+    futures = [_EXECUTOR.submit(contextvars.copy_context().run, fn, **kwargs) for fn, kwargs in calls]
+    results: List[Any] = []
+    for future in futures:
+        try:
+            results.append(future.result())
+        except Exception as e:
+            results.append({"ok": False, "error": str(e)})
+    return results
@@ -5,12 +5,10 @@ Docs: https://docs.heygen.com/
 import os
 from typing import Any, Dict
 
-try:
-    import requests
-except ImportError:
-    requests = None
+from tools import heygen_jobs, http_pool, rate_limit
 
 BASE_URL = "https://api.heygen.com/v2"
+STATUS_URL = "https://api.heygen.com/v1/video_status.get"
 _API_KEY = os.environ.get("HEYGEN_API_KEY", "").strip()
 
 
@@ -23,12 +21,17 @@ def heygen_create_video(
     avatar_id: str | None = None,
     voice_id: str | None = None,
     title: str | None = None,
+    thread_id: str | None = None,
+    context: Dict[str, Any] | None = None,
 ) -> Dict[str, Any]:
     """
     Create an avatar video from script text.
-    Returns { ok, video_id?, status?, error? }. Poll video status for URL when ready.
+    Returns { ok, video_id?, status?, error? } without waiting for the render: the video is queued in
+    tools.heygen_jobs, which polls it in the background, calls registered callbacks (with context) and adds the
+    result to the LangGraph thread (thread_id) under data["heygen_videos"][video_id] on that thread's next run.
+    thread_id defaults to the thread of the agent node making the call (agent_context.current_thread_id).
     """
-    if not _API_KEY or not requests:
+    if not _API_KEY or not http_pool.available():
         return {"ok": False, "error": "HEYGEN_API_KEY not set or requests not installed", "stub": True}
     url = f"{BASE_URL}/video/generate"
     payload = {
@@ -37,10 +40,40 @@ def heygen_create_video(
         "title": title or "Recruitment outreach",
     }
     try:
-        r = requests.post(url, json=payload, headers=_headers(), timeout=60)
+        r = rate_limit.http_request(
+            "HEYGEN_API_KEY", "POST", url, json=payload, headers=_headers(), timeout=(http_pool.CONNECT_TIMEOUT, 60),
+            retry_unsafe=False,  # no idempotency key: a retried 5xx could render the video twice
+        )
         data = r.json() if r.text else {}
         if r.status_code >= 400:
             return {"ok": False, "error": data.get("message", r.text), "status_code": r.status_code}
-        return {"ok": True, "video_id": data.get("data", {}).get("video_id"), "status": data.get("data", {}).get("status")}
+        video_id = data.get("data", {}).get("video_id")
+    except Exception as e:
+        return {"ok": False, "error": str(e)}
+    if video_id:
+        if thread_id is None:
+            from agent_context import current_thread_id
+            thread_id = current_thread_id()
+        heygen_jobs.track_render(video_id, thread_id=thread_id, context=context)
+    return {"ok": True, "video_id": video_id, "status": data.get("data", {}).get("status") or "pending"}
+
+
+def heygen_video_status(video_id: str) -> Dict[str, Any]:
+    """One status check. Returns { ok, status? (pending|waiting|processing|completed|failed), video_url?, error? }."""
+    if not _API_KEY or not http_pool.available():
+        return {"ok": False, "error": "HEYGEN_API_KEY not set or requests not installed", "stub": True}
+    try:
+        r = rate_limit.http_request("HEYGEN_API_KEY", "GET", STATUS_URL, params={"video_id": video_id}, headers=_headers())
+        data = r.json() if r.text else {}
+        if r.status_code >= 400:
+            return {"ok": False, "error": data.get("message", r.text), "status_code": r.status_code}
+        info = data.get("data") or {}
+        error = info.get("error")
+        return {
+            "ok": True,
+            "status": info.get("status") or "pending",
+            "video_url": info.get("video_url") or "",
+            "error": (error.get("message") if isinstance(error, dict) else error) or "",
+        }
     except Exception as e:
         return {"ok": False, "error": str(e)}
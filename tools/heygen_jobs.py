@@ -0,0 +1,280 @@
+"""
+Background tracker for HeyGen renders: heygen_create_video() returns immediately and the video_id is queued here.
+Jobs persist in data/heygen_jobs.sqlite, so renders submitted before a restart are still followed up.
+A daemon thread sweeps due jobs in batches (up to HEYGEN_POLL_BATCH per sweep, polled concurrently under the
+HeyGen rate limit) with per-job exponential backoff, so hundreds of renders cost a few status calls a minute.
+When a render completes or fails, registered callbacks run. For jobs with a thread_id the result is kept until that
+LangGraph thread next runs: apply_render_updates() merges data["heygen_videos"][video_id] = { status, video_url,
+error } into the run's input, and mark_applied() retires the jobs once that run succeeded. Agents pass their
+context.thread_id (heygen_create_video defaults to it). The tracker never calls update_state itself, because a thread may be running or paused
+at an interrupt, and a background write would fork or advance its checkpoint.
+"""
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+ROOT = Path(__file__).resolve().parent.parent
+JOBS_PATH = Path(os.environ.get("HEYGEN_JOBS_PATH", str(ROOT / "data" / "heygen_jobs.sqlite")))
+POLL_BATCH = int(os.environ.get("HEYGEN_POLL_BATCH", "50"))
+POLL_CONCURRENCY = int(os.environ.get("HEYGEN_POLL_CONCURRENCY", "4"))
+# First poll after this many seconds, then doubling (with jitter) up to the cap
+POLL_INITIAL_DELAY = float(os.environ.get("HEYGEN_POLL_INITIAL_DELAY", "20"))
+POLL_MAX_DELAY = float(os.environ.get("HEYGEN_POLL_MAX_DELAY", "300"))
+# Give up on renders still unfinished after this long
+JOB_TIMEOUT = float(os.environ.get("HEYGEN_JOB_TIMEOUT", str(6 * 3600)))
+
+TERMINAL = {"completed", "failed", "timeout"}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    video_id TEXT PRIMARY KEY,
+    thread_id TEXT,
+    context TEXT NOT NULL DEFAULT '{}',
+    status TEXT NOT NULL DEFAULT 'pending',
+    video_url TEXT NOT NULL DEFAULT '',
+    error TEXT NOT NULL DEFAULT '',
+    submitted_at REAL NOT NULL,
+    next_poll_at REAL NOT NULL,
+    polls INTEGER NOT NULL DEFAULT 0,
+    notified INTEGER NOT NULL DEFAULT 0,
+    applied INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS jobs_due ON jobs (notified, next_poll_at);
+"""
+
+_COLUMNS = (
+    "video_id", "thread_id", "context", "status", "video_url", "error", "submitted_at", "next_poll_at", "polls",
+    "notified", "applied",
+)
+
+
+def _next_delay(polls: int) -> float:
+    return min(POLL_MAX_DELAY, POLL_INITIAL_DELAY * (2 ** polls)) * random.uniform(0.8, 1.2)
+
+
+class RenderJobStore:
+    """SQLite-backed job queue (one shared connection guarded by a lock)."""
+
+    def __init__(self, path: Path = JOBS_PATH) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._conn.executescript(_SCHEMA)
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+            if "applied" not in columns:  # job stores created before results were applied on the next run
+                with self._conn:
+                    self._conn.execute("ALTER TABLE jobs ADD COLUMN applied INTEGER NOT NULL DEFAULT 0")
+        return self._conn
+
+    def add(self, video_id: str, thread_id: str | None, context: Dict[str, Any] | None) -> None:
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            with db:
+                db.execute(
+                    "INSERT OR IGNORE INTO jobs (video_id, thread_id, context, submitted_at, next_poll_at) VALUES (?, ?, ?, ?, ?)",
+                    (video_id, thread_id, json.dumps(context or {}, default=str), now, now + _next_delay(0)),
+                )
+
+    def due(self, limit: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._db().execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE notified = 0 AND next_poll_at <= ? ORDER BY next_poll_at LIMIT ?",
+                (time.time(), limit),
+            ).fetchall()
+        return [self._row(r) for r in rows]
+
+    def next_due_at(self) -> float | None:
+        with self._lock:
+            row = self._db().execute("SELECT MIN(next_poll_at) FROM jobs WHERE notified = 0").fetchone()
+        return row[0] if row else None
+
+    def update(self, job: Dict[str, Any]) -> None:
+        with self._lock:
+            db = self._db()
+            with db:
+                db.execute(
+                    "UPDATE jobs SET status = ?, video_url = ?, error = ?, next_poll_at = ?, polls = ?, notified = ? WHERE video_id = ?",
+                    (job["status"], job["video_url"], job["error"], job["next_poll_at"], job["polls"], job["notified"], job["video_id"]),
+                )
+
+    def get(self, video_id: str) -> Dict[str, Any] | None:
+        with self._lock:
+            row = self._db().execute(f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE video_id = ?", (video_id,)).fetchone()
+        return self._row(row) if row else None
+
+    def unapplied(self, thread_id: str) -> List[Dict[str, Any]]:
+        """Finished jobs of a thread whose result has not been written into the thread yet."""
+        with self._lock:
+            rows = self._db().execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE thread_id = ? AND notified = 1 AND applied = 0 ORDER BY submitted_at",
+                (thread_id,),
+            ).fetchall()
+        return [self._row(r) for r in rows]
+
+    def mark_applied(self, video_ids: List[str]) -> None:
+        with self._lock:
+            db = self._db()
+            with db:
+                db.executemany("UPDATE jobs SET applied = 1 WHERE video_id = ?", [(v,) for v in video_ids])
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._db().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: n for status, n in rows}
+
+    @staticmethod
+    def _row(row: tuple) -> Dict[str, Any]:
+        job = dict(zip(_COLUMNS, row))
+        job["context"] = json.loads(job["context"] or "{}")
+        return job
+
+
+_STORE = RenderJobStore()
+_CALLBACKS: List[Callable[[Dict[str, Any]], None]] = []
+_WAKE = threading.Event()
+_STOP = threading.Event()
+_THREAD: threading.Thread | None = None
+_LOCK = threading.Lock()
+
+
+def track_render(video_id: str, thread_id: str | None = None, context: Dict[str, Any] | None = None) -> None:
+    """Queue a submitted render for background polling (idempotent per video_id)."""
+    _STORE.add(video_id, thread_id, context)
+    start_render_tracker()
+
+
+def render_job(video_id: str) -> Dict[str, Any] | None:
+    """Current tracked state of one render (status, video_url, error, polls, ...)."""
+    return _STORE.get(video_id)
+
+
+def on_render_done(callback: Callable[[Dict[str, Any]], None]) -> None:
+    """Call callback(job) once per render that completes, fails or times out."""
+    with _LOCK:
+        if callback not in _CALLBACKS:
+            _CALLBACKS.append(callback)
+
+
+def apply_render_updates(graph: Any, config: Dict[str, Any], graph_input: Any) -> tuple[Any, List[str]]:
+    """
+    Merge renders finished since the thread last ran into the input of its next run (call right before
+    graph.stream/invoke). Returns (graph_input, video_ids); pass video_ids to mark_applied() once the run
+    succeeded, so a failed run gets the same renders again next time (re-applying them is harmless).
+    graph_input is returned unchanged, with no ids, when there is nothing to apply or no input dict.
+    """
+    thread_id = (config.get("configurable") or {}).get("thread_id")
+    if not thread_id or not isinstance(graph_input, dict):
+        return graph_input, []
+    jobs = _STORE.unapplied(thread_id)
+    if not jobs:
+        return graph_input, []
+    snapshot = graph.get_state(config)
+    data = (getattr(snapshot, "values", None) or {}).get("data") or {}
+    # data is merged shallowly by the reducer, so send the whole heygen_videos map
+    videos = dict(data.get("heygen_videos") or {})
+    for job in jobs:
+        videos[job["video_id"]] = {"status": job["status"], "video_url": job["video_url"], "error": job["error"], **job["context"]}
+    merged = {**graph_input, "data": {**(graph_input.get("data") or {}), "heygen_videos": videos}}
+    return merged, [job["video_id"] for job in jobs]
+
+
+def mark_applied(video_ids: List[str]) -> None:
+    """Record that these renders reached their thread (after the run that carried them succeeded)."""
+    if video_ids:
+        _STORE.mark_applied(video_ids)
+
+
+def _notify(job: Dict[str, Any]) -> None:
+    with _LOCK:
+        callbacks = list(_CALLBACKS)
+    for callback in callbacks:
+        try:
+            callback(job)
+        except Exception:
+            logger.exception("HeyGen render callback failed for %s", job["video_id"])
+
+
+def _poll(job: Dict[str, Any]) -> Dict[str, Any]:
+    from tools.heygen import heygen_video_status
+
+    now = time.time()
+    result = heygen_video_status(job["video_id"])
+    job = {**job, "polls": job["polls"] + 1}
+    if result.get("ok"):
+        job["status"] = result["status"]
+        job["video_url"] = result.get("video_url") or job["video_url"]
+        job["error"] = result.get("error") or ""
+    elif not result.get("stub"):
+        job["error"] = result.get("error") or ""
+    if job["status"] not in TERMINAL and now - job["submitted_at"] > JOB_TIMEOUT:
+        job["status"] = "timeout"
+    job["next_poll_at"] = now + _next_delay(job["polls"])
+    return job
+
+
+def sweep(limit: int = POLL_BATCH) -> int:
+    """Poll every due job (up to limit) concurrently; returns how many were polled."""
+    jobs = _STORE.due(limit)
+    if not jobs:
+        return 0
+    with ThreadPoolExecutor(max_workers=max(1, min(POLL_CONCURRENCY, len(jobs))), thread_name_prefix="heygen-poll") as pool:
+        polled = list(pool.map(_poll, jobs))
+    for job in polled:
+        if job["status"] in TERMINAL:
+            job["notified"] = 1
+            _STORE.update(job)
+            _notify(job)
+        else:
+            _STORE.update(job)
+    return len(polled)
+
+
+def _run() -> None:
+    while not _STOP.is_set():
+        try:
+            if sweep() >= POLL_BATCH:
+                continue  # more jobs already due
+            next_at = _STORE.next_due_at()
+        except Exception:
+            logger.exception("HeyGen render sweep failed")
+            next_at = time.time() + POLL_INITIAL_DELAY
+        timeout = POLL_MAX_DELAY if next_at is None else min(POLL_MAX_DELAY, max(0.5, next_at - time.time()))
+        _WAKE.wait(timeout)
+        _WAKE.clear()
+
+
+def start_render_tracker() -> None:
+    """Start the background poller once per process (also picks up jobs persisted by earlier runs)."""
+    global _THREAD
+    with _LOCK:
+        if _THREAD is None or not _THREAD.is_alive():
+            _STOP.clear()
+            _THREAD = threading.Thread(target=_run, name="heygen-render-tracker", daemon=True)
+            _THREAD.start()
+        else:
+            _WAKE.set()
+
+
+def stop_render_tracker() -> None:
+    _STOP.set()
+    _WAKE.set()
+
+
+def tracker_stats() -> Dict[str, Any]:
+    """Jobs per status plus whether the poller is running."""
+    return {"jobs": _STORE.counts(), "running": bool(_THREAD and _THREAD.is_alive())}
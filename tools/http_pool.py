@@ -0,0 +1,112 @@
+"""
+Shared HTTP client layer for tool modules: one requests.Session per host (scheme://netloc) with a
+keep-alive connection pool, so repeated Instantly/HeyGen/Stripe calls reuse TCP+TLS connections.
+Sessions are created once under a lock and shared across threads (urllib3 pools are thread-safe).
+Pool sizes and timeouts come from env (see .env.example); pool_stats() reports per-host usage.
+"""
+import os
+import threading
+from typing import Any, Dict, Tuple
+from urllib.parse import urlsplit
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+except ImportError:
+    requests = None
+    HTTPAdapter = None
+
+# Distinct hosts kept per session adapter, and max open connections per host (= concurrent calls without blocking)
+POOL_CONNECTIONS = int(os.environ.get("TOOLS_HTTP_POOL_CONNECTIONS", "4"))
+POOL_MAXSIZE = int(os.environ.get("TOOLS_HTTP_POOL_MAXSIZE", "16"))
+CONNECT_TIMEOUT = float(os.environ.get("TOOLS_HTTP_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.environ.get("TOOLS_HTTP_READ_TIMEOUT", "30"))
+
+_SESSIONS: Dict[str, Any] = {}
+_STATS: Dict[str, Dict[str, int]] = {}
+_LOCK = threading.Lock()
+
+
+def available() -> bool:
+    """True if requests is installed."""
+    return requests is not None
+
+
+def host_key(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def session_for(url: str):
+    """Shared keep-alive session for the URL's host (created on first use)."""
+    if requests is None:
+        raise RuntimeError("requests not installed")
+    key = host_key(url)
+    session = _SESSIONS.get(key)
+    if session is not None:
+        return session
+    with _LOCK:
+        session = _SESSIONS.get(key)
+        if session is None:
+            session = requests.Session()
+            # Blocking pool: bursts wait for a free connection instead of opening throwaway ones
+            adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, pool_block=True, max_retries=0)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _SESSIONS[key] = session
+            _STATS[key] = {"requests": 0, "errors": 0}
+        return session
+
+
+def _count(key: str, field: str) -> None:
+    with _LOCK:
+        _STATS.setdefault(key, {"requests": 0, "errors": 0})[field] += 1
+
+
+def request(method: str, url: str, timeout: float | Tuple[float, float] | None = None, **kwargs: Any):
+    """Send a request on the host's pooled session; timeout defaults to (CONNECT_TIMEOUT, READ_TIMEOUT)."""
+    key = host_key(url)
+    session = session_for(url)
+    _count(key, "requests")
+    try:
+        return session.request(method, url, timeout=timeout or (CONNECT_TIMEOUT, READ_TIMEOUT), **kwargs)
+    except Exception:
+        _count(key, "errors")
+        raise
+
+
+def get(url: str, **kwargs: Any):
+    return request("GET", url, **kwargs)
+
+
+def post(url: str, **kwargs: Any):
+    return request("POST", url, **kwargs)
+
+
+def pool_stats() -> Dict[str, Dict[str, Any]]:
+    """Per host: requests/errors sent through this layer plus open and idle pooled connections."""
+    out: Dict[str, Dict[str, Any]] = {}
+    with _LOCK:
+        sessions = dict(_SESSIONS)
+        counters = {k: dict(v) for k, v in _STATS.items()}
+    for key, session in sessions.items():
+        opened = idle = 0
+        adapter = session.get_adapter(key + "/")
+        for pool_key in list(adapter.poolmanager.pools.keys()):
+            pool = adapter.poolmanager.pools.get(pool_key)
+            if pool is None:
+                continue
+            opened += pool.num_connections
+            # The pool queue holds None placeholders for slots that never opened a connection
+            idle += sum(1 for conn in list(getattr(pool.pool, "queue", ())) if conn is not None)
+        out[key] = {**counters.get(key, {}), "connections_opened": opened, "idle_connections": idle, "pool_maxsize": POOL_MAXSIZE}
+    return out
+
+
+def close_all() -> None:
+    """Close every pooled session (e.g. on server shutdown)."""
+    with _LOCK:
+        sessions = list(_SESSIONS.values())
+        _SESSIONS.clear()
+    for session in sessions:
+        session.close()
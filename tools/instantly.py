@@ -3,15 +3,16 @@ Instantly.ai API (outreach / cold email). Use for outreach and email automation
 API v2: https://developer.instantly.ai/
 """
 import os
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Dict, List
 
-try:
-    import requests
-except ImportError:
-    requests = None
+from tools import http_pool, rate_limit
 
 BASE_URL = "https://api.instantly.ai/api/v2"
 _API_KEY = os.environ.get("INSTANTLY_API_KEY", "").strip()
+# Bulk lead ingestion: leads per /lead/add call and calls in flight at once
+LEADS_CHUNK_SIZE = int(os.environ.get("INSTANTLY_LEADS_CHUNK_SIZE", "500"))
+LEADS_CONCURRENCY = int(os.environ.get("INSTANTLY_LEADS_CONCURRENCY", "4"))
 
 
 def _headers() -> Dict[str, str]:
@@ -24,7 +25,7 @@ def instantly_send_campaign(
     variables: Dict[str, str] | None = None,
 ) -> Dict[str, Any]:
     """Launch or add to an Instantly campaign. Returns API response or error dict."""
-    if not _API_KEY or not requests:
+    if not _API_KEY or not http_pool.available():
         return {"ok": False, "error": "INSTANTLY_API_KEY not set or requests not installed", "stub": True}
     url = f"{BASE_URL}/campaign/launch"
     payload = {
@@ -33,35 +34,103 @@ def instantly_send_campaign(
         "variables": variables or {},
     }
     try:
-        r = requests.post(url, json=payload, headers=_headers(), timeout=30)
+        r = rate_limit.http_request("INSTANTLY_API_KEY", "POST", url, retry_unsafe=False, json=payload, headers=_headers())
         return {"ok": r.status_code < 400, "status_code": r.status_code, "body": r.json() if r.text else {}}
     except Exception as e:
         return {"ok": False, "error": str(e)}
 
 
-def instantly_add_leads(
-    campaign_id: str,
-    leads: List[Dict[str, Any]],
-) -> Dict[str, Any]:
-    """Add leads to an Instantly campaign. Each lead: { email, first_name?, last_name?, company_name? }."""
-    if not _API_KEY or not requests:
-        return {"ok": False, "error": "INSTANTLY_API_KEY not set or requests not installed", "stub": True}
+def _post_leads(campaign_id: str, leads: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """One /lead/add call. Returns { ok, status_code?, body?, error? }."""
     url = f"{BASE_URL}/lead/add"
     payload = {"campaign_id": campaign_id, "leads": leads}
     try:
-        r = requests.post(url, json=payload, headers=_headers(), timeout=30)
+        r = rate_limit.http_request("INSTANTLY_API_KEY", "POST", url, retry_unsafe=False, json=payload, headers=_headers())
         return {"ok": r.status_code < 400, "status_code": r.status_code, "body": r.json() if r.text else {}}
     except Exception as e:
         return {"ok": False, "error": str(e)}
 
 
+def _dedupe_leads(leads: List[Any]) -> tuple[List[Dict[str, Any]], List[int], Dict[int, Dict[str, Any]]]:
+    """
+    Validate and dedupe leads by case-insensitive email (first wins).
+    Returns (unique leads, their input positions, input position -> result for invalid/duplicate leads).
+    """
+    unique: List[Dict[str, Any]] = []
+    positions: List[int] = []
+    skipped: Dict[int, Dict[str, Any]] = {}
+    seen: set = set()
+    for i, lead in enumerate(leads):
+        if not isinstance(lead, dict):
+            skipped[i] = {"email": str(lead) if isinstance(lead, str) else "", "status": "invalid", "error": "lead must be an object with an email"}
+            continue
+        email = str(lead.get("email") or "").strip()
+        key = email.lower()
+        if "@" not in key:
+            skipped[i] = {"email": email, "status": "invalid", "error": "missing or invalid email"}
+        elif key in seen:
+            skipped[i] = {"email": email, "status": "duplicate"}
+        else:
+            seen.add(key)
+            unique.append({**lead, "email": email})
+            positions.append(i)
+    return unique, positions, skipped
+
+
+def instantly_add_leads(
+    campaign_id: str,
+    leads: List[Dict[str, Any]],
+    chunk_size: int | None = None,
+    concurrency: int | None = None,
+) -> Dict[str, Any]:
+    """
+    Add leads to an Instantly campaign. Each lead: { email, first_name?, last_name?, company_name? }.
+    Any number of leads: deduped by email, split into chunk_size batches, up to `concurrency` batches in flight.
+    Returns { ok, summary: {received, unique, duplicates, invalid, added, failed, chunks, failed_chunks},
+    results: [{ email, status: added|failed|duplicate|invalid, error? }] (input order), chunks: [per-call result] }.
+    """
+    if not _API_KEY or not http_pool.available():
+        return {"ok": False, "error": "INSTANTLY_API_KEY not set or requests not installed", "stub": True}
+    leads = list(leads or [])
+    unique, positions, skipped = _dedupe_leads(leads)
+    size = max(1, chunk_size or LEADS_CHUNK_SIZE)
+    chunks = [unique[i:i + size] for i in range(0, len(unique), size)]
+    workers = max(1, min(concurrency or LEADS_CONCURRENCY, len(chunks) or 1))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="instantly-leads") as pool:
+        chunk_results = list(pool.map(lambda chunk: _post_leads(campaign_id, chunk), chunks))
+
+    results_at: Dict[int, Dict[str, Any]] = dict(skipped)
+    start = 0
+    for chunk, res in zip(chunks, chunk_results):
+        for lead, pos in zip(chunk, positions[start:start + len(chunk)]):
+            entry = {"email": lead["email"], "status": "added" if res["ok"] else "failed"}
+            if not res["ok"]:
+                entry["error"] = res.get("error") or f"HTTP {res.get('status_code')}"
+            results_at[pos] = entry
+        start += len(chunk)
+    results = [results_at[i] for i in range(len(leads))]
+
+    counts = {status: sum(1 for r in results if r["status"] == status) for status in ("added", "failed", "duplicate", "invalid")}
+    summary = {
+        "received": len(results),
+        "unique": len(unique),
+        "duplicates": counts["duplicate"],
+        "invalid": counts["invalid"],
+        "added": counts["added"],
+        "failed": counts["failed"],
+        "chunks": len(chunks),
+        "failed_chunks": sum(1 for r in chunk_results if not r["ok"]),
+    }
+    return {"ok": summary["failed"] == 0, "summary": summary, "results": results, "chunks": chunk_results}
+
+
 def instantly_get_campaigns() -> Dict[str, Any]:
     """List Instantly campaigns."""
-    if not _API_KEY or not requests:
+    if not _API_KEY or not http_pool.available():
         return {"ok": False, "error": "INSTANTLY_API_KEY not set or requests not installed", "campaigns": [], "stub": True}
     url = f"{BASE_URL}/campaign/list"
     try:
-        r = requests.get(url, headers=_headers(), timeout=30)
+        r = rate_limit.http_request("INSTANTLY_API_KEY", "GET", url, headers=_headers())
         data = r.json() if r.text else {}
         return {"ok": r.status_code < 400, "campaigns": data.get("campaigns", data) if isinstance(data, dict) else []}
     except Exception as e:
@@ -0,0 +1,251 @@
+"""
+Shared client-side rate limiting and retries for tool API calls.
+One token bucket and retry budget per integration credential (env var, e.g. INSTANTLY_API_KEY), sized from the
+"rps"/"burst" fields of tools.registry.INTEGRATION_INFO, since vendors rate-limit per API key.
+429 / 5xx / connection errors are retried with exponential backoff and jitter, honouring Retry-After; a 429 also
+pauses the whole bucket so concurrent callers slow down together instead of piling on. Retries are capped per
+call (TOOLS_RETRY_MAX_ATTEMPTS) and per integration by a budget (retries <= TOOLS_RETRY_BUDGET_RATIO of calls).
+rate_limit_stats() reports throttling per integration.
+"""
+import email.utils
+import os
+import random
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Tuple
+
+from tools import http_pool
+
+MAX_ATTEMPTS = int(os.environ.get("TOOLS_RETRY_MAX_ATTEMPTS", "4"))
+BACKOFF_BASE = float(os.environ.get("TOOLS_RETRY_BACKOFF_BASE", "0.5"))
+BACKOFF_CAP = float(os.environ.get("TOOLS_RETRY_BACKOFF_CAP", "30"))
+# Retries may use at most this fraction of calls, plus a small reserve so a quiet integration can still retry
+BUDGET_RATIO = float(os.environ.get("TOOLS_RETRY_BUDGET_RATIO", "0.2"))
+BUDGET_RESERVE = 10.0
+
+# Used for integrations without rps/burst in INTEGRATION_INFO
+DEFAULT_RPS = 5.0
+DEFAULT_BURST = 10.0
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+# requests / stripe / builtin exception class names (or bases) that mean the call never got a response
+_CONNECTION_ERRORS = {"ConnectionError", "Timeout", "TimeoutError", "APIConnectionError"}
+# requests / urllib3 errors raised before the request was sent (safe to retry even for non-idempotent writes)
+_CONNECT_ERRORS = {"ConnectTimeout", "ConnectTimeoutError", "NewConnectionError", "NameResolutionError"}
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens/sec up to `burst`; acquire() blocks until a token is free."""
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = max(rate, 1e-6)
+        self.burst = max(burst, 1.0)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self) -> float:
+        """Take one token; returns seconds spent waiting."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self._paused_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = max(self._paused_until - now, (1 - self._tokens) / self.rate)
+            time.sleep(delay)
+            waited += delay
+
+    def pause(self, seconds: float) -> None:
+        """Hold every caller for `seconds` (server said slow down) and drop the saved-up burst."""
+        with self._lock:
+            now = time.monotonic()
+            self._paused_until = max(self._paused_until, now + seconds)
+            self._tokens = 0.0
+            self._updated = now
+
+
+class RetryBudget:
+    """Each call deposits BUDGET_RATIO of a token, each retry withdraws one; stops retry storms under outages."""
+
+    def __init__(self, ratio: float = BUDGET_RATIO, reserve: float = BUDGET_RESERVE) -> None:
+        self.ratio = ratio
+        self.cap = reserve
+        self._balance = reserve
+        self._lock = threading.Lock()
+
+    def deposit(self) -> None:
+        with self._lock:
+            self._balance = min(self.cap, self._balance + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self._balance < 1:
+                return False
+            self._balance -= 1
+            return True
+
+
+class _Limiter:
+    def __init__(self, name: str, rate: float, burst: float) -> None:
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.budget = RetryBudget()
+        self.stats: Dict[str, float] = {
+            "calls": 0, "attempts": 0, "throttled": 0, "server_errors": 0, "connection_errors": 0,
+            "retries": 0, "budget_exhausted": 0, "gave_up": 0, "wait_seconds": 0.0, "backoff_seconds": 0.0,
+            "rps": rate, "burst": burst,
+        }
+        self._lock = threading.Lock()
+
+    def count(self, field: str, amount: float = 1) -> None:
+        with self._lock:
+            self.stats[field] += amount
+
+
+_LIMITERS: Dict[str, _Limiter] = {}
+_LOCK = threading.Lock()
+
+
+def limiter(env_var: str) -> _Limiter:
+    """Limiter for one integration credential (created on first use from INTEGRATION_INFO)."""
+    lim = _LIMITERS.get(env_var)
+    if lim is not None:
+        return lim
+    from tools.registry import INTEGRATION_INFO
+
+    info = next((i for i in INTEGRATION_INFO.values() if i.get("env_var") == env_var and "rps" in i), {})
+    with _LOCK:
+        if env_var not in _LIMITERS:
+            _LIMITERS[env_var] = _Limiter(
+                env_var,
+                float(info.get("rps", DEFAULT_RPS)),
+                float(info.get("burst", DEFAULT_BURST)),
+            )
+        return _LIMITERS[env_var]
+
+
+def parse_retry_after(value: Any) -> float | None:
+    """Seconds from a Retry-After header (delta-seconds or HTTP-date), or None."""
+    if value in (None, ""):
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(str(value)).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def backoff_delay(attempt: int, retry_after: float | None = None) -> float:
+    """Full-jitter exponential backoff for the given retry number (0-based); Retry-After wins when longer."""
+    delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt)))
+    return max(delay, retry_after or 0.0)
+
+
+def _classify(result: Any, exc: BaseException | None) -> Tuple[str | None, float | None]:
+    """("throttled" | "server_errors" | "connection_errors" | None, Retry-After seconds) for a response or error."""
+    if exc is not None:
+        status = getattr(exc, "http_status", None) or getattr(getattr(exc, "response", None), "status_code", None)
+        headers = getattr(exc, "headers", None) or getattr(getattr(exc, "response", None), "headers", None) or {}
+        retry_after = parse_retry_after(headers.get("Retry-After")) if hasattr(headers, "get") else None
+        if status == 429:
+            return "throttled", retry_after
+        if status in RETRYABLE_STATUS:
+            return "server_errors", retry_after
+        if status is None and any(c.__name__ in _CONNECTION_ERRORS for c in type(exc).__mro__):
+            return "connection_errors", None
+        return None, None
+    status = getattr(result, "status_code", None)
+    if status in RETRYABLE_STATUS:
+        retry_after = parse_retry_after(result.headers.get("Retry-After"))
+        return ("throttled" if status == 429 else "server_errors"), retry_after
+    return None, None
+
+
+def _never_sent(exc: BaseException | None) -> bool:
+    """True if exc means the connection was never established (requests wraps urllib3's reason in args[0])."""
+    seen = 0
+    while exc is not None and seen < 5:
+        if any(c.__name__ in _CONNECT_ERRORS for c in type(exc).__mro__):
+            return True
+        inner = exc.args[0] if exc.args and isinstance(exc.args[0], BaseException) else None
+        exc = getattr(inner, "reason", None) if isinstance(getattr(inner, "reason", None), BaseException) else inner
+        seen += 1
+    return False
+
+
+def call_limited(env_var: str, fn: Callable[..., Any], *args: Any, retry_unsafe: bool = True, **kwargs: Any) -> Any:
+    """
+    Call fn under the integration's rate limit, retrying throttling and transient failures.
+    fn returns a requests.Response (retryable by status) or raises (Stripe errors, connection errors).
+    retry_unsafe=False (non-idempotent writes without an idempotency key): only 429s and connect failures are
+    retried, since the server never acted on those; 5xx and read timeouts may have been applied already.
+    Returns the last response / re-raises the last error once attempts or the retry budget run out.
+    """
+    lim = limiter(env_var)
+    lim.count("calls")
+    lim.budget.deposit()
+    attempt = 0
+    while True:
+        lim.count("wait_seconds", lim.bucket.acquire())
+        lim.count("attempts")
+        result, exc = None, None
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            exc = e
+        kind, retry_after = _classify(result, exc)
+        if kind is None:
+            if exc is not None:
+                raise exc
+            return result
+        lim.count(kind)
+        if kind == "throttled":
+            lim.bucket.pause(retry_after if retry_after is not None else backoff_delay(attempt))
+        safe = retry_unsafe or kind == "throttled" or (kind == "connection_errors" and _never_sent(exc))
+        give_up = not safe or attempt + 1 >= MAX_ATTEMPTS
+        if not give_up and not lim.budget.withdraw():
+            lim.count("budget_exhausted")
+            give_up = True
+        if give_up:
+            lim.count("gave_up")
+            if exc is not None:
+                raise exc
+            return result
+        delay = backoff_delay(attempt, retry_after)
+        lim.count("retries")
+        lim.count("backoff_seconds", delay)
+        time.sleep(delay)
+        attempt += 1
+
+
+def http_request(env_var: str, method: str, url: str, retry_unsafe: bool = True, **kwargs: Any):
+    """tools.http_pool.request under the integration's rate limit and retry policy."""
+    return call_limited(env_var, http_pool.request, method, url, retry_unsafe=retry_unsafe, **kwargs)
+
+
+def idempotency_key() -> str:
+    """Fresh key for one logical write; pass the same key on every retry of that write."""
+    return uuid.uuid4().hex
+
+
+def rate_limit_stats() -> Dict[str, Dict[str, float]]:
+    """Per integration env var: calls, attempts, throttled/server/connection errors, retries, waits."""
+    with _LOCK:
+        limiters = list(_LIMITERS.values())
+    out = {}
+    for lim in limiters:
+        with lim._lock:
+            out[lim.name] = dict(lim.stats)
+    return out
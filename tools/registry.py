@@ -2,36 +2,41 @@
 Global tool registry: every design-declared tool maps to an implementation (real API or stub).
 Any agent gets exactly the tools its system_design.json entry declares.
 """
+import functools
 import json
 import os
 import re
+import threading
 from pathlib import Path
-from typing import Any, Callable, Dict, List, TypedDict
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Iterable, List, Mapping, NamedTuple, Tuple, TypedDict
 
 # Real API implementations
 from tools.instantly import instantly_send_campaign, instantly_add_leads, instantly_get_campaigns
 from tools.heygen import heygen_create_video
-from tools.stripe_tools import stripe_create_invoice, stripe_create_customer
+from tools.stripe_tools import stripe_create_invoice, stripe_create_invoices, stripe_create_customer
 
 # Implementation names agents can call by (in addition to design-normalized keys)
 IMPLEMENTATION_NAMES = [
     "instantly_send_campaign", "instantly_add_leads", "instantly_get_campaigns",
-    "heygen_create_video", "stripe_create_invoice", "stripe_create_customer",
+    "heygen_create_video", "stripe_create_invoice", "stripe_create_invoices", "stripe_create_customer",
 ]
 
 # Real integrations: registry_key -> env var and label. Missing = stub only (user must add integration).
-INTEGRATION_INFO: Dict[str, Dict[str, str]] = {
-    "instantly_send_campaign": {"env_var": "INSTANTLY_API_KEY", "name": "Instantly (outreach)", "docs": "https://developer.instantly.ai/"},
-    "instantly_add_leads": {"env_var": "INSTANTLY_API_KEY", "name": "Instantly (outreach)", "docs": "https://developer.instantly.ai/"},
-    "instantly_get_campaigns": {"env_var": "INSTANTLY_API_KEY", "name": "Instantly (outreach)", "docs": "https://developer.instantly.ai/"},
-    "email_automation": {"env_var": "INSTANTLY_API_KEY", "name": "Instantly (email)", "docs": "https://developer.instantly.ai/"},
-    "email_marketing_platform": {"env_var": "INSTANTLY_API_KEY", "name": "Instantly (email)", "docs": "https://developer.instantly.ai/"},
-    "heygen_create_video": {"env_var": "HEYGEN_API_KEY", "name": "HeyGen (video)", "docs": "https://docs.heygen.com/"},
-    "video_generation": {"env_var": "HEYGEN_API_KEY", "name": "HeyGen (video)", "docs": "https://docs.heygen.com/"},
-    "stripe_create_invoice": {"env_var": "STRIPE_SECRET_KEY", "name": "Stripe (billing)", "docs": "https://dashboard.stripe.com/apikeys"},
-    "stripe_create_customer": {"env_var": "STRIPE_SECRET_KEY", "name": "Stripe (billing)", "docs": "https://dashboard.stripe.com/apikeys"},
-    "invoicing_software": {"env_var": "STRIPE_SECRET_KEY", "name": "Stripe (invoicing)", "docs": "https://dashboard.stripe.com/apikeys"},
-    "invoicing": {"env_var": "STRIPE_SECRET_KEY", "name": "Stripe (invoicing)", "docs": "https://dashboard.stripe.com/apikeys"},
+# rps/burst: client-side request rate per API key (tools.rate_limit; entries sharing an env var share one bucket).
+INTEGRATION_INFO: Dict[str, Dict[str, Any]] = {
+    "instantly_send_campaign": {"env_var": "INSTANTLY_API_KEY", "rps": 10, "burst": 20, "name": "Instantly (outreach)", "docs": "https://developer.instantly.ai/"},
+    "instantly_add_leads": {"env_var": "INSTANTLY_API_KEY", "rps": 10, "burst": 20, "name": "Instantly (outreach)", "docs": "https://developer.instantly.ai/"},
+    "instantly_get_campaigns": {"env_var": "INSTANTLY_API_KEY", "rps": 10, "burst": 20, "name": "Instantly (outreach)", "docs": "https://developer.instantly.ai/"},
+    "email_automation": {"env_var": "INSTANTLY_API_KEY", "rps": 10, "burst": 20, "name": "Instantly (email)", "docs": "https://developer.instantly.ai/"},
+    "email_marketing_platform": {"env_var": "INSTANTLY_API_KEY", "rps": 10, "burst": 20, "name": "Instantly (email)", "docs": "https://developer.instantly.ai/"},
+    "heygen_create_video": {"env_var": "HEYGEN_API_KEY", "rps": 2, "burst": 5, "name": "HeyGen (video)", "docs": "https://docs.heygen.com/"},
+    "video_generation": {"env_var": "HEYGEN_API_KEY", "rps": 2, "burst": 5, "name": "HeyGen (video)", "docs": "https://docs.heygen.com/"},
+    "stripe_create_invoice": {"env_var": "STRIPE_SECRET_KEY", "rps": 25, "burst": 25, "name": "Stripe (billing)", "docs": "https://dashboard.stripe.com/apikeys"},
+    "stripe_create_invoices": {"env_var": "STRIPE_SECRET_KEY", "rps": 25, "burst": 25, "name": "Stripe (billing)", "docs": "https://dashboard.stripe.com/apikeys"},
+    "stripe_create_customer": {"env_var": "STRIPE_SECRET_KEY", "rps": 25, "burst": 25, "name": "Stripe (billing)", "docs": "https://dashboard.stripe.com/apikeys"},
+    "invoicing_software": {"env_var": "STRIPE_SECRET_KEY", "rps": 25, "burst": 25, "name": "Stripe (invoicing)", "docs": "https://dashboard.stripe.com/apikeys"},
+    "invoicing": {"env_var": "STRIPE_SECRET_KEY", "rps": 25, "burst": 25, "name": "Stripe (invoicing)", "docs": "https://dashboard.stripe.com/apikeys"},
 }
 
 from tools.stubs import (
@@ -65,6 +70,7 @@ IMPLEMENTATIONS: Dict[str, Callable[..., Any]] = {
     "video_generation": heygen_create_video,
     # Stripe (billing)
     "stripe_create_invoice": stripe_create_invoice,
+    "stripe_create_invoices": stripe_create_invoices,
     "stripe_create_customer": stripe_create_customer,
     "invoicing_software": stripe_create_invoice,
     "invoicing": stripe_create_invoice,
@@ -87,7 +93,8 @@ IMPLEMENTATIONS: Dict[str, Callable[..., Any]] = {
 }
 
 # Map normalized design tool string -> registry key (so each agent's declared tool gets an implementation)
-# Order matters: more specific first. We normalize design tools and then match by substring or exact.
+# Patterns match whole "_"-separated tokens (see DesignToolMatcher for the precedence rules); a pattern bound
+# to "stub_generic" pins look-alike tools to the generic stub (e.g. social_media_scheduling is not a calendar).
 DESIGN_TO_REGISTRY: List[tuple[str, str]] = [
     ("instantly", "instantly_send_campaign"),
     ("email_marketing", "email_marketing_platform"),
@@ -101,12 +108,16 @@ DESIGN_TO_REGISTRY: List[tuple[str, str]] = [
     ("invoicing", "invoicing_software"),
     ("accounting", "accounting"),
     ("payroll", "payroll"),
+    ("ats_crm_search", "ats_crm_search"),
     ("ats_crm", "ats_crm"),
+    ("ats", "ats_crm"),
+    ("applicant_tracking_system", "ats_crm"),
     ("ats_keyword", "ats_crm_search"),
     ("ats_screening", "ats_crm_search"),
     ("calendar", "calendar_scheduling"),
     ("scheduling", "calendar_scheduling"),
     ("calendly", "calendar_scheduling"),
+    ("social_media", "stub_generic"),
     ("document_generation", "document_generation"),
     ("document_management", "document_storage"),
     ("dms", "document_storage"),
@@ -128,6 +139,64 @@ DESIGN_TO_REGISTRY: List[tuple[str, str]] = [
 ]
 
 
+def _match_tokens(normalized: str) -> tuple[str, ...]:
+    """Split a normalized tool into tokens; plural "s" is dropped from longer words (boards/board, apis/api)."""
+    return tuple(t[:-1] if len(t) > 3 and t.endswith("s") and not t.endswith("ss") else t for t in normalized.split("_") if t)
+
+
+class DesignToolMatcher:
+    """
+    Token-trie matcher over (pattern, registry_key) pairs. Precedence, highest first:
+      1. the normalized tool is itself a registry key (e.g. instantly_add_leads)
+      2. a pattern occurring in the tool as a contiguous run of whole tokens: most tokens wins, then table order
+      3. reverse match: the tool (at least REVERSE_MIN_TOKENS tokens) is a contiguous token run inside a pattern
+    Single-token tools never reverse-match, so "crm" cannot land on "ats_crm". Cost depends on the tool's
+    token count and the trie depth, not on the number of patterns.
+    """
+
+    REVERSE_MIN_TOKENS = 2
+
+    def __init__(self, table: List[tuple[str, str]], registry_keys: Iterable[str] = ()) -> None:
+        self.registry_keys = frozenset(registry_keys)
+        self._trie: Dict[str, Any] = {}
+        self._reverse: Dict[tuple[str, ...], str] = {}
+        for rank, (pattern, reg_key) in enumerate(table):
+            toks = _match_tokens(pattern)
+            if not toks:
+                continue
+            node = self._trie
+            for t in toks:
+                node = node.setdefault(t, {})
+            # Terminal: (-token count, rank) sorts best first; earlier entries keep the slot
+            node.setdefault(None, (-len(toks), rank, reg_key))
+            for i in range(len(toks)):
+                for j in range(i + self.REVERSE_MIN_TOKENS, len(toks) + 1):
+                    self._reverse.setdefault(toks[i:j], reg_key)
+
+    def match(self, normalized: str) -> str | None:
+        if normalized in self.registry_keys:
+            return normalized
+        toks = _match_tokens(normalized)
+        best = None
+        for i in range(len(toks)):
+            node = self._trie
+            for t in toks[i:]:
+                node = node.get(t)
+                if node is None:
+                    break
+                hit = node.get(None)
+                if hit is not None and (best is None or hit < best):
+                    best = hit
+        if best is not None:
+            return best[2]
+        if len(toks) >= self.REVERSE_MIN_TOKENS:
+            return self._reverse.get(toks)
+        return None
+
+
+_MATCHER = DesignToolMatcher(DESIGN_TO_REGISTRY, IMPLEMENTATIONS)
+
+
 def normalize_design_tool(raw: str) -> str:
     """Turn a design tool string into a key: lowercase, replace / and spaces with underscore, drop parentheticals."""
     s = (raw or "").strip().lower()
@@ -138,64 +207,170 @@ def normalize_design_tool(raw: str) -> str:
 
 
 def design_tool_to_registry_key(normalized: str) -> str:
-    """Resolve a normalized design tool to a registry key (implementation)."""
-    for pattern, reg_key in DESIGN_TO_REGISTRY:
-        if pattern in normalized or normalized in pattern:
-            return reg_key
-    if normalized in IMPLEMENTATIONS:
-        return normalized
-    return "stub_generic"
+    """Resolve a normalized design tool to a registry key (implementation), or "stub_generic"."""
+    return _MATCHER.match(normalized) or "stub_generic"
 
 
 def get_implementation(registry_key: str) -> Callable[..., Any] | None:
     return IMPLEMENTATIONS.get(registry_key)
 
 
-def _load_design(path: Path | None = None) -> Dict[str, Any]:
-    if path is None:
-        path = Path(__file__).resolve().parent.parent / "output" / "system_design.json"
-    if not path.exists():
-        return {}
+TOOL_CORPUS_PATH = Path(__file__).resolve().parent / "design_tool_corpus.json"
+
+
+def check_tool_corpus(path: Path = TOOL_CORPUS_PATH) -> List[tuple[str, str, str]]:
+    """Resolve every design tool string in the corpus; return (tool, expected, actual) for each mismatch."""
+    corpus = json.loads(path.read_text(encoding="utf-8"))
+    out = []
+    for raw, expected in corpus.get("cases", {}).items():
+        actual = design_tool_to_registry_key(normalize_design_tool(raw))
+        if actual != expected:
+            out.append((raw, expected, actual))
+    return out
+
+
+DEFAULT_DESIGN_PATH = Path(__file__).resolve().parent.parent / "output" / "system_design.json"
+
+
+class _DesignCacheEntry(NamedTuple):
+    stamp: Tuple[int, int]  # (mtime_ns, size) of the file when parsed
+    design: Dict[str, Any]
+    agents_by_id: Dict[str, Dict[str, Any]]
+    bindings: Mapping[str, Mapping[str, Callable[..., Any]]]  # agent_id -> read-only tool table
+    configs: Mapping[str, Mapping[str, Any]]  # agent_id -> read-only design entry
+
+
+# Process-wide parsed designs, one per path; re-parsed only when the file's mtime/size changes
+_DESIGN_CACHE: Dict[Path, _DesignCacheEntry] = {}
+_DESIGN_LOCK = threading.Lock()
+_NO_TOOLS: Mapping[str, Callable[..., Any]] = MappingProxyType({})
+_NO_CONFIG: Mapping[str, Any] = MappingProxyType({})
+_EMPTY_ENTRY = _DesignCacheEntry((0, 0), {}, {}, MappingProxyType({}), MappingProxyType({}))
+
+
+def _design_entry(path: Path | None = None) -> _DesignCacheEntry:
+    path = Path(path) if path else DEFAULT_DESIGN_PATH
     try:
-        return json.loads(path.read_text(encoding="utf-8"))
-    except Exception:
-        return {}
+        st = path.stat()
+    except OSError:
+        return _EMPTY_ENTRY
+    stamp = (st.st_mtime_ns, st.st_size)
+    entry = _DESIGN_CACHE.get(path)
+    if entry is not None and entry.stamp == stamp:
+        return entry
+    with _DESIGN_LOCK:
+        entry = _DESIGN_CACHE.get(path)
+        if entry is not None and entry.stamp == stamp:
+            return entry
+        try:
+            design = json.loads(path.read_text(encoding="utf-8"))
+        except Exception:
+            design = {}
+        if not isinstance(design, dict):
+            design = {}
+        agents_by_id = {}
+        for a in design.get("agents", []):
+            if isinstance(a, dict) and a.get("id") and a["id"] not in agents_by_id:
+                agents_by_id[a["id"]] = a
+        bindings = MappingProxyType({
+            aid: MappingProxyType(_resolve_tools(a.get("tools") or []))
+            for aid, a in agents_by_id.items()
+        })
+        configs = MappingProxyType({aid: MappingProxyType(a) for aid, a in agents_by_id.items()})
+        entry = _DesignCacheEntry(stamp, design, agents_by_id, bindings, configs)
+        _DESIGN_CACHE[path] = entry
+        return entry
+
+
+def reload_design(path: Path | None = None) -> None:
+    """Drop the cached design (one path, or all) so the next lookup re-reads it from disk."""
+    with _DESIGN_LOCK:
+        if path is None:
+            _DESIGN_CACHE.clear()
+        else:
+            _DESIGN_CACHE.pop(Path(path), None)
+
+
+def _load_design(path: Path | None = None) -> Dict[str, Any]:
+    """Parsed system_design.json (cached; treat as read-only)."""
+    return _design_entry(path).design
+
+
+def _agent_entry(agent_id: str, path: Path | None = None) -> Dict[str, Any] | None:
+    return _design_entry(path).agents_by_id.get(agent_id)
 
 
 def get_agent_tool_names(agent_id: str, design_path: Path | None = None) -> List[str]:
     """Return the raw list of tool names (from system_design.json) for the given agent."""
-    design = _load_design(design_path)
-    for a in design.get("agents", []):
-        if a.get("id") == agent_id:
-            return list(a.get("tools", []))
-    return []
+    agent = _agent_entry(agent_id, design_path)
+    return list(agent.get("tools", [])) if agent else []
+
+
+def _implementation_aliases() -> Dict[Callable[..., Any], List[str]]:
+    """callable -> implementation names bound to it (IMPLEMENTATION_NAMES order)."""
+    aliases: Dict[Callable[..., Any], List[str]] = {}
+    for impl_name in IMPLEMENTATION_NAMES:
+        fn = get_implementation(impl_name)
+        if fn:
+            aliases.setdefault(fn, []).append(impl_name)
+    return aliases
 
 
-def get_tools_for_agent(agent_id: str, design_path: Path | None = None) -> Dict[str, Callable[..., Any]]:
+def _resolve_tools(tool_names: List[str]) -> Dict[str, Callable[..., Any]]:
     """
-    Return tool_name -> callable for this agent based on system_design.json.
-    Every agent gets the tools it declares; each maps to a real implementation or stub.
+    Resolve design tool names to callables, in design order: the first tool mapping to a registry key wins,
+    then the implementation names of that callable are added (e.g. instantly_add_leads) unless already taken.
     """
-    tool_names = get_agent_tool_names(agent_id, design_path)
+    aliases = _implementation_aliases()
     out: Dict[str, Callable[..., Any]] = {}
     seen_registry: set = set()
     for raw in tool_names:
         norm = normalize_design_tool(raw)
         reg_key = design_tool_to_registry_key(norm)
-        if reg_key not in seen_registry:
-            fn = get_implementation(reg_key)
-            if not fn and reg_key == "stub_generic":
-                fn = lambda *a, _n=norm, **k: stub_generic(tool_name=_n, *a, **k)
-            if fn:
-                seen_registry.add(reg_key)
-                out[norm] = fn
-                # Agents can also call by implementation name (e.g. instantly_add_leads)
-                for impl_name in IMPLEMENTATION_NAMES:
-                    if get_implementation(impl_name) is fn and impl_name not in out:
-                        out[impl_name] = fn
+        if reg_key in seen_registry:
+            continue
+        fn = get_implementation(reg_key)
+        if not fn and reg_key == "stub_generic":
+            fn = functools.partial(stub_generic, tool_name=norm)
+        if not fn:
+            continue
+        seen_registry.add(reg_key)
+        out[norm] = fn
+        # Agents can also call by implementation name (e.g. instantly_add_leads)
+        for impl_name in aliases.get(fn, ()):
+            out.setdefault(impl_name, fn)
     return out
 
 
+def get_tools_for_agent(agent_id: str, design_path: Path | None = None) -> Mapping[str, Callable[..., Any]]:
+    """
+    Return tool_name -> callable for this agent based on system_design.json.
+    Every agent gets the tools it declares; each maps to a real implementation or stub.
+    The table is resolved once per design version and returned as a read-only view.
+    """
+    return _design_entry(design_path).bindings.get(agent_id, _NO_TOOLS)
+
+
+def get_agent_config(agent_id: str, design_path: Path | None = None) -> Mapping[str, Any]:
+    """This agent's entry in system_design.json as a read-only view; re-read when the design file changes."""
+    return _design_entry(design_path).configs.get(agent_id, _NO_CONFIG)
+
+
+def _callable_name(fn: Callable[..., Any]) -> str:
+    if isinstance(fn, functools.partial):
+        args = ", ".join(f"{k}={v!r}" for k, v in fn.keywords.items())
+        return f"{_callable_name(fn.func)}({args})"
+    return f"{getattr(fn, '__module__', '?')}.{getattr(fn, '__qualname__', repr(fn))}"
+
+
+def dump_bindings(design_path: Path | None = None) -> Dict[str, Dict[str, str]]:
+    """Resolved table for auditing: agent_id -> {tool name -> implementation} (design order)."""
+    return {
+        aid: {name: _callable_name(fn) for name, fn in tools.items()}
+        for aid, tools in _design_entry(design_path).bindings.items()
+    }
+
+
 def list_bindings(design_path: Path | None = None) -> Dict[str, List[str]]:
     """Return agent_id -> list of (normalized) tool names from the design."""
     design = _load_design(design_path)
@@ -234,12 +409,8 @@ def required_integrations_for_agent(agent_id: str, design_path: Path | None = No
     For one agent, list each tool it needs and whether you must add a real integration.
     status: "configured" = API key set; "needs_key" = real API but key missing; "stub" = no API bound, add integration.
     """
-    design = _load_design(design_path)
-    agent_name = ""
-    for a in design.get("agents", []):
-        if a.get("id") == agent_id:
-            agent_name = a.get("name", agent_id)
-            break
+    agent = _agent_entry(agent_id, design_path)
+    agent_name = agent.get("name", agent_id) if agent else ""
     tool_names = get_agent_tool_names(agent_id, design_path)
     seen_registry: set = set()
     out: List[IntegrationRequirement] = []
@@ -0,0 +1,173 @@
+"""
+Local Stripe customer index so the billing path resolves customers without creating duplicates.
+SQLite at data/stripe_customers.sqlite (next to the Chainlit checkpoint DB), mirrored in memory for O(1) lookups.
+Keys are the normalized email ("email:jane@acme.com") and selected metadata fields ("meta:client_id=42").
+Entries expire after STRIPE_CUSTOMER_CACHE_TTL seconds; warm_customer_cache() pages through Customer.list once
+per TTL so customers created outside this app are found too. Billing calls never wait on that scan: they start it
+in the background (start_cache_warm) and resolve a miss with a single filtered Customer.list(email=...).
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List
+
+ROOT = Path(__file__).resolve().parent.parent
+CACHE_PATH = Path(os.environ.get("STRIPE_CUSTOMER_CACHE_PATH", str(ROOT / "data" / "stripe_customers.sqlite")))
+TTL_SECONDS = float(os.environ.get("STRIPE_CUSTOMER_CACHE_TTL", str(7 * 24 * 3600)))
+# Metadata fields that identify a customer as strongly as the email does
+LOOKUP_METADATA_KEYS = ("client_id", "external_id")
+LIST_PAGE_SIZE = 100
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS customers (key TEXT PRIMARY KEY, customer_id TEXT NOT NULL, fetched_at REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS cache_meta (name TEXT PRIMARY KEY, value REAL NOT NULL);
+"""
+
+
+def lookup_keys(email: str | None, metadata: Dict[str, Any] | None = None) -> List[str]:
+    """Index keys for a customer: metadata identifiers first (most specific), then the email."""
+    keys = [f"meta:{k}={metadata[k]}" for k in LOOKUP_METADATA_KEYS if metadata and metadata.get(k)]
+    email = (email or "").strip().lower()
+    if email:
+        keys.append(f"email:{email}")
+    return keys
+
+
+class CustomerIndex:
+    """Thread-safe key -> (customer_id, fetched_at) map persisted to SQLite."""
+
+    def __init__(self, path: Path = CACHE_PATH, ttl: float = TTL_SECONDS) -> None:
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+        self._entries: Dict[str, tuple[str, float]] = {}
+        self._warmed_at = 0.0
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._conn.executescript(_SCHEMA)
+            self._entries = {k: (cid, at) for k, cid, at in self._conn.execute("SELECT key, customer_id, fetched_at FROM customers")}
+            row = self._conn.execute("SELECT value FROM cache_meta WHERE name = 'warmed_at'").fetchone()
+            self._warmed_at = row[0] if row else 0.0
+        return self._conn
+
+    def get(self, keys: Iterable[str]) -> str | None:
+        now = time.time()
+        with self._lock:
+            self._db()
+            for key in keys:
+                hit = self._entries.get(key)
+                if hit and now - hit[1] < self.ttl:
+                    return hit[0]
+        return None
+
+    def put(self, keys: Iterable[str], customer_id: str, fetched_at: float | None = None) -> None:
+        self.put_many([(key, customer_id) for key in keys], fetched_at)
+
+    def put_many(self, pairs: List[tuple[str, str]], fetched_at: float | None = None, overwrite: bool = True) -> None:
+        at = fetched_at or time.time()
+        verb = "INSERT OR REPLACE" if overwrite else "INSERT OR IGNORE"
+        with self._lock:
+            db = self._db()
+            with db:
+                db.executemany(f"{verb} INTO customers (key, customer_id, fetched_at) VALUES (?, ?, ?)", [(k, cid, at) for k, cid in pairs])
+            for key, cid in pairs:
+                if overwrite or key not in self._entries:
+                    self._entries[key] = (cid, at)
+
+    def warm_needed(self) -> bool:
+        with self._lock:
+            self._db()
+            return time.time() - self._warmed_at >= self.ttl
+
+    def mark_warmed(self) -> None:
+        with self._lock:
+            db = self._db()
+            self._warmed_at = time.time()
+            with db:
+                db.execute("INSERT OR REPLACE INTO cache_meta (name, value) VALUES ('warmed_at', ?)", (self._warmed_at,))
+
+    def clear(self) -> None:
+        with self._lock:
+            db = self._db()
+            with db:
+                db.execute("DELETE FROM customers")
+                db.execute("DELETE FROM cache_meta")
+            self._entries.clear()
+            self._warmed_at = 0.0
+
+
+_INDEX: CustomerIndex | None = None
+_INDEX_LOCK = threading.Lock()
+_WARM_LOCK = threading.Lock()
+_WARM_START_LOCK = threading.Lock()
+_WARM_THREAD: threading.Thread | None = None
+
+
+def customer_index() -> CustomerIndex:
+    global _INDEX
+    with _INDEX_LOCK:
+        if _INDEX is None:
+            _INDEX = CustomerIndex()
+        return _INDEX
+
+
+def warm_customer_cache(list_page: Callable[..., Any], force: bool = False) -> int:
+    """
+    Page through every existing Stripe customer (list_page(limit=, starting_after=) -> Customer.list result) and
+    index them; runs at most once per TTL unless force. Stripe lists newest first, so when several customers share
+    an email the newest one is kept. Returns the number of customers indexed (0 if skipped).
+    """
+    index = customer_index()
+    with _WARM_LOCK:
+        if not force and not index.warm_needed():
+            return 0
+        pairs: List[tuple[str, str]] = []
+        seen: set = set()
+        count = 0
+        starting_after = None
+        while True:
+            params = {"limit": LIST_PAGE_SIZE}
+            if starting_after:
+                params["starting_after"] = starting_after
+            page = list_page(**params)
+            data = list(getattr(page, "data", None) or [])
+            for c in data:
+                count += 1
+                for key in lookup_keys(getattr(c, "email", None), dict(getattr(c, "metadata", None) or {})):
+                    if key not in seen:
+                        seen.add(key)
+                        pairs.append((key, c.id))
+            if not data or not getattr(page, "has_more", False):
+                break
+            starting_after = data[-1].id
+        index.put_many(pairs)
+        index.mark_warmed()
+        return count
+
+
+def start_cache_warm(list_page: Callable[..., Any]) -> bool:
+    """Run warm_customer_cache in a daemon thread if the index is due for a refresh; returns True if started."""
+    global _WARM_THREAD
+    index = customer_index()
+    with _WARM_START_LOCK:
+        if (_WARM_THREAD is not None and _WARM_THREAD.is_alive()) or not index.warm_needed():
+            return False
+
+        def run() -> None:
+            try:
+                warm_customer_cache(list_page)
+            except Exception:
+                logger.exception("Stripe customer cache warm-up failed")
+
+        _WARM_THREAD = threading.Thread(target=run, name="stripe-customer-warm", daemon=True)
+        _WARM_THREAD.start()
+        return True
@@ -1,8 +1,13 @@
 """
 Stripe API (billing, invoices, customers). Use for invoice and financing agents.
 """
+import hashlib
+import json
 import os
-from typing import Any, Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+from tools import http_pool, rate_limit, stripe_customers
 
 try:
     import stripe
@@ -10,8 +15,21 @@ except ImportError:
     stripe = None
 
 _API_KEY = os.environ.get("STRIPE_SECRET_KEY", "").strip()
+# Stripe calls in flight at once for batch invoicing (the STRIPE_SECRET_KEY token bucket still applies)
+INVOICE_CONCURRENCY = int(os.environ.get("STRIPE_INVOICE_CONCURRENCY", "8"))
 if _API_KEY and stripe:
     stripe.api_key = _API_KEY
+    # Route the SDK through the shared keep-alive pool for api.stripe.com
+    if http_pool.available() and hasattr(stripe, "RequestsClient"):
+        stripe.default_http_client = stripe.RequestsClient(
+            timeout=http_pool.READ_TIMEOUT,
+            session=http_pool.session_for("https://api.stripe.com"),
+        )
+
+
+def _call(fn, *args: Any, **kwargs: Any) -> Any:
+    """Stripe SDK call under the shared rate limit / retry policy (writes carry an idempotency_key)."""
+    return rate_limit.call_limited("STRIPE_SECRET_KEY", fn, *args, **kwargs)
 
 
 def stripe_create_customer(
@@ -19,14 +37,184 @@ def stripe_create_customer(
     name: str | None = None,
     metadata: Dict[str, str] | None = None,
 ) -> Dict[str, Any]:
-    """Create a Stripe customer. Returns { ok, customer_id?, error? }."""
+    """
+    Return the Stripe customer for this email (or client_id/external_id metadata), creating it only if none exists.
+    Resolved from the local customer index first; on a miss one Customer.list(email=...) call checks Stripe while
+    the full index refresh (once per TTL) runs in the background. Returns { ok, customer_id?, cached?, error? }.
+    """
     if not _API_KEY or not stripe:
         return {"ok": False, "error": "STRIPE_SECRET_KEY not set or stripe not installed", "stub": True}
+    keys = stripe_customers.lookup_keys(email, metadata)
+    index = stripe_customers.customer_index()
+    try:
+        customer_id = index.get(keys)
+        if customer_id:
+            return {"ok": True, "customer_id": customer_id, "cached": True}
+        stripe_customers.start_cache_warm(lambda **params: _call(stripe.Customer.list, **params))
+    except Exception:
+        pass  # Cache or warm-up trouble must not block billing; fall through to lookup / create
+    if email and email.strip():
+        try:
+            # Newest first, like the warm-up, so both pick the same customer for a shared email
+            found = _call(stripe.Customer.list, email=email.strip(), limit=1)
+            existing = list(getattr(found, "data", None) or [])
+        except Exception:
+            existing = []
+        if existing:
+            try:
+                index.put(keys, existing[0].id)
+            except Exception:
+                pass
+            return {"ok": True, "customer_id": existing[0].id, "cached": False}
+    # Same customer details -> same key, so concurrent runs cannot create twice
+    fingerprint = json.dumps([keys, name or "", metadata or {}], sort_keys=True, default=str)
+    key = "customer:" + hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()[:32]
     try:
-        c = stripe.Customer.create(email=email, name=name or "", metadata=metadata or {})
-        return {"ok": True, "customer_id": c.id}
+        c = _call(stripe.Customer.create, email=email, name=name or "", metadata=metadata or {}, idempotency_key=key)
     except Exception as e:
         return {"ok": False, "error": str(e)}
+    try:
+        index.put(keys, c.id)
+    except Exception:
+        pass
+    return {"ok": True, "customer_id": c.id, "cached": False}
+
+
+def _safe(fn, *args: Any, **kwargs: Any) -> tuple[Any, str | None]:
+    try:
+        return fn(*args, **kwargs), None
+    except Exception as e:
+        return None, str(e)
+
+
+def _amount_pence(value: Any) -> int | None:
+    """Integer amount in the smallest unit, or None if value is not a whole number."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, float):
+        return int(value) if value.is_integer() else None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _invoice_spec_error(spec: Any) -> str | None:
+    """Why an invoice spec cannot be sent (checked before any Stripe call), or None if it is valid."""
+    if not isinstance(spec, dict):
+        return "invoice spec must be an object"
+    if not spec.get("customer_id"):
+        return "customer_id is required"
+    items = spec.get("items")
+    if not isinstance(items, list) or not items:
+        return "items must be a non-empty list"
+    for n, item in enumerate(items):
+        if not isinstance(item, dict) or _amount_pence(item.get("amount_pence")) is None:
+            return f"items[{n}].amount_pence must be a whole number"
+    return None
+
+
+def stripe_create_invoices(
+    invoices: List[Dict[str, Any]],
+    concurrency: int | None = None,
+) -> Dict[str, Any]:
+    """
+    Create and finalize many invoices. Each spec: { customer_id, items: [{ amount_pence, description?, currency? }],
+    currency? ("gbp"), days_until_due? (30), description?, metadata?, idempotency_key? }.
+    Three parallel phases (draft invoices, line items, finalize) with up to `concurrency` Stripe calls in
+    flight; line items run sequentially per customer (Stripe locks each customer, so parallel items for one
+    customer only produce lock-timeout 429s) and in parallel across customers. Malformed specs fail at
+    stage "validate" before any call. The finalize response supplies the hosted URL, so nothing is re-retrieved.
+    Every write has an idempotency key derived from the spec's idempotency_key (e.g. a placement + pay period), so re-running a
+    batch after a partial failure does not duplicate invoices.
+    Returns { ok, summary: {requested, finalized, failed}, results: [{ ok, invoice_id?, url?, amount_due?, error?, stage? }] }.
+    """
+    if not _API_KEY or not stripe:
+        return {"ok": False, "error": "STRIPE_SECRET_KEY not set or stripe not installed", "stub": True}
+    specs = list(invoices or [])
+    results: List[Dict[str, Any]] = [{"ok": False} for _ in specs]
+    keys = [
+        str((spec.get("idempotency_key") if isinstance(spec, dict) else None) or rate_limit.idempotency_key())
+        for spec in specs
+    ]
+    workers = max(1, concurrency or INVOICE_CONCURRENCY)
+    drafts: List[Any] = [None] * len(specs)
+
+    def create_draft(i: int):
+        spec = specs[i]
+        params = {"customer": spec["customer_id"], "collection_method": "send_invoice", "days_until_due": spec.get("days_until_due", 30)}
+        if spec.get("description"):
+            params["description"] = spec["description"]
+        if spec.get("metadata"):
+            params["metadata"] = spec["metadata"]
+        return _safe(_call, stripe.Invoice.create, idempotency_key=f"{keys[i]}:invoice", **params)
+
+    def create_items(group: List[int]) -> List[tuple[int, str | None]]:
+        """Line items for one customer's invoices, one call at a time (Stripe locks writes per customer)."""
+        errors = []
+        for i in group:
+            spec = specs[i]
+            err = None
+            for n, item in enumerate(spec["items"]):
+                _, err = _safe(
+                    _call, stripe.InvoiceItem.create,
+                    customer=spec["customer_id"],
+                    invoice=drafts[i].id,
+                    amount=_amount_pence(item["amount_pence"]),
+                    currency=item.get("currency") or spec.get("currency", "gbp"),
+                    description=item.get("description") or "Recruitment fee",
+                    idempotency_key=f"{keys[i]}:item:{n}",
+                )
+                if err:
+                    break
+            errors.append((i, err))
+        return errors
+
+    def finalize(i: int):
+        return _safe(_call, stripe.Invoice.finalize_invoice, drafts[i].id, idempotency_key=f"{keys[i]}:finalize")
+
+    def fail(i: int, stage: str, error: str | None) -> None:
+        results[i] = {"ok": False, "stage": stage, "error": error or "unknown error"}
+        if drafts[i] is not None:
+            results[i]["invoice_id"] = drafts[i].id
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="stripe-invoices") as pool:
+        valid = []
+        for i, spec in enumerate(specs):
+            error = _invoice_spec_error(spec)
+            if error:
+                fail(i, "validate", error)
+            else:
+                valid.append(i)
+        for i, (inv, err) in zip(valid, pool.map(create_draft, valid)):
+            drafts[i] = inv
+            if err:
+                fail(i, "create", err)
+        pending = [i for i in valid if drafts[i] is not None]
+
+        groups: Dict[str, List[int]] = {}
+        for i in pending:
+            groups.setdefault(specs[i]["customer_id"], []).append(i)
+        for group_errors in pool.map(create_items, groups.values()):
+            for i, err in group_errors:
+                if err:
+                    fail(i, "items", err)
+        pending = [i for i in pending if results[i].get("stage") is None]
+
+        for i, (inv, err) in zip(pending, pool.map(finalize, pending)):
+            if err:
+                fail(i, "finalize", err)
+                continue
+            results[i] = {
+                "ok": True,
+                "invoice_id": inv.id,
+                "url": getattr(inv, "hosted_invoice_url", None) or "",
+                "amount_due": getattr(inv, "amount_due", None),
+            }
+
+    finalized = sum(1 for r in results if r["ok"])
+    summary = {"requested": len(specs), "finalized": finalized, "failed": len(specs) - finalized}
+    return {"ok": finalized == len(specs), "summary": summary, "results": results}
 
 
 def stripe_create_invoice(
@@ -41,17 +229,11 @@ def stripe_create_invoice(
     """
     if not _API_KEY or not stripe:
         return {"ok": False, "error": "STRIPE_SECRET_KEY not set or stripe not installed", "stub": True}
-    try:
-        inv = stripe.Invoice.create(customer=customer_id, collection_method="send_invoice", days_until_due=30)
-        stripe.InvoiceItem.create(
-            customer=customer_id,
-            amount=amount_pence,
-            currency=currency,
-            description=description or "Recruitment fee",
-            invoice=inv.id,
-        )
-        stripe.Invoice.finalize_invoice(inv.id)
-        inv = stripe.Invoice.retrieve(inv.id)
-        return {"ok": True, "invoice_id": inv.id, "url": getattr(inv, "hosted_invoice_url", None) or ""}
-    except Exception as e:
-        return {"ok": False, "error": str(e)}
+    batch = stripe_create_invoices(
+        [{"customer_id": customer_id, "currency": currency, "items": [{"amount_pence": amount_pence, "description": description}]}],
+        concurrency=1,
+    )
+    result = batch["results"][0]
+    if not result["ok"]:
+        return {"ok": False, "error": result.get("error", "")}
+    return {"ok": True, "invoice_id": result["invoice_id"], "url": result["url"]}
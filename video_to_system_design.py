@@ -2,23 +2,67 @@
 Step 1: Watch a folder of MP4 course videos, send to Gemini, get System Design JSON.
 Output: output/system_design.json (agents, tools, human_nodes, edges).
 """
+import argparse
+import hashlib
 import json
+import os
+import random
 import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 
 from google import genai
 from google.genai import types
 
-from config import GEMINI_API_KEY, OUTPUT_DIR, SYSTEM_DESIGN_JSON
+from config import (
+    CACHE_DIR,
+    DESIGN_MERGE_REVIEW_JSON,
+    GEMINI_API_KEY,
+    OUTPUT_DIR,
+    SYSTEM_DESIGN_JSON,
+    SYSTEM_DESIGN_SCHEMA_JSON,
+)
+from design_merge import DEFAULT_SIMILARITY_THRESHOLD, load_merge_review, merge_designs, unreviewed_merges
+from json_repair import StreamingJSONScanner, loads_tolerant
+from mp4_probe import mp4_duration_seconds
 
 # Default when no CLI arg (must match run_pipeline.py or pass folder explicitly)
 DEFAULT_VIDEO_FOLDER = r"C:\Users\Hafid\Downloads\rest abu musa pt 2"
 
-# Max videos per Gemini request (limit to stay under 1M token context; ~300 tokens/sec per video)
-MAX_VIDEOS_PER_REQUEST = 2
+# Batches are planned by estimated tokens (~300 tokens/sec of video) under a per-request ceiling,
+# leaving headroom in the 1M context for the prompt and response
+TOKENS_PER_VIDEO_SECOND = 300
+MAX_TOKENS_PER_REQUEST = int(os.getenv("GEMINI_MAX_TOKENS_PER_REQUEST", "900000"))
+# Hard cap on videos per request (Gemini accepts at most 10 videos per prompt)
+MAX_VIDEOS_PER_REQUEST = int(os.getenv("GEMINI_MAX_VIDEOS_PER_REQUEST", "10"))
 MODEL = "gemini-2.5-flash"
 
+# Upload manifest: content hash -> remote Gemini file, so unchanged videos are not re-uploaded
+UPLOAD_MANIFEST_JSON = CACHE_DIR / "gemini_uploads.json"
+# Files API keeps uploads ~48h; re-upload if a cached file expires within this margin
+UPLOAD_EXPIRY_MARGIN = timedelta(minutes=30)
+_MANIFEST_LOCK = threading.RLock()
+
+# Pipelined batches: per-stage concurrency (uploads of later batches overlap waits/generation of earlier ones)
+UPLOAD_CONCURRENCY = int(os.getenv("GEMINI_UPLOAD_CONCURRENCY", "2"))
+PROCESSING_CONCURRENCY = int(os.getenv("GEMINI_PROCESSING_CONCURRENCY", "4"))
+GENERATE_CONCURRENCY = int(os.getenv("GEMINI_GENERATE_CONCURRENCY", "2"))
+
+# Per-batch parsed designs, keyed by video hashes + prompt + model (reused with --resume)
+BATCH_DESIGN_CACHE_DIR = CACHE_DIR / "batch_designs"
+
+# Processing poller: exponential backoff with jitter between sweeps, overall deadline per batch
+POLL_INITIAL_SECONDS = 2.0
+POLL_MAX_SECONDS = 30.0
+POLL_BACKOFF = 1.6
+PROCESSING_TIMEOUT_SECONDS = float(os.getenv("GEMINI_PROCESSING_TIMEOUT", "1800"))
+# Sweep via a paged files.list call when at least this many files are pending (else per-file get)
+POLL_LIST_THRESHOLD = 3
+POLL_LIST_PAGE_SIZE = 100
+
 SYSTEM_DESIGN_PROMPT = """You are analyzing a business course delivered as video(s). Your job is to produce a single System Design as valid JSON.
 
 Identify every task the course teaches (e.g. outreach, content creation, booking meetings, follow-ups, reporting). For each task that can be automated, define an AGENT. For each task that is best done by a human (e.g. live client meetings, negotiations, in-person events), define a HUMAN NODE. Be exhaustive: the goal is to automate as much as possible and clearly list what the human must do.
@@ -60,6 +104,19 @@ Rules:
 - Edges define flow: start -> agents -> human_nodes -> agents as needed."""
 
 
+# Follow-up asked only for what could not be recovered from a truncated/malformed response
+REPAIR_PROMPT = """Your previous answer was cut off or malformed. Parts already received:
+{received}
+
+Output ONLY valid JSON (no markdown) with exactly these keys: {sections}.
+For each key, include only the items that are NOT already listed above, using the same structure as the original instructions.
+Keep ids consistent with the ones already received."""
+MAX_REPAIR_PROMPTS = 2
+
+# Identity of items per design section (used to merge follow-up answers without duplicates)
+_SECTION_KEYS = {"agents": ("id",), "human_nodes": ("id",), "edges": ("from", "to")}
+
+
 def get_mp4_paths(folder: str) -> list[Path]:
     folder_path = Path(folder)
     if not folder_path.is_dir():
@@ -67,59 +124,464 @@ def get_mp4_paths(folder: str) -> list[Path]:
     return sorted(folder_path.glob("*.mp4"))
 
 
-def upload_videos(client: genai.Client, paths: list[Path]) -> list:
-    """Upload videos via Files API; return list of file references for generate_content."""
+def estimate_video_tokens(path: Path) -> int:
+    """Estimated Gemini tokens for one video from its header duration; unreadable files count as a full request."""
+    seconds = mp4_duration_seconds(path)
+    if seconds is None:
+        return MAX_TOKENS_PER_REQUEST
+    return int(seconds * TOKENS_PER_VIDEO_SECOND) + 1
+
+
+def plan_batches(
+    paths: list[Path],
+    token_budget: int = MAX_TOKENS_PER_REQUEST,
+    max_videos: int = MAX_VIDEOS_PER_REQUEST,
+) -> list[list[Path]]:
+    """
+    Bin-pack videos into as few requests as possible (first-fit decreasing by estimated tokens)
+    without exceeding token_budget or max_videos per request. A video over budget gets a request of its own.
+    Videos inside a batch, and batches themselves, stay in course (file) order.
+    """
+    order = {p: i for i, p in enumerate(paths)}
+    tokens = {p: estimate_video_tokens(p) for p in paths}
+    bins: list[tuple[int, list[Path]]] = []  # (tokens used, videos)
+    for p in sorted(paths, key=lambda q: (-tokens[q], order[q])):
+        for i, (used, videos) in enumerate(bins):
+            if used + tokens[p] <= token_budget and len(videos) < max_videos:
+                videos.append(p)
+                bins[i] = (used + tokens[p], videos)
+                break
+        else:
+            if tokens[p] > token_budget:
+                print(f"  Warning: {p.name} (~{tokens[p]:,} tokens) exceeds the per-request budget; sending it alone.", flush=True)
+            bins.append((tokens[p], [p]))
+    batches = [sorted(videos, key=order.__getitem__) for _, videos in bins]
+    return sorted(batches, key=lambda b: order[b[0]])
+
+
+def file_sha256(path: Path) -> str:
+    """SHA-256 of file content, read in 1 MB chunks."""
+    h = hashlib.sha256()
+    with path.open("rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def load_upload_manifest(path: Path = UPLOAD_MANIFEST_JSON) -> dict:
+    """Load the upload manifest ({"files": {path: stat+hash}, "uploads": {sha256: remote file}})."""
+    manifest = {}
+    if path.exists():
+        try:
+            manifest = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError):
+            manifest = {}
+    manifest.setdefault("files", {})
+    manifest.setdefault("uploads", {})
+    return manifest
+
+
+def save_upload_manifest(manifest: dict, path: Path = UPLOAD_MANIFEST_JSON) -> None:
+    """Write the manifest atomically (temp file + replace) so an interrupted run can't corrupt it."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with _MANIFEST_LOCK:
+        tmp.write_text(json.dumps(manifest, indent=2, sort_keys=True), encoding="utf-8")
+        os.replace(tmp, path)
+
+
+def video_content_hash(path: Path, manifest: dict) -> str:
+    """
+    Content hash for a video; reuses the stored hash when size and mtime are unchanged.
+    The lock is held only around manifest reads/writes, so concurrent uploads hash their files in parallel.
+    """
+    st = path.stat()
+    key = str(path.resolve())
+    with _MANIFEST_LOCK:
+        entry = manifest["files"].get(key)
+        if entry and entry.get("size") == st.st_size and entry.get("mtime_ns") == st.st_mtime_ns:
+            return entry["sha256"]
+    digest = file_sha256(path)
+    with _MANIFEST_LOCK:
+        manifest["files"][key] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": digest}
+    return digest
+
+
+def batch_cache_key(video_hashes: list[str], prompt: str = SYSTEM_DESIGN_PROMPT, model: str = MODEL) -> str:
+    """Cache key for one batch's design: changes if any video, the prompt or the model changes."""
+    h = hashlib.sha256()
+    for part in (model, prompt, *video_hashes):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def load_cached_design(key: str) -> dict | None:
+    path = BATCH_DESIGN_CACHE_DIR / f"{key}.json"
+    if not path.exists():
+        return None
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def save_cached_design(key: str, design: dict) -> None:
+    BATCH_DESIGN_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    path = BATCH_DESIGN_CACHE_DIR / f"{key}.json"
+    tmp = path.with_suffix(".json.tmp")
+    tmp.write_text(json.dumps(design, indent=2), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _remote_entry(f, source: Path) -> dict:
+    expiration = getattr(f, "expiration_time", None)
+    return {
+        "name": f.name,
+        "uri": getattr(f, "uri", None),
+        "mime_type": getattr(f, "mime_type", None),
+        "expiration_time": expiration.isoformat() if isinstance(expiration, datetime) else None,
+        "source": source.name,
+    }
+
+
+def _reuse_remote_file(client: genai.Client, entry: dict | None):
+    """Return the live remote file for a manifest entry, or None if it expired, failed or is gone."""
+    if not entry or not entry.get("name"):
+        return None
+    expiration = entry.get("expiration_time")
+    if expiration:
+        try:
+            expires_at = datetime.fromisoformat(expiration)
+        except ValueError:
+            return None
+        if expires_at.tzinfo is None:
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+        if expires_at - UPLOAD_EXPIRY_MARGIN <= datetime.now(timezone.utc):
+            return None
+    try:
+        current = client.files.get(name=entry["name"])
+    except Exception:
+        return None
+    if _file_state(current) == "FAILED":
+        return None
+    return current
+
+
+def upload_videos(client: genai.Client, paths: list[Path], manifest: dict | None = None) -> list:
+    """
+    Upload videos via Files API; return list of file references for generate_content.
+    With a manifest, videos whose content hash already has a live remote file are reused instead of uploaded.
+    """
     refs = []
     for p in paths:
+        digest = None
+        if manifest is not None:
+            try:
+                digest = video_content_hash(p, manifest)
+            except OSError as e:
+                print(f"  Skip {p.name}: {e}", flush=True)
+                continue
+            with _MANIFEST_LOCK:
+                entry = manifest["uploads"].get(digest)
+            cached = _reuse_remote_file(client, entry)
+            if cached is not None:
+                refs.append(cached)
+                print(f"  Reused: {p.name} ({cached.name})", flush=True)
+                continue
         try:
             f = client.files.upload(file=str(p))
             refs.append(f)
             print(f"  Uploaded: {p.name}", flush=True)
         except Exception as e:
             print(f"  Skip {p.name}: {e}", flush=True)
+            continue
+        if manifest is not None and digest:
+            with _MANIFEST_LOCK:
+                manifest["uploads"][digest] = _remote_entry(f, p)
+                save_upload_manifest(manifest)
     return refs
 
 
-def wait_for_processing(client: genai.Client, file_refs: list) -> None:
-    """Poll until all files are in ACTIVE state (required before generate_content)."""
-    for f in file_refs:
-        name = getattr(f, "name", None)
-        if not name:
-            continue
-        while True:
-            current = client.files.get(name=name)
-            state = getattr(current, "state", None)
-            state_str = (getattr(state, "name", None) or str(state) or "").upper()
-            if state == types.FileState.ACTIVE or state_str == "ACTIVE":
-                break
-            if state == types.FileState.FAILED or state_str == "FAILED":
+def _file_state(f) -> str:
+    """Normalized upper-case state name of a Files API file ("ACTIVE", "PROCESSING", "FAILED", ...)."""
+    state = getattr(f, "state", None)
+    if state == types.FileState.ACTIVE:
+        return "ACTIVE"
+    if state == types.FileState.FAILED:
+        return "FAILED"
+    return (getattr(state, "name", None) or str(state or "")).upper()
+
+
+def _sweep_file_states(client: genai.Client, names: set[str]) -> dict[str, object]:
+    """
+    One status sweep for all pending files: name -> current file.
+    Many pending files are read from a paged files.list call; anything not found there falls back to files.get.
+    The project also holds every cached upload, so listing stops once all pending files are seen or once
+    the pages read reach the number still missing; a sweep thus costs at most about twice the per-file gets.
+    """
+    found: dict[str, object] = {}
+    if len(names) >= POLL_LIST_THRESHOLD:
+        try:
+            for seen, f in enumerate(client.files.list(config={"page_size": POLL_LIST_PAGE_SIZE}), 1):
+                if f.name in names:
+                    found[f.name] = f
+                    if len(found) == len(names):
+                        break
+                if seen % POLL_LIST_PAGE_SIZE == 0 and seen // POLL_LIST_PAGE_SIZE >= len(names) - len(found):
+                    break
+        except Exception:
+            found = {}
+    for name in names - found.keys():
+        found[name] = client.files.get(name=name)
+    return found
+
+
+def wait_for_processing(client: genai.Client, file_refs: list, timeout: float | None = None) -> None:
+    """
+    Poll until all files are in ACTIVE state (required before generate_content).
+    All pending files are checked together each tick; files that reach ACTIVE drop out of the sweep,
+    a FAILED file raises RuntimeError, and exceeding the deadline raises TimeoutError.
+    """
+    pending = {f.name for f in file_refs if getattr(f, "name", None)}
+    deadline = time.monotonic() + (PROCESSING_TIMEOUT_SECONDS if timeout is None else timeout)
+    delay = POLL_INITIAL_SECONDS
+    while pending:
+        for name, current in _sweep_file_states(client, pending).items():
+            state = _file_state(current)
+            if state == "ACTIVE":
+                pending.discard(name)
+            elif state == "FAILED":
                 raise RuntimeError(f"File {name} processing failed (state={state})")
-            time.sleep(5)
-            print(f"  Waiting for file to be ready... ({state})", flush=True)
+        if not pending:
+            break
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"Files still processing after deadline: {sorted(pending)}")
+        # Full jitter keeps concurrent batches from polling in lockstep
+        sleep_for = min(remaining, random.uniform(delay / 2, delay))
+        print(f"  Waiting for {len(pending)} file(s) to be ready... (next check in {sleep_for:.1f}s)", flush=True)
+        time.sleep(sleep_for)
+        delay = min(delay * POLL_BACKOFF, POLL_MAX_SECONDS)
 
 
-def run_gemini(client: genai.Client, file_refs: list, prompt: str) -> str:
-    """Send video refs + prompt to Gemini; return response text. Text after files per API docs."""
-    contents = [*file_refs, prompt]
-    response = client.models.generate_content(model=MODEL, contents=contents)
-    return response.text if hasattr(response, "text") else (response.candidates[0].content.parts[0].text if response.candidates else "")
+def run_gemini(
+    client: genai.Client,
+    file_refs: list,
+    prompt: str | list[str],
+    scanner: StreamingJSONScanner | None = None,
+) -> str:
+    """
+    Stream video refs + prompt(s) to Gemini; return the full response text. Text after files per API docs.
+    If a scanner is given, each chunk is fed to it as it arrives so a cut-off response can still be parsed.
+    """
+    prompts = [prompt] if isinstance(prompt, str) else list(prompt)
+    contents = [*file_refs, *prompts]
+    parts = []
+    for chunk in client.models.generate_content_stream(model=MODEL, contents=contents):
+        text = getattr(chunk, "text", None) or ""
+        parts.append(text)
+        if scanner is not None:
+            scanner.feed(text)
+    return "".join(parts)
 
 
 def extract_json(text: str) -> dict:
-    """Strip markdown code block if present and parse JSON."""
-    s = text.strip()
-    if s.startswith("```"):
-        lines = s.split("\n")
-        if lines[0].startswith("```"):
-            lines = lines[1:]
-        if lines and lines[-1].strip() == "```":
-            lines = lines[:-1]
-        s = "\n".join(lines)
-    return json.loads(s)
+    """Parse JSON from a model response, tolerating fences, stray prose, trailing commas and truncation."""
+    return loads_tolerant(text).value
+
+
+def load_design_schema(path: Path = SYSTEM_DESIGN_SCHEMA_JSON) -> dict:
+    """The example design in system_design_schema.json; its keys and value types define the expected shape."""
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError):
+        return {"course_summary": "", "agents": [{"id": ""}], "human_nodes": [{"id": ""}], "edges": [{"from": "", "to": ""}]}
+
+
+def _item_identity(section: str, item: dict) -> tuple:
+    return tuple(item.get(k) for k in _SECTION_KEYS.get(section, ("id",)))
+
+
+def validate_design(design: dict, schema: dict) -> tuple[dict, list[str]]:
+    """
+    Check a parsed design against the example schema. Drops list items without their identity keys,
+    fills missing item fields with empty values of the schema's type, and returns (design, missing_sections).
+    """
+    clean: dict = {}
+    missing: list[str] = []
+    for key, example in schema.items():
+        value = design.get(key)
+        if not isinstance(value, type(example)):
+            missing.append(key)
+            continue
+        if isinstance(example, list):
+            template = example[0] if example and isinstance(example[0], dict) else {}
+            items = []
+            for item in value:
+                if not isinstance(item, dict) or not all(item.get(k) for k in _SECTION_KEYS.get(key, ())):
+                    continue
+                for field, field_example in template.items():
+                    if field not in item:
+                        item[field] = type(field_example)()
+                items.append(item)
+            value = items
+        clean[key] = value
+    # Keep extra keys, but never a schema section of the wrong type (repair would merge into it)
+    for key, value in design.items():
+        if key not in missing:
+            clean.setdefault(key, value)
+    return clean, missing
+
+
+def _received_summary(design: dict) -> str:
+    lines = []
+    for section in _SECTION_KEYS:
+        items = design.get(section) or []
+        if items:
+            ids = [" -> ".join(str(v) for v in _item_identity(section, it)) for it in items]
+            lines.append(f"- {section}: {', '.join(ids)}")
+    return "\n".join(lines) or "- (nothing usable)"
+
+
+def _merge_sections(design: dict, extra: dict, sections: list[str]) -> None:
+    for section in sections:
+        if section not in extra:
+            continue
+        if not isinstance(extra[section], list):
+            design.setdefault(section, extra[section])
+            continue
+        current = design.setdefault(section, [])
+        seen = {_item_identity(section, it) for it in current}
+        for item in extra[section]:
+            ident = _item_identity(section, item)
+            if ident not in seen:
+                seen.add(ident)
+                current.append(item)
+
+
+def _drop_partial_item(parsed: dict) -> list[str]:
+    """For a truncated response: drop the last item of the section being written (it may be cut mid-object); return that section."""
+    if not parsed:
+        return []
+    section = list(parsed)[-1]
+    if isinstance(parsed[section], list) and parsed[section]:
+        parsed[section].pop()
+    return [section]
+
+
+def generate_design(client: genai.Client, file_refs: list, label: str = "") -> tuple[str, dict | None]:
+    """
+    Stream the design for one batch, repairing truncated or malformed JSON as it goes.
+    Sections that cannot be recovered are re-requested (up to MAX_REPAIR_PROMPTS) instead of re-running the batch.
+    Returns (raw_text, design) with design None if nothing usable could be parsed.
+    """
+    schema = load_design_schema()
+    scanner = StreamingJSONScanner()
+    raw = run_gemini(client, file_refs, SYSTEM_DESIGN_PROMPT, scanner)
+    try:
+        parsed, truncated = scanner.result()
+    except json.JSONDecodeError:
+        parsed, truncated = {}, True
+    if not isinstance(parsed, dict):
+        parsed, truncated = {}, True
+    partial = _drop_partial_item(parsed) if truncated else []
+    design, missing = validate_design(parsed, schema)
+
+    for attempt in range(MAX_REPAIR_PROMPTS):
+        todo = [k for k in schema if k in missing or k in partial]
+        if not todo:
+            break
+        print(f"[{label}] Response incomplete ({', '.join(todo)}); asking Gemini for the missing parts...", flush=True)
+        followup = REPAIR_PROMPT.format(received=_received_summary(design), sections=", ".join(todo))
+        extra_scanner = StreamingJSONScanner()
+        raw += "\n\n" + run_gemini(client, file_refs, [SYSTEM_DESIGN_PROMPT, followup], extra_scanner)
+        try:
+            extra, extra_truncated = extra_scanner.result()
+        except json.JSONDecodeError:
+            continue
+        if not isinstance(extra, dict):
+            continue
+        partial = _drop_partial_item(extra) if extra_truncated else []
+        extra, _ = validate_design(extra, {k: schema[k] for k in todo if k in extra})
+        _merge_sections(design, extra, todo)
+        design, missing = validate_design(design, schema)
+
+    if not design.get("agents"):
+        return raw, None
+    for key in missing:
+        design[key] = type(schema[key])()
+    return raw, design
+
+
+def run_batch(client: genai.Client, batch: list[Path], manifest: dict, label: str, stages: dict) -> tuple[str, dict | None] | None:
+    """
+    Upload, wait and generate for one batch, holding each stage's semaphore only while in that stage.
+    Returns (raw_text, design | None), or None if nothing was uploaded.
+    """
+    with stages["upload"]:
+        print(f"[{label}] Uploading {len(batch)} video(s)...", flush=True)
+        refs = upload_videos(client, batch, manifest)
+    if not refs:
+        print(f"[{label}] No files uploaded in this batch.", flush=True)
+        return None
+    with stages["processing"]:
+        print(f"[{label}] Waiting for videos to be processed (ACTIVE)...", flush=True)
+        wait_for_processing(client, refs)
+    with stages["generate"]:
+        print(f"[{label}] Calling Gemini...", flush=True)
+        return generate_design(client, refs, label)
+
+
+def run_batches_pipelined(client: genai.Client, batches: list[list[Path]], manifest: dict, labels: list[str] | None = None):
+    """
+    Run batches through upload -> processing -> generate concurrently; yield (batch_index, run_batch result, error) in
+    batch order. A batch that raises yields (i, None, exception) and the others keep running.
+    Per-stage limits come from UPLOAD_/PROCESSING_/GENERATE_CONCURRENCY. Stopping iteration cancels batches not yet started.
+    """
+    labels = labels or [f"batch {i + 1}/{len(batches)}" for i in range(len(batches))]
+    stages = {
+        "upload": threading.BoundedSemaphore(max(1, UPLOAD_CONCURRENCY)),
+        "processing": threading.BoundedSemaphore(max(1, PROCESSING_CONCURRENCY)),
+        "generate": threading.BoundedSemaphore(max(1, GENERATE_CONCURRENCY)),
+    }
+    workers = max(1, UPLOAD_CONCURRENCY) + max(1, PROCESSING_CONCURRENCY) + max(1, GENERATE_CONCURRENCY)
+    executor = ThreadPoolExecutor(max_workers=min(workers, len(batches)) or 1, thread_name_prefix="gemini-batch")
+    try:
+        futures = [
+            executor.submit(run_batch, client, batch, manifest, labels[i], stages)
+            for i, batch in enumerate(batches)
+        ]
+        for i, fut in enumerate(futures):
+            try:
+                yield i, fut.result(), None
+            except Exception as e:
+                yield i, None, e
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
 
 
 def main() -> None:
-    folder = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_VIDEO_FOLDER
+    parser = argparse.ArgumentParser(description="Course videos (MP4) -> Gemini -> output/system_design.json")
+    parser.add_argument("folder", nargs="?", default=DEFAULT_VIDEO_FOLDER, help="Folder containing .mp4 course videos")
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Reuse cached designs for batches that already finished (same videos, prompt and model); only run the rest",
+    )
+    parser.add_argument(
+        "--merge-threshold",
+        type=float,
+        default=DEFAULT_SIMILARITY_THRESHOLD,
+        help="Similarity (0-1) above which agents/human nodes from different batches are merged (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--check-merges",
+        action="store_true",
+        help=f"Fail (exit 5) instead of saving when batches fold agents/human nodes not approved in {DESIGN_MERGE_REVIEW_JSON.name}",
+    )
+    args = parser.parse_args()
+    folder = args.folder
     if not GEMINI_API_KEY:
         print("Set GEMINI_API_KEY in .env", file=sys.stderr)
         sys.exit(1)
@@ -129,59 +591,91 @@ def main() -> None:
         print(f"No .mp4 files in {folder}. Add videos and run again.", file=sys.stderr)
         sys.exit(2)
 
-    n_batches = (len(paths) + MAX_VIDEOS_PER_REQUEST - 1) // MAX_VIDEOS_PER_REQUEST
-    print(f"Found {len(paths)} video(s). Processing in {n_batches} batch(es) of up to {MAX_VIDEOS_PER_REQUEST} video(s) each.", flush=True)
+    batches = plan_batches(paths)
+    print(
+        f"Found {len(paths)} video(s). Processing in {len(batches)} batch(es) "
+        f"(up to ~{MAX_TOKENS_PER_REQUEST:,} tokens / {MAX_VIDEOS_PER_REQUEST} videos each).",
+        flush=True,
+    )
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
     client = genai.Client(api_key=GEMINI_API_KEY)
+    manifest = load_upload_manifest()
 
-    # Process in batches of MAX_VIDEOS_PER_REQUEST
-    all_designs = []
-    for i in range(0, len(paths), MAX_VIDEOS_PER_REQUEST):
-        batch = paths[i : i + MAX_VIDEOS_PER_REQUEST]
-        print(f"Uploading batch {i // MAX_VIDEOS_PER_REQUEST + 1} ({len(batch)} videos)...", flush=True)
-        refs = upload_videos(client, batch)
-        if not refs:
-            print("No files uploaded in this batch.", flush=True)
-            continue
-        print("Waiting for videos to be processed (ACTIVE)...", flush=True)
-        wait_for_processing(client, refs)
-        print("Calling Gemini...", flush=True)
-        raw = run_gemini(client, refs, SYSTEM_DESIGN_PROMPT)
+    # Each batch's design is cached by its video hashes + prompt + model, so a failed run can be resumed.
+    # A batch with an unreadable video is reported as failed; the other batches still run.
+    failed = []
+    keys: list[str | None] = []
+    for i, batch in enumerate(batches):
         try:
-            design = extract_json(raw)
-            all_designs.append(design)
-        except json.JSONDecodeError as e:
-            print(f"Gemini returned invalid JSON: {e}. Saving raw response.", flush=True)
-            (OUTPUT_DIR / "gemini_raw_response.txt").write_text(raw, encoding="utf-8")
-            sys.exit(3)
+            keys.append(batch_cache_key([video_content_hash(p, manifest) for p in batch]))
+        except OSError as e:
+            print(f"Batch {i + 1} skipped: cannot read {e.filename or 'a video'}: {e.strerror or e}", file=sys.stderr, flush=True)
+            keys.append(None)
+            failed.append(i + 1)
+    designs: list[dict | None] = [None] * len(batches)
+    if args.resume:
+        for i, key in enumerate(keys):
+            if key is not None:
+                designs[i] = load_cached_design(key)
+        done = sum(d is not None for d in designs)
+        print(f"Resuming: {done} of {len(batches)} batch(es) already done.", flush=True)
+    todo = [i for i in range(len(batches)) if designs[i] is None and keys[i] is not None]
+
+    # Process remaining batches (pipelined: later uploads overlap earlier waits/generation)
+    run = run_batches_pipelined(
+        client,
+        [batches[i] for i in todo],
+        manifest,
+        labels=[f"batch {i + 1}/{len(batches)}" for i in todo],
+    )
+    for j, result, error in run:
+        i = todo[j]
+        if error is not None:
+            print(f"Batch {i + 1} failed: {type(error).__name__}: {error}", file=sys.stderr, flush=True)
+            failed.append(i + 1)
+            continue
+        if result is None:
+            continue
+        raw, design = result
+        if design is None:
+            raw_path = OUTPUT_DIR / f"gemini_raw_response_{i + 1}.txt"
+            print(f"Batch {i + 1}: Gemini returned no recoverable JSON. Raw response saved to {raw_path}", flush=True)
+            raw_path.write_text(raw, encoding="utf-8")
+            failed.append(i + 1)
+            continue
+        designs[i] = design
+        save_cached_design(keys[i], design)
+    save_upload_manifest(manifest)
+    if failed:
+        print(
+            f"Batch(es) {sorted(failed)} failed; finished batches are cached. Re-run with --resume to retry only the failed ones.",
+            file=sys.stderr,
+        )
+        sys.exit(3)
+    all_designs = [d for d in designs if d is not None]
 
     if not all_designs:
         print("No videos were uploaded successfully. Check your GEMINI_API_KEY in .env (get a key at https://aistudio.google.com/apikey).", file=sys.stderr)
         sys.exit(4)
 
-    # If multiple batches, merge into one design (simple merge: take first and merge agents/human_nodes/edges)
-    if len(all_designs) == 1:
-        final = all_designs[0]
-    else:
-        final = {
-            "course_summary": all_designs[0].get("course_summary", "") + " [Merged from multiple video batches.]",
-            "agents": [],
-            "human_nodes": [],
-            "edges": [],
-        }
-        seen_agent_ids = set()
-        seen_human_ids = set()
-        for d in all_designs:
-            for a in d.get("agents", []):
-                if a.get("id") and a["id"] not in seen_agent_ids:
-                    seen_agent_ids.add(a["id"])
-                    final["agents"].append(a)
-            for h in d.get("human_nodes", []):
-                if h.get("id") and h["id"] not in seen_human_ids:
-                    seen_human_ids.add(h["id"])
-                    final["human_nodes"].append(h)
-            for e in d.get("edges", []):
-                final["edges"].append(e)
+    # Merge batches into one design: fold near-duplicate agents/human nodes, rewrite and de-duplicate edges
+    review = load_merge_review(DESIGN_MERGE_REVIEW_JSON)
+    final, aliases = merge_designs(all_designs, threshold=args.merge_threshold, keep_separate=review["keep_separate"])
+    unreviewed = unreviewed_merges(aliases, review["approved"])
+    for alias, canonical in aliases.items():
+        note = "  (UNREVIEWED)" if alias in unreviewed else ""
+        print(f"  Merged {alias} -> {canonical}{note}", flush=True)
+    if unreviewed:
+        print(
+            f"{len(unreviewed)} merge(s) not yet reviewed. Add each pair to \"approved\" or \"keep_separate\" in {DESIGN_MERGE_REVIEW_JSON}.",
+            file=sys.stderr,
+        )
+        if args.check_merges:
+            sys.exit(5)
+    print(
+        f"Design: {len(final['agents'])} agent(s), {len(final['human_nodes'])} human node(s), {len(final['edges'])} edge(s).",
+        flush=True,
+    )
 
     SYSTEM_DESIGN_JSON.write_text(json.dumps(final, indent=2), encoding="utf-8")
     print(f"Saved: {SYSTEM_DESIGN_JSON}", flush=True)